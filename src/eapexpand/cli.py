@@ -1,31 +1,185 @@
+import os
 import sys
+import json
 import argparse
 from pathlib import Path
 import yaml
 
 
+def add_transport_arguments(parser: argparse.ArgumentParser):
+    """
+    The options for the HTTP transport shared by the CDISC Library and EVS connectors
+    """
+    from .helpers.http_transport import DEFAULT_BURST, DEFAULT_POOL_SIZE, DEFAULT_RATE
+
+    parser.add_argument(
+        "--api-rate",
+        type=float,
+        help=f"Requests per second to the CDISC Library and EVS APIs (default {DEFAULT_RATE:g})",
+        default=DEFAULT_RATE,
+    )
+    parser.add_argument(
+        "--api-burst",
+        type=float,
+        help=f"Requests allowed in a burst above the rate (default {DEFAULT_BURST:g})",
+        default=DEFAULT_BURST,
+    )
+    parser.add_argument(
+        "--api-pool-size",
+        type=int,
+        help=f"Connections kept open per API host (default {DEFAULT_POOL_SIZE})",
+        default=DEFAULT_POOL_SIZE,
+    )
+
+
+def build_transport(opts: argparse.Namespace):
+    """
+    The HTTP transport configured by the options
+    """
+    from .helpers.http_transport import HTTPTransport
+
+    return HTTPTransport(
+        rate=opts.api_rate, burst=opts.api_burst, pool_maxsize=opts.api_pool_size
+    )
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "--usdm", help="Source is USDM", action="store_true", default=False
     )
     parser.add_argument("--usdm-ct", type=str, help="Path to Controlled Terms file")
+    parser.add_argument(
+        "--ct-bundle", type=str, help="Resolve the external codelists from a CT bundle"
+    )
+    parser.add_argument(
+        "--no-ct-cache",
+        help="Parse the Controlled Terms file, ignoring the CT cache",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--no-linkml-cache",
+        help="Render every LinkML class, ignoring the fragment cache",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--enrich-evs",
+        help="Fill in missing definitions and synonyms from NCI EVS",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--parallel",
+        help="Render each output in a worker process",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--workbook-workers",
+        type=int,
+        help="Render the workbook sheets in this many worker processes",
+        default=None,
+    )
     parser.add_argument("--output", type=str, help="Output directory", default="output")
     parser.add_argument("--api-metadata", type=str, help="API Metadata file")
     parser.add_argument("source", type=str, help="Source directory or file")
     parser.add_argument(
         "--prisma", help="Generate Prisma Schema", action="store_true", default=False
     )
+    parser.add_argument(
+        "--sqlite", help="Generate SQLite DDL", action="store_true", default=False
+    )
     parser.add_argument(
         "--linkml", help="Generate LinkML Schema", action="store_true", default=False
     )
+    parser.add_argument(
+        "--linkml-modules",
+        help="Generate LinkML Schema as a module per package",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--linkml-partition",
+        type=str,
+        help="YAML file mapping package names to LinkML modules",
+    )
+    parser.add_argument(
+        "--jsonschema", help="Generate JSON Schema", action="store_true", default=False
+    )
+    parser.add_argument(
+        "--pydantic", help="Generate Pydantic model", action="store_true", default=False
+    )
+    parser.add_argument(
+        "--pydantic-templates",
+        type=str,
+        help="Directory of templates overriding the gen-pydantic templates",
+    )
     parser.add_argument(
         "--shapes", help="Generate SHACL Schema", action="store_true", default=False
     )
+    parser.add_argument(
+        "--shapes-format",
+        help="RDF format for the SHACL Schema",
+        choices=["turtle", "nt"],
+        default="turtle",
+    )
+    parser.add_argument(
+        "--site", help="Generate a documentation site", action="store_true", default=False
+    )
+    parser.add_argument(
+        "--diagrams", help="Export the diagrams as SVG", action="store_true", default=False
+    )
+    parser.add_argument(
+        "--csv", help="Generate CSV exports", action="store_true", default=False
+    )
+    parser.add_argument(
+        "--tsv", help="Generate TSV exports", action="store_true", default=False
+    )
+    parser.add_argument(
+        "--diagram",
+        action="append",
+        default=[],
+        help="Render the classes on a diagram (repeatable)",
+    )
+    parser.add_argument(
+        "--package",
+        action="append",
+        default=[],
+        help="Render the classes in a package and its subpackages (repeatable)",
+    )
+    parser.add_argument(
+        "--root-class",
+        type=str,
+        help="Render the classes reachable from a class",
+    )
+    add_transport_arguments(parser)
     opts = parser.parse_args()
-    gen = dict(prisma=opts.prisma, linkml=opts.linkml, shapes=opts.shapes)
+    from .models.subset import Selection
+
+    selection = Selection(opts.diagram, opts.package, opts.root_class)
+    gen = dict(
+        prisma=opts.prisma,
+        sqlite=opts.sqlite,
+        linkml=opts.linkml,
+        linkml_modules=opts.linkml_modules,
+        jsonschema=opts.jsonschema,
+        pydantic=opts.pydantic,
+        shapes=opts.shapes,
+        site=opts.site,
+        diagrams=opts.diagrams,
+        csv=opts.csv,
+        tsv=opts.tsv,
+    )
     source = opts.source
     output_dir = opts.output
+    if opts.linkml_partition:
+        assert Path(opts.linkml_partition).is_file(), "LinkML partition file not found"
+        with open(opts.linkml_partition, "r") as f:
+            linkml_partition = yaml.safe_load(f.read())
+    else:
+        linkml_partition = None
     if opts.usdm:
         if opts.usdm_ct is None:
             print("USDM Controlled Terms file is required")
@@ -50,11 +204,31 @@ def main():
             output_dir=output_dir,
             gen=gen,
             api_metadata=api_metadata,
+            ct_bundle=opts.ct_bundle,
+            ct_cache=not opts.no_ct_cache,
+            enrich_evs=opts.enrich_evs,
+            workbook_workers=opts.workbook_workers,
+            linkml_cache=not opts.no_linkml_cache,
+            linkml_partition=linkml_partition,
+            parallel=opts.parallel,
+            pydantic_templates=opts.pydantic_templates,
+            shapes_format=opts.shapes_format,
+            selection=selection,
+            transport=build_transport(opts),
         )
     else:
         from .unpkt import main
 
-        main(source, output_dir, gen)
+        main(
+            source,
+            output_dir,
+            gen,
+            linkml_partition=linkml_partition,
+            parallel=opts.parallel,
+            pydantic_templates=opts.pydantic_templates,
+            shapes_format=opts.shapes_format,
+            selection=selection,
+        )
 
 
 def load_usdm():
@@ -66,10 +240,63 @@ def load_usdm():
         "version", help="USDM version", action="store", default=None
     )
     parser.add_argument("--output", type=str, help="Output directory", default="output")
+    parser.add_argument(
+        "--ct-bundle", type=str, help="Resolve the external codelists from a CT bundle"
+    )
+    parser.add_argument(
+        "--no-ct-cache",
+        help="Parse the Controlled Terms file, ignoring the CT cache",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--no-linkml-cache",
+        help="Render every LinkML class, ignoring the fragment cache",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--enrich-evs",
+        help="Fill in missing definitions and synonyms from NCI EVS",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--parallel",
+        help="Render each output in a worker process",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--workbook-workers",
+        type=int,
+        help="Render the workbook sheets in this many worker processes",
+        default=None,
+    )
+    parser.add_argument(
+        "--diagram",
+        action="append",
+        default=[],
+        help="Render the classes on a diagram (repeatable)",
+    )
+    parser.add_argument(
+        "--package",
+        action="append",
+        default=[],
+        help="Render the classes in a package and its subpackages (repeatable)",
+    )
+    parser.add_argument(
+        "--root-class",
+        type=str,
+        help="Render the classes reachable from a class",
+    )
+    add_transport_arguments(parser)
     opts = parser.parse_args()
     assert opts.version is not None, "USDM version is required"
     source_version = opts.version
-    gen=dict(linkml=True)
+    # the Python bindings are rendered with the USDM templates, where present
+    pydantic_templates = Path.cwd() / "docs" / "pydantic_templates"
+    gen=dict(linkml=True, pydantic=pydantic_templates.is_dir())
     output_dir = opts.output
     usdm_ct = Path.cwd() / "input" / source_version / f"{source_version}_USDM_CT.xlsx"
     assert usdm_ct.is_file(), "USDM Controlled Terms file not found"
@@ -81,6 +308,7 @@ def load_usdm():
             api_metadata = yaml.safe_load(f.read())
     else:
         api_metadata = {}    
+    from .models.subset import Selection
     from .usdm_unpkt import main_usdm
     main_usdm(
         source_dir_or_file=source,
@@ -88,4 +316,139 @@ def load_usdm():
         output_dir=output_dir,
         gen=gen,
         api_metadata=api_metadata,
+        ct_bundle=opts.ct_bundle,
+        ct_cache=not opts.no_ct_cache,
+        enrich_evs=opts.enrich_evs,
+        workbook_workers=opts.workbook_workers,
+        linkml_cache=not opts.no_linkml_cache,
+        parallel=opts.parallel,
+        pydantic_templates=str(pydantic_templates) if pydantic_templates.is_dir() else None,
+        selection=Selection(opts.diagram, opts.package, opts.root_class),
+        transport=build_transport(opts),
+    )
+
+
+def ct_bundle():
+    """
+    Snapshot the external codelists referenced by a USDM CT workbook into a bundle
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("usdm_ct", type=str, help="Path to Controlled Terms file")
+    parser.add_argument(
+        "--output",
+        type=str,
+        help="Bundle file (defaults to the workbook name with a .ctbundle.json.gz suffix)",
+    )
+    add_transport_arguments(parser)
+    opts = parser.parse_args()
+    if not Path(opts.usdm_ct).is_file():
+        print("USDM Controlled Terms file not found")
+        sys.exit(1)
+    from .helpers.cdisc_connector import CDISCCTConnector
+    from .helpers.ct_bundle import build_bundle, write_bundle
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    output = opts.output or str(
+        Path(opts.usdm_ct).with_suffix("").with_suffix(".ctbundle.json.gz")
+    )
+    transport = build_transport(opts)
+    connector = CDISCCTConnector(
+        os.environ["CDISC_LIBRARY_API_TOKEN"], bulk=True, transport=transport
+    )
+    bundle = build_bundle(opts.usdm_ct, connector)
+    write_bundle(bundle, output)
+    print(f"Generated CT bundle: {output}")
+    print(f"API requests: {transport.stats.as_dict()}")
+
+
+def ct_diff():
+    """
+    Compare two releases of the USDM CT (workbooks or cached parses)
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("old", type=str, help="Previous CT workbook (or CT cache entry)")
+    parser.add_argument("new", type=str, help="Current CT workbook (or CT cache entry)")
+    parser.add_argument("--json", type=str, help="Write the changes to a JSON file")
+    opts = parser.parse_args()
+    for source in (opts.old, opts.new):
+        if not Path(source).is_file():
+            print(f"CT file not found: {source}")
+            sys.exit(1)
+    from .helpers.ct_delta import compare_ct, load_ct_parses
+
+    try:
+        delta = compare_ct(*load_ct_parses(opts.old, opts.new))
+    except ValueError as exc:
+        print(exc)
+        sys.exit(1)
+    for change in delta.changes:
+        print(change)
+    for (level, kind), count in sorted(delta.summary().items()):
+        print(f"{level} {kind}: {count}")
+    if opts.json:
+        with open(opts.json, "w") as fh:
+            json.dump(delta.as_dict(), fh, indent=2, default=str)
+
+
+
+def load_instances():
+    """
+    Load USDM JSON instances into a SQLite store with the relational mapping of the model
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("model", type=str, help="USDM model (QEA file)")
+    parser.add_argument("store", type=str, help="SQLite database to load the instances into")
+    parser.add_argument("instances", type=str, nargs="+", help="JSON instance files")
+    parser.add_argument(
+        "--root", type=str, help="Class of the root instance", default="Study"
     )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        help="Write the buffered rows in a transaction once this many are buffered",
+        default=10000,
+    )
+    opts = parser.parse_args()
+    if not Path(opts.model).is_file():
+        print("USDM file not found")
+        sys.exit(1)
+    import sqlite3
+    from .helpers.instance_loader import InstanceLoader
+    from .render.relational import relational_model
+    from .usdm_unpkt import load_usdm_document
+
+    document = load_usdm_document(opts.model, "https://cdisc.org/usdm", {})
+    connection = sqlite3.connect(opts.store)
+    try:
+        loader = InstanceLoader(
+            connection, relational_model(document), opts.root, batch_size=opts.batch_size
+        )
+        count = loader.load_files(opts.instances)
+    finally:
+        connection.close()
+    print(f"Loaded {count} documents into {opts.store}")
+
+
+def export_diagrams():
+    """
+    Export the diagrams of an EA model (QEA file) as SVG
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("source", type=str, help="EA model (QEA file)")
+    parser.add_argument("--output", type=str, help="Output directory", default="output")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Render the diagrams in this many worker processes",
+        default=None,
+    )
+    opts = parser.parse_args()
+    if not Path(opts.source).is_file():
+        print("EA model file not found")
+        sys.exit(1)
+    from .models.sqlite_loader import load_from_file
+    from .render.render_svg import generate
+
+    document = load_from_file(opts.source)
+    generate(document.name, document, output_dir=opts.output, max_workers=opts.workers)
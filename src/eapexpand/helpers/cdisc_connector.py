@@ -1,7 +1,8 @@
 from __future__ import annotations
 
 import re
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional
 
 import requests
 import logging
@@ -9,8 +10,12 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+from eapexpand.helpers.http_transport import HTTPTransport
 from eapexpand.models.usdm_ct import CodeList, PermissibleValue
 
+# the order in which the CT packages are searched for a codelist
+VOCABULARIES = ("ddfct", "sdtmct", "protocolct", "glossaryct")
+
 
 class CDISCCTConnector:
     """
@@ -19,45 +24,182 @@ class CDISCCTConnector:
 
     Attributes:
         api_key (str): The API key used for authenticating with the CDISC Library API.
-        client (requests.Session): A session object for making HTTP requests with the API key pre-configured.
+        client (HTTPTransport): The (optionally shared) transport used for the HTTP requests.
         _base_url (str): The base URL for the CDISC Library API.
         _packages (dict): A cache for storing the newest package URLs for different vocabularies.
         _cache (dict): A cache for storing retrieved codelists.
+        bulk (bool): If set, each CT package is downloaded once in full and indexed locally.
+        _index (dict): The codelists of the downloaded packages, by vocabulary and concept id.
+        _failed (set): The vocabularies whose package could not be downloaded; their codelists
+            are requested one at a time.
 
     Methods:
         get_newest_package(vocabulary="sdtmct"):
             Retrieves the newest package URL for a given vocabulary from the CDISC Library API.
 
+        load_package(vocabulary: str) -> Dict[str, CodeList]:
+            Downloads the newest package for a vocabulary and indexes its codelists by concept id.
+
+        prefetch(codelist_codes: Optional[Iterable[str]] = None, max_workers: int = 4):
+            Resolves the package versions and (in bulk mode) downloads the packages; in search
+            order until the requested codelists are found, or all of them concurrently.
+
         retrieve_valueset(codelist_code: str) -> Optional[CodeList]:
             Retrieves a codelist from the CDISC Library API and converts it into a `CodeList` object.
             If the codelist is already cached, it retrieves it from the cache.
     """
-    def __init__(self, api_key: str):
+    def __init__(
+        self,
+        api_key: str,
+        bulk: bool = False,
+        transport: Optional[HTTPTransport] = None,
+    ):
         self.api_key = api_key
-        self.client = requests.Session()
-        self.client.headers.update({"api-key": self.api_key})
+        self.client = transport if transport is not None else HTTPTransport()
+        # passed per request, the transport may be shared with other APIs
+        self._headers = {"api-key": self.api_key}
         self._base_url = "https://api.library.cdisc.org/api"
         self._packages = {}
+        self._package_links = None
         self._cache = {}
+        self.bulk = bulk
+        self._index = {}
+        self._failed = set()
 
     def get_newest_package(self, vocabulary="sdtmct"):
         """
         Get the newest package for a vocabulary
         """
         _package_re = re.compile(r"/mdr/ct/packages/([a-z\-]+)-(\d{4}-\d{2}-\d{2})")
-        packages = self.client.get(f"{self._base_url}/mdr/ct/packages")
-        if packages.status_code == 200:
-            _packages = []
-            packages = packages.json()["_links"]["packages"]
-            for package in packages:
-                vocab, date = _package_re.match(package["href"]).groups()
-                if vocab == vocabulary:
-                    _packages.append((date, package, package["href"]))
-            if not _packages:
-                raise ValueError(f"No packages found for vocabulary {vocabulary}")
-            return sorted(_packages)[-1][-1]
-        else:
-            raise ValueError(f"Failed to retrieve packages: {packages.status_code}")
+        if self._package_links is None:
+            packages = self.client.get(
+                f"{self._base_url}/mdr/ct/packages", headers=self._headers
+            )
+            if packages.status_code != 200:
+                raise ValueError(f"Failed to retrieve packages: {packages.status_code}")
+            # the package listing is the same for every vocabulary
+            self._package_links = packages.json()["_links"]["packages"]
+        _packages = []
+        for package in self._package_links:
+            vocab, date = _package_re.match(package["href"]).groups()
+            if vocab == vocabulary:
+                _packages.append((date, package["href"]))
+        if not _packages:
+            raise ValueError(f"No packages found for vocabulary {vocabulary}")
+        return sorted(_packages)[-1][-1]
+
+    def _package_id(self, vocabulary: str) -> str:
+        """
+        Get the (cached) newest package_id for a vocabulary
+        """
+        if vocabulary not in self._packages:
+            self._packages[vocabulary] = self.get_newest_package(vocabulary)
+        return self._packages[vocabulary]
+
+    @property
+    def package_versions(self) -> Dict[str, str]:
+        """
+        The package used for each vocabulary
+        """
+        return {vocabulary: self._package_id(vocabulary) for vocabulary in VOCABULARIES}
+
+    @staticmethod
+    def _to_codelist(dataset: dict, package_id: Optional[str] = None) -> CodeList:
+        """
+        Munge a codelist from the CDISC Library into a CodeList
+        """
+        codelist = CodeList(concept_c_code=dataset["conceptId"])
+        codelist.submission_value = dataset["submissionValue"]
+        codelist.preferred_term = dataset["preferredTerm"]
+        codelist.definition = dataset.get("definition")
+        codelist.extensible = dataset.get("extensible") == "true"
+        codelist.synonyms = dataset.get("synonyms", [])
+        codelist.source_package = package_id
+        for term in dataset.get("terms", []):
+            pv = PermissibleValue(
+                project="DDF",
+                entity_name="",
+                codelist_c_code=dataset["conceptId"],
+                preferred_term=term["preferredTerm"],
+                synonyms=term.get("synonyms", []),
+                definition=term.get("definition"),
+                attribute_name="",
+                concept_c_code=term["conceptId"],
+            )
+            codelist.add_item(pv)
+        return codelist
+
+    def load_package(self, vocabulary: str) -> Dict[str, CodeList]:
+        """
+        Download the newest package for a vocabulary in full and index the codelists by concept id
+        """
+        if vocabulary not in self._index:
+            package_id = self._package_id(vocabulary)
+            logger.info(f"Downloading CT package {package_id}")
+            results = self.client.get(
+                f"{self._base_url}{package_id}", headers=self._headers
+            )
+            if results.status_code != 200:
+                raise ValueError(
+                    f"Failed to retrieve package {package_id}: {results.status_code}"
+                )
+            self._index[vocabulary] = {
+                dataset["conceptId"]: self._to_codelist(dataset, package_id)
+                for dataset in results.json().get("codelists", [])
+            }
+        return self._index[vocabulary]
+
+    def prefetch(
+        self, codelist_codes: Optional[Iterable[str]] = None, max_workers: int = 4
+    ) -> None:
+        """
+        Resolve the newest packages and, in bulk mode, download them
+        :param codelist_codes: The codelists needed; the packages are downloaded in search order
+            until every codelist is found (rather than all the packages, concurrently)
+        :param max_workers: The number of concurrent downloads (without the codelists)
+        """
+        # a single listing request resolves the package for every vocabulary
+        _ = self.package_versions
+        if not self.bulk:
+            return
+        if codelist_codes is None:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                list(executor.map(self._package_index, VOCABULARIES))
+            return
+        pending = set(codelist_codes) - set(self._cache)
+        for vocabulary in VOCABULARIES:
+            if not pending:
+                break
+            pending -= (self._package_index(vocabulary) or {}).keys()
+
+    def _package_index(self, vocabulary: str) -> Optional[Dict[str, CodeList]]:
+        """
+        The codelists of the package for a vocabulary, or None if the package can't be downloaded
+        """
+        if vocabulary in self._failed:
+            return None
+        try:
+            return self.load_package(vocabulary)
+        except (ValueError, requests.RequestException) as exc:
+            logger.warning(f"{exc}, retrieving the {vocabulary} codelists one at a time")
+            self._failed.add(vocabulary)
+            return None
+
+    def _fetch_codelist(self, vocabulary: str, codelist_code: str) -> Optional[CodeList]:
+        """
+        Retrieve a single codelist from a package
+        """
+        if self.bulk:
+            index = self._package_index(vocabulary)
+            if index is not None:
+                return index.get(codelist_code)
+        package_id = self._package_id(vocabulary)
+        _url = f"{self._base_url}{package_id}/codelists/{codelist_code}"
+        # a codelist is only in one of the packages searched
+        results = self.client.get(_url, headers=self._headers, expected_statuses=(404,))
+        if results.status_code == 200:
+            return self._to_codelist(results.json(), package_id)
+        return None
 
     def retrieve_valueset(self, codelist_code: str) -> Optional[CodeList]:
         """
@@ -74,34 +216,9 @@ class CDISCCTConnector:
                 extensible=True,
             )
         else:
-            for package in ("ddfct", "sdtmct", "protocolct", "glossaryct", "ddfct"):
-                if package not in self._packages:
-                    self._packages[package] = self.get_newest_package(package)
-                # get the package_id
-                package_id = self._packages[package]
-                _url = f"{self._base_url}{package_id}/codelists/{codelist_code}"
-                results = self.client.get(_url)
-
-                if results.status_code == 200:
-                    dataset = results.json()
-                    codelist = CodeList(concept_c_code=dataset["conceptId"])
-                    codelist.submission_value = dataset["submissionValue"]
-                    codelist.preferred_term = dataset["preferredTerm"]
-                    codelist.definition = dataset.get("definition")
-                    codelist.extensible = dataset.get("extensible") == "true"
-                    codelist.synonyms = dataset.get("synonyms", [])
-                    for term in dataset["terms"]:
-                        pv = PermissibleValue(
-                            project="DDF",
-                            entity_name="",
-                            codelist_c_code=dataset["conceptId"],
-                            preferred_term=term["preferredTerm"],
-                            synonyms=term.get("synonyms", []),
-                            definition=term.get("definition"),
-                            attribute_name="",
-                            concept_c_code=term["conceptId"],
-                        )
-                        codelist.add_item(pv)
+            for vocabulary in VOCABULARIES:
+                codelist = self._fetch_codelist(vocabulary, codelist_code)
+                if codelist is not None:
                     self._cache[codelist_code] = codelist
                     break
             else:
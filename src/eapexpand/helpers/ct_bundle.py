@@ -0,0 +1,172 @@
+"""
+Offline snapshots (bundles) of the external codelists referenced by a USDM CT workbook
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import gzip
+import hashlib
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+from eapexpand.models.usdm_ct import CodeList, DDFEntity, PermissibleValue
+
+BUNDLE_FORMAT = "eapexpand-ct-bundle"
+BUNDLE_VERSION = 1
+
+
+def file_digest(filename: str) -> str:
+    """
+    The SHA-256 digest of a file's content
+    """
+    digest = hashlib.sha256()
+    with open(filename, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def external_codelist_codes(
+    entities: Dict[str, DDFEntity], codelists: Dict[str, CodeList]
+) -> List[str]:
+    """
+    The codelists referenced by the entities that are not defined in the workbook
+    """
+    codes = []
+    for entity in entities.values():
+        for attr in entity.all_attributes.values():
+            if not attr.has_value_list:
+                continue
+            code = attr.external_code_list
+            if (
+                code
+                and code.startswith("C")
+                and code != "CNEW"
+                and code not in codelists
+                and code not in codes
+            ):
+                codes.append(code)
+    return codes
+
+
+def codelist_to_dict(codelist: CodeList) -> dict:
+    return dataclasses.asdict(codelist)
+
+
+def codelist_from_dict(data: dict) -> CodeList:
+    _data = dict(data)
+    items = _data.pop("items", [])
+    codelist = CodeList(**_data)
+    codelist.items = [PermissibleValue(**item) for item in items]
+    return codelist
+
+
+def build_bundle(filename: str, connector) -> dict:
+    """
+    Resolve every external codelist the workbook references with the connector
+    :param filename: The USDM CT workbook
+    :param connector: The connector used to resolve the codelists (eg a `CDISCCTConnector`)
+    """
+    from eapexpand.usdm_unpkt import read_usdm_ct
+
+    entities, codelists = read_usdm_ct(filename)
+    bundle = dict(
+        format=BUNDLE_FORMAT,
+        version=BUNDLE_VERSION,
+        workbook=Path(filename).name,
+        workbook_sha256=file_digest(filename),
+        created=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        packages={},
+        codelists={},
+        missing=[],
+    )
+    for code in external_codelist_codes(entities, codelists):
+        codelist = connector.retrieve_valueset(code)
+        if codelist is None:
+            bundle["missing"].append(code)
+        else:
+            bundle["codelists"][code] = codelist_to_dict(codelist)
+    bundle["packages"] = dict(getattr(connector, "package_versions", {}))
+    logger.info(
+        f"Bundled {len(bundle['codelists'])} codelists "
+        f"({len(bundle['missing'])} missing) for {bundle['workbook']}"
+    )
+    return bundle
+
+
+def write_bundle(bundle: dict, filename: str) -> None:
+    """
+    Write the bundle as gzipped, compact JSON
+    """
+    with gzip.open(filename, "wt", encoding="utf-8") as fh:
+        json.dump(bundle, fh, separators=(",", ":"))
+
+
+def read_bundle(filename: str) -> dict:
+    """
+    Read a bundle file
+    """
+    if not Path(filename).is_file():
+        raise FileNotFoundError(f"CT bundle not found: {filename}")
+    with gzip.open(filename, "rt", encoding="utf-8") as fh:
+        bundle = json.load(fh)
+    if bundle.get("format") != BUNDLE_FORMAT:
+        raise ValueError(f"Not a CT bundle: {filename}")
+    if bundle.get("version") != BUNDLE_VERSION:
+        raise ValueError(
+            f"Unsupported CT bundle version {bundle.get('version')}: {filename}"
+        )
+    return bundle
+
+
+class CTBundleConnector:
+    """
+    A drop in replacement for the `CDISCCTConnector` that resolves codelists from a local bundle
+
+    Attributes:
+        bundle (dict): The bundle content.
+        _cache (dict): The codelists materialised from the bundle.
+
+    Methods:
+        built_from(filename: str) -> bool:
+            Was the bundle built from the workbook.
+        retrieve_valueset(codelist_code: str) -> Optional[CodeList]:
+            Retrieves a codelist from the bundle.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.bundle = read_bundle(filename)
+        self._cache = {}
+
+    @property
+    def package_versions(self) -> Dict[str, str]:
+        return self.bundle["packages"]
+
+    def built_from(self, filename: str) -> bool:
+        """
+        Was the bundle built from the workbook (by the digest of its content)
+        """
+        return self.bundle.get("workbook_sha256") == file_digest(filename)
+
+    def prefetch(
+        self, codelist_codes: Optional[Iterable[str]] = None, max_workers: int = 4
+    ) -> None:
+        # the bundle is already local
+        pass
+
+    def retrieve_valueset(self, codelist_code: str) -> Optional[CodeList]:
+        if codelist_code not in self._cache:
+            data = self.bundle["codelists"].get(codelist_code)
+            if data is None:
+                logger.error(f"Codelist {codelist_code} is not in {self.filename}")
+                return None
+            self._cache[codelist_code] = codelist_from_dict(data)
+        return self._cache[codelist_code]
@@ -0,0 +1,109 @@
+"""
+On disk cache of the parsed (and codelist-resolved) USDM CT
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import pickle
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+from eapexpand.helpers.ct_bundle import file_digest
+
+# bump when the parsed representation changes
+CACHE_VERSION = 2
+
+
+def default_cache_dir() -> Path:
+    """
+    The cache directory; `EAPEXPAND_CACHE_DIR` overrides the default of `~/.cache/eapexpand`
+    """
+    if os.environ.get("EAPEXPAND_CACHE_DIR"):
+        return Path(os.environ["EAPEXPAND_CACHE_DIR"])
+    return Path.home() / ".cache" / "eapexpand"
+
+
+class CTCache:
+    """
+    Caches the parsed CT content (entities and codelists) keyed by the workbook content hash
+    and the CT package versions used to resolve the external codelists
+
+    Methods:
+        load(filename, package_versions) -> Optional[Tuple[dict, dict]]:
+            Returns the cached content, if the workbook and package versions match.
+        store(filename, package_versions, content):
+            Caches the content, dropping any entries for the workbook with other package versions.
+        find(filename) -> Optional[Tuple[dict, dict]]:
+            Returns the most recent cached content for the workbook, whatever the package versions
+            (of this cache version).
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        self.cache_dir = Path(cache_dir) if cache_dir else default_cache_dir() / "ct"
+
+    @staticmethod
+    def _versions_digest(package_versions: Dict[str, str]) -> str:
+        content = json.dumps(
+            dict(cache_version=CACHE_VERSION, packages=package_versions), sort_keys=True
+        )
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def _prefix(filename: str) -> str:
+        # the entries of other cache versions are not read
+        return f"ct-v{CACHE_VERSION}-{file_digest(filename)[:32]}"
+
+    def path(self, filename: str, package_versions: Dict[str, str]) -> Path:
+        return self.cache_dir / (
+            f"{self._prefix(filename)}-{self._versions_digest(package_versions)}.pickle"
+        )
+
+    @staticmethod
+    def _read(path: Path) -> Optional[Tuple[dict, dict]]:
+        try:
+            with open(path, "rb") as fh:
+                return pickle.load(fh)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as exc:
+            logger.warning(f"Ignoring unreadable CT cache entry {path}: {exc}")
+            return None
+
+    def load(
+        self, filename: str, package_versions: Dict[str, str]
+    ) -> Optional[Tuple[dict, dict]]:
+        path = self.path(filename, package_versions)
+        if not path.is_file():
+            return None
+        logger.info(f"Using cached CT {path}")
+        return self._read(path)
+
+    def find(self, filename: str) -> Optional[Tuple[dict, dict]]:
+        candidates = sorted(
+            self.cache_dir.glob(f"{self._prefix(filename)}-*.pickle"),
+            key=lambda x: x.stat().st_mtime,
+        )
+        return self._read(candidates[-1]) if candidates else None
+
+    def store(
+        self,
+        filename: str,
+        package_versions: Dict[str, str],
+        content: Tuple[dict, dict],
+    ) -> Path:
+        path = self.path(filename, package_versions)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # the package versions (or the cache version) have moved on
+        for stale in self.cache_dir.glob(f"ct-*{file_digest(filename)[:32]}-*.pickle"):
+            if stale != path:
+                stale.unlink(missing_ok=True)
+        _tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(_tmp, "wb") as fh:
+            pickle.dump(content, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(_tmp, path)
+        return path
@@ -0,0 +1,209 @@
+"""
+Compute the changes between two releases of the USDM CT
+"""
+
+from __future__ import annotations
+
+import pickle
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+from eapexpand.helpers.ct_cache import CTCache
+from eapexpand.models.usdm_ct import CodeList, DDFEntity, PermissibleValue
+
+ENTITY_FIELDS = (
+    "role",
+    "nci_c_code",
+    "preferred_term",
+    "synonyms",
+    "definition",
+    "value_list",
+    "inherited_from",
+)
+CODELIST_FIELDS = (
+    "submission_value",
+    "preferred_term",
+    "definition",
+    "extensible",
+    "synonyms",
+)
+VALUE_FIELDS = ("preferred_term", "submission_value", "definition", "synonyms")
+
+
+@dataclass
+class Change:
+    """
+    A single change between the releases
+
+    Attributes:
+        level (str): One of `entity`, `attribute`, `codelist` or `value`.
+        kind (str): One of `added`, `removed` or `changed`.
+        key (str): The element changed, eg `Study`, `Study.name`, `C66736` or `C66736.C15714`.
+        field (Optional[str]): The field changed (for `changed`).
+        old (Any): The previous value (for `changed`).
+        new (Any): The current value (for `changed`).
+    """
+
+    level: str
+    kind: str
+    key: str
+    field: Optional[str] = None
+    old: Any = None
+    new: Any = None
+
+    def __str__(self):
+        if self.kind == "changed":
+            return f"{self.level} {self.key}: {self.field} changed from {self.old!r} to {self.new!r}"
+        return f"{self.level} {self.key} {self.kind}"
+
+
+@dataclass
+class CTDelta:
+    """
+    The changes between two CT releases
+    """
+
+    changes: List[Change] = field(default_factory=list)
+
+    def summary(self) -> Dict[Tuple[str, str], int]:
+        return dict(Counter((x.level, x.kind) for x in self.changes))
+
+    def as_dict(self) -> dict:
+        return dict(changes=[asdict(x) for x in self.changes])
+
+
+def _join(
+    level: str,
+    old: Dict[str, Any],
+    new: Dict[str, Any],
+    fields: Tuple[str, ...],
+) -> Iterator[Tuple[Optional[Change], Any, Any]]:
+    """
+    Hash join the keyed elements, yielding the changes and the pairs present in both
+    """
+    for key, element in old.items():
+        if key not in new:
+            yield Change(level, "removed", key), None, None
+            continue
+        other = new[key]
+        for _field in fields:
+            before, after = getattr(element, _field), getattr(other, _field)
+            if before != after:
+                yield Change(level, "changed", key, _field, before, after), None, None
+        yield None, element, other
+    for key in new:
+        if key not in old:
+            yield Change(level, "added", key), None, None
+
+
+def _attributes(entity: DDFEntity) -> Dict[str, DDFEntity]:
+    return {
+        f"{entity.entity_name}.{name}": attr
+        for name, attr in entity.all_attributes.items()
+    }
+
+
+def _values(codelist: CodeList) -> Dict[str, PermissibleValue]:
+    return {f"{codelist.concept_c_code}.{x.concept_c_code}": x for x in codelist.items}
+
+
+def compare_ct(
+    old: Tuple[Dict[str, DDFEntity], Dict[str, CodeList]],
+    new: Tuple[Dict[str, DDFEntity], Dict[str, CodeList]],
+) -> CTDelta:
+    """
+    Compare two parsed CT releases (as returned by `load_usdm_ct`) at the entity, attribute,
+    codelist and permissible value level
+    """
+    delta = CTDelta()
+    old_entities, old_codelists = old
+    new_entities, new_codelists = new
+    for change, before, after in _join("entity", old_entities, new_entities, ENTITY_FIELDS):
+        if change:
+            delta.changes.append(change)
+        else:
+            for attr_change, _, _ in _join(
+                "attribute", _attributes(before), _attributes(after), ENTITY_FIELDS
+            ):
+                if attr_change:
+                    delta.changes.append(attr_change)
+    # removed or added entities take their attributes with them
+    for kind, source, other in (
+        ("removed", old_entities, new_entities),
+        ("added", new_entities, old_entities),
+    ):
+        for name, entity in source.items():
+            if name not in other:
+                for key in _attributes(entity):
+                    delta.changes.append(Change("attribute", kind, key))
+    old_codelists = {k: v for k, v in old_codelists.items() if v is not None}
+    new_codelists = {k: v for k, v in new_codelists.items() if v is not None}
+    for change, before, after in _join(
+        "codelist", old_codelists, new_codelists, CODELIST_FIELDS
+    ):
+        if change:
+            delta.changes.append(change)
+            if change.kind != "changed":
+                source = old_codelists if change.kind == "removed" else new_codelists
+                for key in _values(source[change.key]):
+                    delta.changes.append(Change("value", change.kind, key))
+        else:
+            for value_change, _, _ in _join(
+                "value", _values(before), _values(after), VALUE_FIELDS
+            ):
+                if value_change:
+                    delta.changes.append(value_change)
+    return delta
+
+
+def load_ct_parse(source: str, cache_dir: Optional[str] = None, cached: bool = True):
+    """
+    Load a parsed CT release, without going to the CDISC Library
+    * a CT cache entry (`.pickle`) is loaded directly
+    * for a workbook, the most recent cached parse is used (if `cached`, and there is one);
+      otherwise the workbook is parsed (with the external codelists unresolved)
+    """
+    if Path(source).suffix == ".pickle":
+        with open(source, "rb") as fh:
+            return pickle.load(fh)
+    if cached:
+        parse = CTCache(cache_dir).find(source)
+        if parse is not None:
+            logger.info(f"Using cached CT for {source}")
+            return parse
+    from eapexpand.usdm_unpkt import read_usdm_ct
+
+    return read_usdm_ct(source)
+
+
+def load_ct_parses(old: str, new: str, cache_dir: Optional[str] = None):
+    """
+    Load the parsed CT releases to compare; a cached parse has the external codelists resolved
+    and a workbook parse does not, so the cached parses are only used if both releases have one
+    * otherwise both workbooks are parsed; a CT cache entry can't be compared with a workbook
+      that has no cached parse
+    :returns: the old and new parsed releases
+    """
+    cache = CTCache(cache_dir)
+    parses = []
+    for source in (old, new):
+        if Path(source).suffix == ".pickle":
+            parses.append(load_ct_parse(source))
+        else:
+            parses.append(cache.find(source))
+    if all(x is not None for x in parses):
+        return tuple(parses)
+    for source in (old, new):
+        if Path(source).suffix == ".pickle":
+            raise ValueError(
+                f"Can't compare the cached parse {source} with an unresolved workbook parse"
+            )
+    if any(x is not None for x in parses):
+        logger.info("Only one of the releases has a cached parse, parsing both workbooks")
+    return tuple(load_ct_parse(x, cached=False) for x in (old, new))
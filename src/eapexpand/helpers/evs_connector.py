@@ -1,20 +1,98 @@
 from __future__ import annotations
 
+import json
 import re
-from typing import Optional
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
 
 import requests
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+from .http_transport import HTTPTransport
+
+# the time (in seconds) a concept not known to EVS is cached for
+MISS_TTL = 7 * 24 * 60 * 60
+
+
+class EVSCache:
+    """
+    A persistent (SQLite) cache of EVS concepts; concepts not known to EVS are cached as misses,
+    which expire after `miss_ttl` seconds (so concepts added to EVS are picked up)
+    """
+
+    def __init__(self, filename: Optional[str] = None, miss_ttl: float = MISS_TTL):
+        if filename is None:
+            from .ct_cache import default_cache_dir
+
+            filename = default_cache_dir() / "evs.sqlite"
+        Path(filename).parent.mkdir(parents=True, exist_ok=True)
+        self.filename = filename
+        self.miss_ttl = miss_ttl
+        self._conn = sqlite3.connect(filename)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS concepts ("
+            "terminology TEXT NOT NULL, code TEXT NOT NULL, payload TEXT, retrieved REAL, "
+            "PRIMARY KEY (terminology, code))"
+        )
+        columns = [x[1] for x in self._conn.execute("PRAGMA table_info(concepts)")]
+        if "retrieved" not in columns:
+            # a cache from before the misses expired; its misses are retried
+            with self._conn:
+                self._conn.execute("ALTER TABLE concepts ADD COLUMN retrieved REAL")
+
+    def get_many(self, terminology: str, codes: List[str]) -> Dict[str, Optional[dict]]:
+        found = {}
+        expired = time.time() - self.miss_ttl
+        # keep well within the SQLite variable limit
+        for start in range(0, len(codes), 500):
+            chunk = codes[start : start + 500]
+            for code, payload in self._conn.execute(
+                "SELECT code, payload FROM concepts WHERE terminology = ? AND code IN "
+                f"({','.join('?' * len(chunk))}) "
+                "AND (payload IS NOT NULL OR retrieved > ?)",
+                (terminology, *chunk, expired),
+            ):
+                found[code] = json.loads(payload) if payload else None
+        return found
+
+    def put_many(self, terminology: str, concepts: Dict[str, Optional[dict]]) -> None:
+        retrieved = time.time()
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO concepts (terminology, code, payload, retrieved) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (terminology, code, json.dumps(concept) if concept else None, retrieved)
+                    for code, concept in concepts.items()
+                ],
+            )
+
+    def close(self) -> None:
+        self._conn.close()
 
 
 class NCIEVSConnector:
-    def __init__(self):
+    def __init__(
+        self,
+        transport: Optional[HTTPTransport] = None,
+        cache: Optional[EVSCache] = None,
+    ):
         # self.api_key = api_key
-        self.client = requests.Session()
+        self.client = transport if transport is not None else HTTPTransport()
         # self.client.headers.update({"api_token": self.api_key})
         self._base_url = "https://api-evsrest.nci.nih.gov/api/v1"
         self._package_name = None
         self._package_id = None
         self._cache = {}
+        # concept summaries (or misses) retrieved by get_concepts
+        self._concepts = {}
+        self._store = cache
 
     def get_concept(self, concept_code: str, terminology: Optional[str] = "ncit"):
         """
@@ -27,3 +105,67 @@ class NCIEVSConnector:
         response.raise_for_status()
         self._cache[concept_code] = response.json()
         return response.json()
+
+    def _get_batch(self, codes: List[str], terminology: str, include: str) -> List[dict]:
+        response = self.client.get(
+            f"{self._base_url}/concept/{terminology}",
+            params=dict(list=",".join(codes), include=include),
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def get_concepts(
+        self,
+        concept_codes: Iterable[str],
+        terminology: str = "ncit",
+        include: str = "summary",
+        batch_size: int = 100,
+        max_workers: int = 8,
+    ) -> Dict[str, dict]:
+        """
+        Get many concepts from the EVS API, using batched lookups issued concurrently
+        :returns: the concepts by code (codes unknown to EVS, or in a batch that failed, are
+            omitted)
+        """
+        codes = list(dict.fromkeys(concept_codes))
+        concepts = {
+            code: self._concepts[(terminology, code)]
+            for code in codes
+            if (terminology, code) in self._concepts
+        }
+        missing = [code for code in codes if code not in concepts]
+        if missing and self._store is not None:
+            cached = self._store.get_many(terminology, missing)
+            concepts.update(cached)
+            missing = [code for code in missing if code not in cached]
+        if missing:
+            logger.info(f"Retrieving {len(missing)} concepts from EVS")
+            batches = [
+                missing[start : start + batch_size]
+                for start in range(0, len(missing), batch_size)
+            ]
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {
+                    executor.submit(self._get_batch, x, terminology, include): x
+                    for x in batches
+                }
+                for future in as_completed(futures):
+                    try:
+                        batch = future.result()
+                    except requests.RequestException as exc:
+                        # the codes of a failed batch are not cached, they are retried next time
+                        logger.warning(
+                            f"Retrieving {len(futures[future])} concepts from EVS failed: {exc}"
+                        )
+                        continue
+                    retrieved = dict.fromkeys(futures[future])
+                    for concept in batch:
+                        retrieved[concept["code"]] = concept
+                    # cache each batch as it arrives, so a later failure doesn't lose it
+                    if self._store is not None:
+                        self._store.put_many(terminology, retrieved)
+                    concepts.update(retrieved)
+        self._concepts.update(
+            {(terminology, code): concept for code, concept in concepts.items()}
+        )
+        return {code: concept for code, concept in concepts.items() if concept}
@@ -0,0 +1,115 @@
+"""
+Enrich the model and codelists with the definitions and synonyms held in NCI EVS
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+from eapexpand.helpers.evs_connector import NCIEVSConnector
+from eapexpand.models.eap import Document
+from eapexpand.models.usdm_ct import CodeList
+
+_C_CODE = re.compile(r"^C\d+$")
+
+
+@dataclass
+class EnrichmentReport:
+    """
+    The outcome of the EVS enrichment
+    """
+
+    concepts: int = 0
+    resolved: int = 0
+    definitions: int = 0
+    synonyms: int = 0
+
+
+def _elements(document: Document, codelists: Dict[str, CodeList]):
+    """
+    The (element, concept code) pairs for the classes, attributes, codelists and codelist items
+    """
+    for obj in document.objects:
+        if obj.object_type != "Class":
+            continue
+        yield obj, obj.reference_url
+        for attr in obj.all_attributes:
+            yield attr, attr.reference_url
+    for codelist in codelists.values():
+        if codelist is None:
+            continue
+        yield codelist, codelist.concept_c_code
+        for item in codelist.items:
+            yield item, item.concept_c_code
+
+
+def collect_concept_codes(document: Document, codelists: Dict[str, CodeList]) -> List[str]:
+    """
+    The NCI C-codes referenced by the classes, attributes and codelist items
+    """
+    codes = {}
+    for _, code in _elements(document, codelists):
+        if code and _C_CODE.match(code):
+            codes[code] = None
+    return list(codes)
+
+
+def concept_definition(concept: dict) -> Optional[str]:
+    """
+    The NCI definition for the concept (falling back to the first definition)
+    """
+    definitions = concept.get("definitions") or []
+    for definition in definitions:
+        if definition.get("source") == "NCI":
+            return definition.get("definition")
+    return definitions[0].get("definition") if definitions else None
+
+
+def concept_synonyms(concept: dict) -> List[str]:
+    """
+    The distinct synonyms for the concept (excluding the preferred name)
+    """
+    names = {}
+    for synonym in concept.get("synonyms") or []:
+        name = synonym.get("name")
+        if name and name != concept.get("name"):
+            names[name] = None
+    return list(names)
+
+
+def enrich_from_evs(
+    document: Document,
+    codelists: Dict[str, CodeList],
+    connector: NCIEVSConnector,
+) -> EnrichmentReport:
+    """
+    Fill in the missing definitions and synonyms from EVS
+    """
+    codes = collect_concept_codes(document, codelists)
+    concepts = connector.get_concepts(codes)
+    report = EnrichmentReport(concepts=len(codes), resolved=len(concepts))
+    for element, code in _elements(document, codelists):
+        concept = concepts.get(code) if code else None
+        if concept is None:
+            continue
+        if not element.definition:
+            definition = concept_definition(concept)
+            if definition:
+                element.definition = definition
+                report.definitions += 1
+        if not element.synonyms:
+            synonyms = concept_synonyms(concept)
+            if synonyms:
+                element.synonyms = synonyms
+                report.synonyms += 1
+    logger.info(
+        f"Resolved {report.resolved} of {report.concepts} concepts from EVS, "
+        f"added {report.definitions} definitions and {report.synonyms} synonym lists"
+    )
+    return report
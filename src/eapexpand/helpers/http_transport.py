@@ -0,0 +1,242 @@
+"""
+Shared HTTP transport for the CT connectors
+"""
+
+from __future__ import annotations
+
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# statuses worth another attempt
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# the client side limits for the CT and EVS APIs; requests per second, the burst and the
+# connections kept per host (enough for the concurrent package downloads and EVS batches)
+DEFAULT_RATE = 10.0
+DEFAULT_BURST = 10.0
+DEFAULT_POOL_SIZE = 16
+
+
+class TokenBucket:
+    """
+    A token bucket rate limiter
+
+    Attributes:
+        rate (float): The number of tokens added to the bucket per second.
+        capacity (float): The maximum number of tokens in the bucket (the permitted burst).
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        assert rate > 0, "Rate must be positive"
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """
+        Take tokens from the bucket, blocking until they are available
+        :returns: the time spent waiting
+        """
+        if tokens > self.capacity:
+            raise ValueError(f"Can't acquire {tokens} tokens, the capacity is {self.capacity}")
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+@dataclass
+class TransportStats:
+    """
+    Request and latency counters for a transport; the responses with an expected error status
+    (eg a 404 for a codelist not in a package) are counted as misses rather than failures
+    """
+
+    requests: int = 0
+    retries: int = 0
+    failures: int = 0
+    misses: int = 0
+    throttled: float = 0.0
+    latency: float = 0.0
+    max_latency: float = 0.0
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, repr=False, compare=False
+    )
+
+    def record(self, latency: float):
+        with self._lock:
+            self.requests += 1
+            self.latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def record_throttle(self, waited: float):
+        with self._lock:
+            self.throttled += waited
+
+    @property
+    def mean_latency(self) -> float:
+        return self.latency / self.requests if self.requests else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return dict(
+            requests=self.requests,
+            retries=self.retries,
+            failures=self.failures,
+            misses=self.misses,
+            throttled=self.throttled,
+            latency=self.latency,
+            mean_latency=self.mean_latency,
+            max_latency=self.max_latency,
+        )
+
+
+class HTTPTransport:
+    """
+    A pooled, rate-limited and retrying HTTP client, safe to share between connectors and threads
+
+    Attributes:
+        session (requests.Session): The underlying session, with sized connection pools.
+        timeout (float | tuple): The (connect, read) timeout applied to every request.
+        retries (int): The number of retries after the first attempt.
+        backoff_factor (float): The base delay for the exponential backoff.
+        backoff_max (float): The cap on a single backoff delay (including a Retry-After delay).
+        limiter (Optional[TokenBucket]): The client side rate limiter, if any.
+        stats (TransportStats): The request/latency counters.
+
+    Methods:
+        get(url, **kwargs) -> requests.Response:
+            Issue a GET request.
+        request(method, url, expected_statuses=(), **kwargs) -> requests.Response:
+            Issue a request, retrying connection errors, timeouts and retryable statuses
+            with jittered exponential backoff; the expected (error) statuses are not failures.
+    """
+
+    def __init__(
+        self,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Union[float, Tuple[float, float]] = (5.0, 60.0),
+        retries: int = 3,
+        backoff_factor: float = 0.5,
+        backoff_max: float = 30.0,
+        rate: Optional[float] = None,
+        burst: Optional[float] = None,
+        pool_connections: int = 4,
+        pool_maxsize: int = 16,
+        retry_statuses: Tuple[int, ...] = RETRY_STATUSES,
+    ):
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        # retries are handled here so they can be counted and jittered
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=0,
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.retry_statuses = retry_statuses
+        self.limiter = TokenBucket(rate, burst) if rate else None
+        self.stats = TransportStats()
+
+    @property
+    def headers(self):
+        return self.session.headers
+
+    def backoff(self, attempt: int) -> float:
+        """
+        The (full jitter) delay before the next attempt
+        """
+        return random.uniform(
+            0, min(self.backoff_max, self.backoff_factor * (2**attempt))
+        )
+
+    @staticmethod
+    def _retry_after(response: requests.Response) -> Optional[float]:
+        value = response.headers.get("Retry-After")
+        if value and value.isdigit():
+            return float(value)
+        return None
+
+    def request(
+        self, method: str, url: str, expected_statuses: Tuple[int, ...] = (), **kwargs
+    ) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            if self.limiter:
+                self.stats.record_throttle(self.limiter.acquire())
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                self.stats.record(time.monotonic() - started)
+                if attempt >= self.retries:
+                    self.stats.record_failure()
+                    raise
+                logger.warning(f"{method} {url} failed ({exc}), retrying")
+                delay = self.backoff(attempt)
+            else:
+                self.stats.record(time.monotonic() - started)
+                if (
+                    response.status_code not in self.retry_statuses
+                    or attempt >= self.retries
+                ):
+                    if response.status_code in expected_statuses:
+                        self.stats.record_miss()
+                    elif response.status_code >= 400:
+                        self.stats.record_failure()
+                    return response
+                logger.warning(
+                    f"{method} {url} returned {response.status_code}, retrying"
+                )
+                delay = self._retry_after(response)
+                if delay is None:
+                    delay = self.backoff(attempt)
+                else:
+                    delay = min(delay, self.backoff_max)
+            self.stats.record_retry()
+            time.sleep(delay)
+            attempt += 1
+
+    def get(
+        self, url: str, expected_statuses: Tuple[int, ...] = (), **kwargs
+    ) -> requests.Response:
+        return self.request("GET", url, expected_statuses=expected_statuses, **kwargs)
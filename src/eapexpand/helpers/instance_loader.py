@@ -0,0 +1,272 @@
+"""
+Bulk loading of (USDM) JSON instances into a SQLite store with the relational mapping of the
+model (see `render.relational`)
+
+Each instance is shredded into rows (an instance per row of its class table, and a row of the
+junction table for each item of a multivalued association); the rows are buffered per table and
+written with `executemany`, a batch of documents per transaction
+
+An association is either the instance (inline) or the id of an instance elsewhere in the document
+(eg `epochId` for `epoch`); the references by id are filled in once the document is shredded
+"""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+from eapexpand.render.relational import (
+    DOCUMENT_KEY,
+    DOCUMENT_TABLE,
+    JSON,
+    PRIMARY_KEY,
+    REFERENCE,
+    Column,
+    RelationalModel,
+    Table,
+)
+from eapexpand.render.render_sqlite import quote_identifier, sqlite_ddl
+
+# the key naming the class of an instance
+INSTANCE_TYPE = "instanceType"
+# the key identifying an instance within a document
+INSTANCE_ID = "id"
+
+
+def root_key(root_class: str) -> str:
+    """
+    The key of the root instance in a document, eg `study` for `Study`
+    """
+    return root_class[:1].lower() + root_class[1:]
+
+
+def id_keys(attribute: str, multivalued: bool = False) -> List[str]:
+    """
+    The keys for an association by id, eg `epochId` for `epoch` or `childIds` for `children`
+    """
+    if not multivalued:
+        return [f"{attribute}Id"]
+    keys = [f"{attribute}Ids"]
+    if attribute.endswith("ren"):
+        keys.append(f"{attribute[:-3]}Ids")
+    elif attribute.endswith("s"):
+        keys.append(f"{attribute[:-1]}Ids")
+    return keys
+
+
+def _referenced(instance: dict, attribute: str, multivalued: bool = False) -> Any:
+    # the value of an association; inline (or ids) under the attribute, or under an id key
+    if instance.get(attribute) is not None:
+        return instance[attribute]
+    for key in id_keys(attribute, multivalued):
+        if instance.get(key) is not None:
+            return instance[key]
+    return None
+
+
+def _json_value(value: Any) -> Optional[str]:
+    return None if value is None else json.dumps(value)
+
+
+class InstanceLoader:
+    """
+    Loads the instances of the model into a SQLite database, creating the tables where needed;
+    the row keys continue from the largest key in the database
+
+    Methods:
+        load(instance, source) -> int:
+            Shreds a document (the root instance, and the document metadata), returning its key.
+        flush():
+            Writes the buffered rows, in a transaction.
+        resolve():
+            Fills in the references by id, once a document is shredded.
+        load_files(paths) -> int:
+            Loads the JSON documents, returning the number loaded.
+    """
+
+    def __init__(
+        self,
+        connection: sqlite3.Connection,
+        model: RelationalModel,
+        root_class: str,
+        batch_size: int = 1000,
+    ):
+        self.connection = connection
+        self.model = model
+        self.root_class = root_class
+        self.batch_size = batch_size
+        self.connection.executescript(sqlite_ddl(model))
+        self._pk = max(
+            self.connection.execute(
+                f"SELECT MAX({quote_identifier(PRIMARY_KEY)}) FROM {quote_identifier(x)}"
+            ).fetchone()[0]
+            or 0
+            for x in model.tables
+        )
+        self._statements = {
+            x.name: "INSERT INTO {} ({}) VALUES ({})".format(
+                quote_identifier(x.name),
+                ", ".join(quote_identifier(y) for y in x.column_names),
+                ", ".join("?" for _ in x.column_names),
+            )
+            for x in model.tables.values()
+        }
+        # the attributes mapped for each table (to a column or a junction table, or by id)
+        self._mapped = {}
+        for table in model.tables.values():
+            mapped = {x.attribute for x in table.columns if x.attribute} | set(table.junctions)
+            for column in table.columns:
+                if column.kind == REFERENCE and column.attribute:
+                    mapped.update(id_keys(column.attribute))
+            for attribute in table.junctions:
+                mapped.update(id_keys(attribute, multivalued=True))
+            self._mapped[table.name] = mapped
+        self._rows: Dict[str, List[list]] = {x: [] for x in model.tables}
+        # the keys of the instances of the document, by id, and the references by id to fill in
+        # as (row, column index, id, (table, attribute))
+        self._ids: Dict[str, int] = {}
+        self._references: List[Tuple[list, int, str, Tuple[str, str]]] = []
+        self.pending = 0
+        self.unmapped: Counter = Counter()
+        self.unresolved: Counter = Counter()
+
+    def _next_pk(self) -> int:
+        self._pk += 1
+        return self._pk
+
+    def _add(self, table: Table, row: list) -> None:
+        self._rows[table.name].append(row)
+        self.pending += 1
+
+    def _reference(
+        self, row: list, value: Any, _range: str, document_pk: int, key: Tuple[str, str]
+    ) -> None:
+        # adds the key of an inline instance, or a placeholder for a reference by id
+        if isinstance(value, dict):
+            row.append(self.shred(value, _range, document_pk))
+            return
+        row.append(None)
+        if isinstance(value, str):
+            self._references.append((row, len(row) - 1, value, key))
+        elif value is not None:
+            self.unresolved[key] += 1
+
+    @staticmethod
+    def _value(column: Column, value: Any) -> Any:
+        if column.kind == JSON or isinstance(value, (dict, list)):
+            return _json_value(value)
+        return value
+
+    def shred(self, instance: dict, class_name: str, document_pk: int) -> Optional[int]:
+        """
+        Buffers the rows for an instance (of a class, or the subclass named by the instance
+        type) and its contents
+        :returns: the key for the instance
+        """
+        table = self.model.table_for(class_name, instance.get(INSTANCE_TYPE))
+        if table is None:
+            self.unmapped[(class_name, INSTANCE_TYPE)] += 1
+            return None
+        pk = self._next_pk()
+        if isinstance(instance.get(INSTANCE_ID), str):
+            self._ids[instance[INSTANCE_ID]] = pk
+        row = [pk]
+        for column in table.columns:
+            if column.name == DOCUMENT_KEY:
+                row.append(document_pk)
+            elif column.kind == REFERENCE:
+                value = _referenced(instance, column.attribute)
+                self._reference(
+                    row, value, column.range, document_pk, (table.name, column.attribute)
+                )
+            else:
+                row.append(self._value(column, instance.get(column.attribute)))
+        self._add(table, row)
+        for attribute, junction_name in table.junctions.items():
+            junction = self.model.tables[junction_name]
+            item_range = junction.columns[1].range
+            items = _referenced(instance, attribute, multivalued=True) or []
+            for position, item in enumerate(items):
+                junction_row = [self._next_pk(), pk]
+                self._reference(
+                    junction_row, item, item_range, document_pk, (table.name, attribute)
+                )
+                junction_row.append(position)
+                self._add(junction, junction_row)
+        mapped = self._mapped[table.name]
+        for key in instance:
+            if key not in mapped and key != INSTANCE_TYPE:
+                self.unmapped[(table.name, key)] += 1
+        return pk
+
+    def load(self, document: dict, source: Optional[str] = None) -> int:
+        """
+        Shreds a document; the root instance is under the root key (eg `study`), the other
+        entries (eg `usdmVersion`) are kept as the document metadata
+        :returns: the key for the document
+        """
+        key = root_key(self.root_class)
+        if key not in document:
+            raise ValueError(f"No {key} in {source or 'document'}")
+        document_pk = self._next_pk()
+        root_pk = self.shred(document[key], self.root_class, document_pk)
+        self.resolve()
+        root_table = self.model.table_for(self.root_class, document[key].get(INSTANCE_TYPE))
+        metadata = {k: v for k, v in document.items() if k != key}
+        row = [
+            document_pk,
+            source,
+            root_table.name if root_table else None,
+            root_pk,
+            _json_value(metadata),
+        ]
+        self._add(self.model.tables[DOCUMENT_TABLE], row)
+        return document_pk
+
+    def resolve(self) -> None:
+        """
+        Fills in the references by id with the keys of the instances of the document; the ids
+        not found in the document are counted as unresolved
+        """
+        for row, index, instance_id, key in self._references:
+            row[index] = self._ids.get(instance_id)
+            if row[index] is None:
+                self.unresolved[key] += 1
+        self._references.clear()
+        self._ids.clear()
+
+    def flush(self) -> None:
+        with self.connection:
+            for name, rows in self._rows.items():
+                if rows:
+                    self.connection.executemany(self._statements[name], rows)
+                    rows.clear()
+        self.pending = 0
+
+    def load_files(self, paths: Iterable[Union[str, Path]]) -> int:
+        """
+        Loads the documents; the rows are written once a batch of rows is buffered (a document
+        is written in one transaction)
+        :returns: the number of documents loaded
+        """
+        count = 0
+        for path in paths:
+            with open(path, "r") as fh:
+                self.load(json.load(fh), source=str(path))
+            count += 1
+            if self.pending >= self.batch_size:
+                self.flush()
+        self.flush()
+        for (table, key), occurrences in sorted(self.unmapped.items()):
+            logger.warning(f"Unmapped {table}.{key} ({occurrences} instances)")
+        for (table, key), occurrences in sorted(self.unresolved.items()):
+            logger.warning(f"Unresolved references {table}.{key} ({occurrences} references)")
+        logger.info(f"Loaded {count} documents")
+        return count
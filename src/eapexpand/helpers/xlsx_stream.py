@@ -0,0 +1,180 @@
+"""
+A lightweight, streaming reader for the cell values of an xlsx workbook
+"""
+
+from __future__ import annotations
+
+import posixpath
+import re
+import zipfile
+from typing import Dict, Iterator, List, Optional, Tuple
+from xml.etree.ElementTree import iterparse
+
+NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+NS_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+_CELL_REF = re.compile(r"([A-Z]+)(\d+)")
+
+
+def column_index(letters: str) -> int:
+    """
+    Convert a column reference (eg `AB`) into a 1-based index
+    """
+    index = 0
+    for letter in letters:
+        index = index * 26 + (ord(letter) - 64)
+    return index
+
+
+def _text(element) -> str:
+    """
+    The text of a string item, concatenating rich text runs (and ignoring phonetic runs)
+    """
+    texts = []
+    for child in element:
+        if child.tag == f"{NS_MAIN}t":
+            texts.append(child.text or "")
+        elif child.tag == f"{NS_MAIN}r":
+            for run in child:
+                if run.tag == f"{NS_MAIN}t":
+                    texts.append(run.text or "")
+    return "".join(texts)
+
+
+def _number(value: str):
+    if "." in value or "E" in value or "e" in value:
+        return float(value)
+    return int(value)
+
+
+class XLSXReader:
+    """
+    Streams the rows of an xlsx workbook straight from the sheet XML, yielding the
+    same value tuples as `openpyxl` in `read_only` mode with `values_only=True`
+    (dates are returned as their serial number)
+
+    Methods:
+        sheet_names -> List[str]:
+            The names of the worksheets, in workbook order.
+        iter_rows(sheet_name: str, min_row: int = 1) -> Iterator[Tuple]:
+            Yields the cell values for each row of a worksheet.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._zip = zipfile.ZipFile(filename)
+        self._sheets = self._read_sheets()
+        self._shared_strings = None
+
+    def __enter__(self) -> XLSXReader:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._zip.close()
+
+    def _read_sheets(self) -> Dict[str, str]:
+        """
+        Map the sheet names onto the sheet parts
+        """
+        with self._zip.open("xl/_rels/workbook.xml.rels") as fh:
+            targets = {
+                rel.get("Id"): rel.get("Target")
+                for _, rel in iterparse(fh)
+                if rel.tag == f"{NS_PKG_REL}Relationship"
+            }
+        sheets = {}
+        with self._zip.open("xl/workbook.xml") as fh:
+            for _, element in iterparse(fh):
+                if element.tag == f"{NS_MAIN}sheet":
+                    target = targets[element.get(f"{NS_REL}id")]
+                    if target.startswith("/"):
+                        part = target[1:]
+                    else:
+                        part = posixpath.normpath(posixpath.join("xl", target))
+                    sheets[element.get("name")] = part
+        return sheets
+
+    @property
+    def sheet_names(self) -> List[str]:
+        return list(self._sheets)
+
+    @property
+    def shared_strings(self) -> List[str]:
+        if self._shared_strings is None:
+            strings = []
+            if "xl/sharedStrings.xml" in self._zip.namelist():
+                with self._zip.open("xl/sharedStrings.xml") as fh:
+                    for _, element in iterparse(fh):
+                        if element.tag == f"{NS_MAIN}si":
+                            strings.append(_text(element))
+                            element.clear()
+            self._shared_strings = strings
+        return self._shared_strings
+
+    def _value(self, cell):
+        data_type = cell.get("t", "n")
+        if data_type == "inlineStr":
+            inline = cell.find(f"{NS_MAIN}is")
+            return _text(inline) if inline is not None else None
+        value = cell.find(f"{NS_MAIN}v")
+        if value is None or value.text is None:
+            return None
+        if data_type == "s":
+            return self.shared_strings[int(value.text)]
+        if data_type == "n":
+            return _number(value.text)
+        if data_type == "b":
+            return value.text == "1"
+        # str (formula result), e (error) and d (ISO date)
+        return value.text
+
+    def iter_rows(self, sheet_name: str, min_row: int = 1) -> Iterator[Tuple]:
+        """
+        Yield the cell values for each row of the worksheet, padded to the sheet width
+        """
+        if sheet_name not in self._sheets:
+            raise KeyError(f"Worksheet {sheet_name} does not exist.")
+        strings = self.shared_strings
+        width: Optional[int] = None
+        expected = min_row
+        with self._zip.open(self._sheets[sheet_name]) as fh:
+            for _, element in iterparse(fh):
+                tag = element.tag
+                if tag == f"{NS_MAIN}dimension":
+                    match = _CELL_REF.findall(element.get("ref", ""))
+                    if match:
+                        width = column_index(match[-1][0])
+                elif tag == f"{NS_MAIN}row":
+                    row_num = int(element.get("r", expected))
+                    if row_num < min_row:
+                        element.clear()
+                        continue
+                    values = {}
+                    column = 0
+                    for cell in element:
+                        ref = cell.get("r")
+                        if ref:
+                            column = column_index(_CELL_REF.match(ref).group(1))
+                        else:
+                            column += 1
+                        if cell.get("t") == "s":
+                            value = cell.find(f"{NS_MAIN}v")
+                            values[column] = (
+                                strings[int(value.text)]
+                                if value is not None and value.text is not None
+                                else None
+                            )
+                        else:
+                            values[column] = self._value(cell)
+                    element.clear()
+                    _width = width or max(values, default=0)
+                    # rows absent from the sheet XML are empty
+                    while expected < row_num:
+                        yield (None,) * _width
+                        expected += 1
+                    yield tuple(values.get(idx) for idx in range(1, _width + 1))
+                    expected = row_num + 1
@@ -49,9 +49,67 @@ def decode_flag(flag: int) -> bool:
     return flag == 1
 
 
+@dataclass
+class Bounds:
+    """
+    The rectangle of an object on a diagram; EA holds the vertical positions as negative
+    numbers, they are held here as distances down from the top of the diagram
+    """
+    left: int
+    top: int
+    right: int
+    bottom: int
+
+    @classmethod
+    def from_rect(cls, left: int, top: int, right: int, bottom: int) -> Bounds:
+        return cls(left, abs(top), right, abs(bottom))
+
+    @property
+    def width(self) -> int:
+        return self.right - self.left
+
+    @property
+    def height(self) -> int:
+        return self.bottom - self.top
+
+    @property
+    def center(self) -> tuple:
+        return (self.left + self.right) / 2, (self.top + self.bottom) / 2
+
+
+@dataclass
+class DiagramLink:
+    """
+    A connector drawn on a diagram
+
+    Attributes:
+        connector (Connector): The connector.
+        hidden (bool): The connector is hidden on the diagram.
+        path (List[tuple]): The bend points of the line, from the source to the target.
+    """
+    connector: Connector
+    hidden: bool = False
+    path: List[tuple] = field(default_factory=list)
+
+    @staticmethod
+    def parse_path(path: Optional[str]) -> List[tuple]:
+        """
+        The bend points of an EA path, eg `120:-80;240:-80;`
+        """
+        points = []
+        for point in (path or "").split(";"):
+            if ":" in point:
+                x, y = point.split(":")[:2]
+                points.append((int(float(x)), abs(int(float(y)))))
+        return points
+
+
 class Diagram:
     """
     Some discussion about subsetting the document into diagrams
+
+    The objects on the diagram are held in sequence order, along with their position (bounds),
+    and the connectors drawn between them (links)
     """
     def __init__(self, idee: int, name: str, diagram_type: str, version: str):
         self.id = idee
@@ -59,9 +117,25 @@ class Diagram:
         self._type = diagram_type
         self._version = version
         self._objects = {}
+        self.bounds: Dict[int, Bounds] = {}
+        self.links: List[DiagramLink] = []
 
-    def add_object(self, sequence: int, model_object: Object) -> None:
+    def add_object(
+        self, sequence: int, model_object: Object, bounds: Optional[Bounds] = None
+    ) -> None:
         self._objects[sequence] = model_object
+        if bounds is not None:
+            self.bounds[model_object.object_id] = bounds
+
+    def add_link(self, link: DiagramLink) -> None:
+        self.links.append(link)
+
+    @property
+    def objects(self) -> List[Object]:
+        """
+        The objects on the diagram, in sequence order
+        """
+        return [self._objects[x] for x in sorted(self._objects)]
 
 
 class Document:
@@ -23,6 +23,8 @@ from .eap import (
     StateNode,
     Text,
     Diagram,
+    DiagramLink,
+    Bounds,
 )
 
 
@@ -129,6 +131,7 @@ def load_from_file(
         _packages.get(_object.package_id).objects.append(_object)
         data[_object.object_id] = _object
     # load the connectors
+    connectors = {}
     for conn in cur.execute("SELECT * FROM t_connector").fetchall():
         _conn = Connector.from_dict(conn)  # type: Connector
         _source_object = data.get(_conn.start_object_id)
@@ -167,6 +170,7 @@ def load_from_file(
                     _conn.aliased_type = api_metadata["mapTypes"][_conn.name]["type"]
                                   
         if _source_object and _target_object:
+            connectors[_conn.connector_id] = _conn
             if _conn.connector_type == "Association":
                 _source_object.outgoing_connections.append(_conn)
                 _target_object.incoming_connections.append(_conn)
@@ -201,7 +205,28 @@ def load_from_file(
         ).fetchall():
             _object = data.get(link["Object_ID"])
             if _object:
-                diagram.add_object(link["Sequence"], _object)
+                bounds = None
+                if link.get("RectRight") is not None and link.get("RectBottom") is not None:
+                    bounds = Bounds.from_rect(
+                        link.get("RectLeft", 0),
+                        link.get("RectTop", 0),
+                        link["RectRight"],
+                        link["RectBottom"],
+                    )
+                diagram.add_object(link["Sequence"], _object, bounds)
+        # the connectors drawn on the diagram
+        for link in cur.execute(
+            "SELECT * FROM t_diagramlinks WHERE DiagramID = ?", (diagram.id,)
+        ).fetchall():
+            _conn = connectors.get(link.get("ConnectorID"))
+            if _conn:
+                diagram.add_link(
+                    DiagramLink(
+                        _conn,
+                        hidden=bool(link.get("Hidden")),
+                        path=DiagramLink.parse_path(link.get("Path")),
+                    )
+                )
         diagrams.append(diagram)
     # Add the API attributes
     if api_metadata:
@@ -0,0 +1,250 @@
+"""
+Selecting a subset of a model to enrich and render; the classes on a set of diagrams, the classes
+in a package subtree, or the classes reachable from a root class
+
+The classes referenced from the subset (by an attribute, an association or a generalization) that
+are not selected are kept as stubs; a class with the name and description, but no attributes or
+connections, so the references still resolve
+
+The selected classes are copied with their connectors rebuilt between the kept classes and stubs,
+so the inherited attributes (and the superclasses) are those of the subset
+"""
+
+from __future__ import annotations
+
+import dataclasses
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+from eapexpand.models.eap import Connector, Document, Object
+
+
+@dataclass
+class Selection:
+    """
+    The parts of a model to select; the classes selected by each part are combined
+
+    Attributes:
+        diagrams (List[str]): The names of the diagrams.
+        packages (List[str]): The names of the packages (with their subpackages).
+        root (Optional[str]): The class the selected classes are reachable from, through
+            associations and generalizations.
+    """
+
+    diagrams: List[str] = field(default_factory=list)
+    packages: List[str] = field(default_factory=list)
+    root: Optional[str] = None
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.diagrams or self.packages or self.root)
+
+
+def _is_class(obj: Object) -> bool:
+    return obj.object_type == "Class"
+
+
+def _type_name(attribute_type: Optional[str]) -> Optional[str]:
+    # the type of an attribute, eg `List<Code>` is `Code`
+    if attribute_type and "<" in attribute_type:
+        return attribute_type.split("<")[1].split(">")[0]
+    return attribute_type
+
+
+def referenced_objects(obj: Object, by_name: Dict[str, Object]) -> List[Object]:
+    """
+    The objects a class refers to; the types of its attributes, the targets of its associations,
+    its superclass and its subclasses
+    """
+    found = []
+    for attr in obj.object_attributes:
+        _type = by_name.get(_type_name(attr.attribute_type))
+        if _type is not None:
+            found.append(_type)
+    for conn in obj.outgoing_connections:
+        if conn.connector_type == "Association" and conn.target_object is not None:
+            found.append(conn.target_object)
+    found.extend(x.target_object for x in obj.generalizations if x.target_object is not None)
+    found.extend(x.source_object for x in obj.specializations if x.source_object is not None)
+    return found
+
+
+def package_subtree(document: Document, names: List[str]) -> Set[int]:
+    """
+    The ids of the named packages and their subpackages
+    """
+    parents = {x.package_id: x.parent_id for x in document.packages}
+    selected = {x.package_id for x in document.packages if x.name in names}
+    found = set()
+    for package_id in parents:
+        ancestor, seen = package_id, set()
+        while ancestor and ancestor not in seen:
+            if ancestor in selected:
+                found.add(package_id)
+                break
+            seen.add(ancestor)
+            ancestor = parents.get(ancestor)
+    return found
+
+
+def reachable_objects(document: Document, root: str) -> List[Object]:
+    """
+    The classes reachable from a root class
+    """
+    start = document.get_class_by_name(root)
+    if start is None:
+        raise ValueError(f"Root class not found: {root}")
+    by_name = {x.name: x for x in document.objects if _is_class(x)}
+    found = {start.object_id: start}
+    pending = [start]
+    while pending:
+        for obj in referenced_objects(pending.pop(), by_name):
+            if obj.object_id not in found:
+                found[obj.object_id] = obj
+                pending.append(obj)
+    return list(found.values())
+
+
+def stub(obj: Object) -> Object:
+    """
+    A class without attributes or connections, standing in for a class outside the subset
+    """
+    return dataclasses.replace(
+        obj,
+        object_attributes=[],
+        outgoing_connections=[],
+        incoming_connections=[],
+        generalizations=[],
+        specializations=[],
+    )
+
+
+def relink(selected: Dict[int, Object], stubs: Dict[int, Object]) -> Dict[int, Object]:
+    """
+    Copies of the selected classes, with the connectors from them copied to join the copies and
+    the stubs; the connectors leading out of the subset are dropped
+    :returns: the kept objects (the copies, the other selected objects and the stubs) by id
+    """
+    kept = dict(selected)
+    for object_id, obj in selected.items():
+        if _is_class(obj):
+            kept[object_id] = stub(obj)
+            kept[object_id].object_attributes = obj.object_attributes
+    kept.update(stubs)
+    relinked: Dict[int, Connector] = {}
+
+    def _relink(conn: Connector) -> Optional[Connector]:
+        # the connector between the kept objects, or None if it leads out of the subset
+        if conn.start_object_id not in kept or conn.end_object_id not in kept:
+            return None
+        if conn.connector_id not in relinked:
+            relinked[conn.connector_id] = dataclasses.replace(
+                conn,
+                source_object=kept[conn.start_object_id],
+                target_object=kept[conn.end_object_id],
+            )
+        return relinked[conn.connector_id]
+
+    for object_id, obj in selected.items():
+        if not _is_class(obj):
+            continue
+        copy = kept[object_id]
+        for outgoing, incoming in (
+            ("outgoing_connections", "incoming_connections"),
+            ("generalizations", "specializations"),
+        ):
+            for conn in getattr(obj, outgoing):
+                _conn = _relink(conn)
+                if _conn is None:
+                    continue
+                getattr(copy, outgoing).append(_conn)
+                # a stub has no connections
+                if conn.end_object_id in selected:
+                    getattr(kept[conn.end_object_id], incoming).append(_conn)
+    return kept
+
+
+def subset_document(document: Document, selection: Selection) -> Document:
+    """
+    The document restricted to the selected classes (and the objects on the selected diagrams);
+    the referenced classes outside the selection are kept as stubs
+    :param document: The loaded document
+    :param selection: The diagrams, packages and root class to select
+    :returns: a document with the selected objects, the stubs and their packages
+    """
+    if selection.is_empty:
+        return document
+    selected: Dict[int, Object] = {}
+    for diagram in document.diagrams:
+        if diagram.name in selection.diagrams:
+            for obj in diagram.objects:
+                selected.setdefault(obj.object_id, obj)
+    missing = set(selection.diagrams) - {x.name for x in document.diagrams}
+    if missing:
+        raise ValueError(f"Diagrams not found: {', '.join(sorted(missing))}")
+    if selection.packages:
+        missing = set(selection.packages) - {x.name for x in document.packages}
+        if missing:
+            raise ValueError(f"Packages not found: {', '.join(sorted(missing))}")
+        subtree = package_subtree(document, selection.packages)
+        for obj in document.objects:
+            if obj.package_id in subtree and obj.object_type != "Package":
+                selected.setdefault(obj.object_id, obj)
+    if selection.root:
+        for obj in reachable_objects(document, selection.root):
+            selected.setdefault(obj.object_id, obj)
+    by_name = {x.name: x for x in document.objects if _is_class(x)}
+    stubs: Dict[int, Object] = {}
+    for obj in list(selected.values()):
+        if not _is_class(obj):
+            continue
+        for referenced in referenced_objects(obj, by_name):
+            if referenced.object_id in selected or referenced.object_id in stubs:
+                continue
+            if _is_class(referenced):
+                stubs[referenced.object_id] = stub(referenced)
+            else:
+                selected[referenced.object_id] = referenced
+    # the packages of the objects, and their parents
+    parents = {x.package_id: x for x in document.packages}
+    package_ids = set()
+    for obj in list(selected.values()) + list(stubs.values()):
+        package_id = obj.package_id
+        while package_id in parents and package_id not in package_ids:
+            package_ids.add(package_id)
+            package_id = parents[package_id].parent_id
+    kept = relink(selected, stubs)
+    objects = [
+        kept.get(x.object_id, x)
+        for x in document.objects
+        if x.object_id in kept or (x.object_type == "Package" and x.package_id in package_ids)
+    ]
+    subset = Document(
+        name=document.name,
+        prefix=document.prefix,
+        packages=[x for x in objects if x.object_type == "Package"],
+        objects=objects,
+        diagrams=[
+            x
+            for x in document.diagrams
+            if any(y.object_id in selected for y in x.objects)
+        ],
+    )
+    subset.version = document.version
+    subset.description = document.description
+    subset.root_item = (
+        document.root_item
+        if document.root_item in {x.name for x in selected.values()}
+        else selection.root
+    )
+    for prefix, uri in document.prefixes.items():
+        subset.add_prefix(prefix, uri)
+    logger.info(
+        f"Selected {len([x for x in selected.values() if _is_class(x)])} classes "
+        f"({len(stubs)} stubs) of {len(by_name)}"
+    )
+    return subset
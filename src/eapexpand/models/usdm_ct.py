@@ -1,11 +1,12 @@
-from __future__ import annotations
-
 """
 Handles the loading of the USDM CT
 """
 
-from dataclasses import dataclass, field
-from typing import List, Optional, Dict
+from __future__ import annotations
+
+from dataclasses import dataclass, field, fields
+from functools import cached_property
+from typing import Callable, List, Optional, Dict, Sequence, Tuple
 from dataclasses_json import config, dataclass_json
 
 
@@ -46,7 +47,40 @@ class DDFEntity:
     # assigned codelist
     codelist: Optional[CodeList] = None
 
-    @property
+    @classmethod
+    def row_decoder(cls, headers: Sequence[str]) -> Callable[[Sequence], DDFEntity]:
+        """
+        Precompile a decoder mapping a worksheet row onto a DDFEntity by column position
+        (equivalent to, but much cheaper than, `DDFEntity.from_dict(dict(zip(headers, row)))`)
+        """
+        positions = {header: idx for idx, header in enumerate(headers)}
+        columns = []
+        for _field in fields(cls):
+            _name = _field.metadata.get("dataclasses_json", {}).get("letter_case")
+            if _name is None:
+                continue
+            column = _name(_field.name)
+            if column in positions:
+                columns.append((_field.name, positions[column]))
+
+        def decode(row: Sequence) -> DDFEntity:
+            width = len(row)
+            values = dict(
+                entity_name=None,
+                logical_data_model_name=None,
+                role=None,
+                nci_c_code=None,
+                preferred_term=None,
+                raw_synonyms=None,
+            )
+            for name, idx in columns:
+                if idx < width:
+                    values[name] = row[idx]
+            return cls(**values)
+
+        return decode
+
+    @cached_property
     def synonyms(self):
         return (
             [s.strip() for s in self.raw_synonyms.split(";")]
@@ -54,7 +88,7 @@ class DDFEntity:
             else []
         )
 
-    @property
+    @cached_property
     def qualified_name(self):
         if not self.logical_data_model_name.lower().startswith(
             self.entity_name.lower()
@@ -64,37 +98,48 @@ class DDFEntity:
         else:
             return self.logical_data_model_name
 
-    @property
-    def all_attributes(self):
-        return {
+    def compile(self) -> DDFEntity:
+        """
+        Build the lookup indexes for the attributes, call once the attributes are loaded
+        * exact names take precedence over qualified (fuzzy) names for the same attribute
+        * otherwise the first match in the attributes, complex datatype relationships and
+          relationships (in that order) wins
+        """
+        index = {}
+        for attr in (
+            self.attributes
+            + self.complex_datatype_relationships
+            + self.relationships
+        ):
+            index.setdefault(attr.logical_data_model_name, (attr, False))
+            index.setdefault(attr.qualified_name, (attr, True))
+        self._index = index
+        self._all_attributes = {
             x.logical_data_model_name: x
             for x in self.attributes
             + self.relationships
             + self.complex_datatype_relationships
         }
+        return self
+
+    @property
+    def all_attributes(self):
+        if "_all_attributes" not in self.__dict__:
+            self.compile()
+        return self._all_attributes
+
+    def lookup_attribute(self, attribute_name: str) -> Tuple[Optional[DDFEntity], bool]:
+        """
+        Get the attribute by name, and whether it was a fuzzy (qualified name) match
+        """
+        if "_index" not in self.__dict__:
+            self.compile()
+        return self._index.get(attribute_name, (None, False))
 
     def get_attribute(self, attribute_name: str) -> Optional[DDFEntity]:
-        for attr in self.attributes:
-            if attr.logical_data_model_name == attribute_name:
-                return attr
-            elif attr.qualified_name == attribute_name:
-                print(f"Warning, using a fuzzy match for {attribute_name}")
-                return attr
-        for attr in self.complex_datatype_relationships:
-            if attr.logical_data_model_name == attribute_name:
-                return attr
-            elif attr.qualified_name == attribute_name:
-                print(f"Warning, using a fuzzy match for {attribute_name}")
-                return attr
-        for attr in self.relationships:
-            if attr.logical_data_model_name == attribute_name:
-                return attr
-            elif attr.qualified_name == attribute_name:
-                print(f"Warning, using a fuzzy match for {attribute_name}")
-                return attr
-        return None
+        return self.lookup_attribute(attribute_name)[0]
 
-    @property
+    @cached_property
     def has_value_list(self) -> bool:
         if self.value_list:
             if self.value_list.startswith("Y"):
@@ -104,7 +149,7 @@ class DDFEntity:
         else:
             return False
 
-    @property
+    @cached_property
     def external_code_list(self):
         if self.has_value_list:
             _value = None
@@ -124,7 +169,7 @@ class DDFEntity:
                 _value = self.value_list.split("(")[1].split(" ")[-1][:-1]
             return _value
 
-    @property
+    @cached_property
     def codelist_code(self) -> Optional[str]:
         if self.has_value_list:
             c_code = None
@@ -196,6 +241,8 @@ class CodeList:
     items: List[PermissibleValue] = field(default_factory=list)
     alternate_name: Optional[str] = None
     preferred_term: Optional[str] = None
+    # the CDISC Library package the codelist was retrieved from
+    source_package: Optional[str] = None
 
     def add_item(self, item: PermissibleValue):
         self.items.append(item)
@@ -228,6 +275,33 @@ class PermissibleValue:
     submission_value: Optional[str] = None
     extensible: Optional[bool] = False
 
+    @classmethod
+    def row_decoder(cls, has_extensible=False) -> Callable[[Sequence], PermissibleValue]:
+        """
+        Precompile a decoder mapping a value sets row onto a PermissibleValue
+        """
+        if has_extensible:
+            project, entity, attribute, codelist, extensible, concept, term, synonyms, definition = range(9)
+        else:
+            project, entity, attribute, codelist, concept, term, synonyms, definition = range(8)
+            extensible = None
+
+        def decode(row: Sequence) -> PermissibleValue:
+            _synonyms = row[synonyms]
+            return cls(
+                project=row[project],
+                entity_name=row[entity],
+                attribute_name=row[attribute],
+                codelist_c_code=row[codelist],
+                extensible=row[extensible] == "Yes" if extensible is not None else False,
+                concept_c_code=row[concept],
+                preferred_term=row[term],
+                synonyms=[s.strip() for s in _synonyms.split(";")] if _synonyms else [],
+                definition=row[definition],
+            )
+
+        return decode
+
     @classmethod
     def from_row(cls, row, has_extensible=False):
         synonyms = []
@@ -258,3 +332,26 @@ class PermissibleValue:
                 synonyms=synonyms,
                 definition=row[7],
             )
+
+
+@dataclass
+class FuzzyMatch:
+    """
+    A model attribute matched to a CT attribute by its qualified name
+    """
+
+    entity_name: str
+    attribute_name: str
+    matched_name: str
+
+
+@dataclass
+class MergeReport:
+    """
+    The outcome of merging the CT content into the model
+    """
+
+    merged_classes: List[str] = field(default_factory=list)
+    fuzzy_matches: List[FuzzyMatch] = field(default_factory=list)
+    unmatched_classes: List[str] = field(default_factory=list)
+    unmatched_attributes: List[Tuple[str, str]] = field(default_factory=list)
@@ -0,0 +1,334 @@
+"""
+The output aspects (renderers) of a loaded model, and their fan-out to worker processes
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Any, Callable, Dict, List, Optional
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+from eapexpand.models.eap import Document
+from eapexpand.render.context import RenderContext
+from eapexpand.render.fragment_cache import FragmentCache
+
+
+@dataclass
+class RenderSnapshot:
+    """
+    The loaded model the aspects are rendered from; it is not changed by the renderers, so the
+    workers share it (copy-on-write) when they are forked, along with the data the renderers
+    derive from it (the render context)
+
+    Attributes:
+        document (Document): The loaded (and CT merged) document.
+        ct_content (Optional[dict]): The loaded controlled terms (for USDM).
+        codelists (Optional[dict]): The loaded codelists (for USDM).
+        schema_id (Optional[str]): The id for the LinkML schema.
+        linkml_partition (Optional[Dict[str, str]]): The LinkML module for a package.
+        linkml_cache (bool): Use the cache of rendered LinkML fragments.
+        workbook_workers (Optional[int]): Serialise the workbook sheets in this many processes.
+        pydantic_templates (Optional[str]): The templates overriding the `gen-pydantic` templates.
+        shapes_format (str): The RDF format for the SHACL shapes (`turtle` or `nt`).
+    """
+
+    document: Document
+    ct_content: Optional[dict] = None
+    codelists: Optional[dict] = None
+    schema_id: Optional[str] = None
+    linkml_partition: Optional[Dict[str, str]] = None
+    linkml_cache: bool = False
+    workbook_workers: Optional[int] = None
+    pydantic_templates: Optional[str] = None
+    shapes_format: str = "turtle"
+
+    @property
+    def usdm(self) -> bool:
+        return self.ct_content is not None
+
+    @property
+    def name(self) -> str:
+        return self.document.name
+
+    @cached_property
+    def context(self) -> RenderContext:
+        """
+        The derived data shared by the renderers; each rendering runs with its own `run` context
+        """
+        return RenderContext(self.document, ct_content=self.ct_content)
+
+
+@dataclass
+class AspectResult:
+    """
+    The outcome of rendering an aspect
+
+    Attributes:
+        aspect (str): The aspect.
+        elapsed (float): The time taken, in seconds.
+        error (Optional[str]): The traceback, if the rendering failed.
+    """
+
+    aspect: str
+    elapsed: float = 0.0
+    error: Optional[str] = None
+
+
+def _prisma(snapshot: RenderSnapshot, output_dir: str) -> None:
+    from eapexpand.render.render_prisma import generate
+
+    generate(snapshot.name, snapshot.document, output_dir, context=snapshot.context.run())
+
+
+def _sqlite(snapshot: RenderSnapshot, output_dir: str) -> None:
+    from eapexpand.render.render_sqlite import generate
+
+    generate(snapshot.name, snapshot.document, output_dir, context=snapshot.context.run())
+
+
+def _fragment_cache(snapshot: RenderSnapshot, output: str) -> Optional[FragmentCache]:
+    # a cache file per output, the outputs may be rendered concurrently
+    return FragmentCache(snapshot.name, output=output) if snapshot.linkml_cache else None
+
+
+def _linkml(snapshot: RenderSnapshot, output_dir: str) -> None:
+    from eapexpand.render.linkml_emitter import generate
+
+    generate(
+        name=snapshot.name,
+        document=snapshot.document,
+        schema_id=snapshot.schema_id,
+        output_dir=output_dir,
+        cache=_fragment_cache(snapshot, "linkml"),
+        context=snapshot.context.run(),
+    )
+
+
+def _linkml_modules(snapshot: RenderSnapshot, output_dir: str) -> None:
+    from eapexpand.render.linkml_modules import generate
+
+    generate(
+        name=snapshot.name,
+        document=snapshot.document,
+        schema_id=snapshot.schema_id,
+        output_dir=output_dir,
+        partition=snapshot.linkml_partition,
+        cache=_fragment_cache(snapshot, "linkml_modules"),
+        context=snapshot.context.run(),
+    )
+
+
+def _jsonschema(snapshot: RenderSnapshot, output_dir: str) -> None:
+    from eapexpand.render.render_jsonschema import generate
+
+    generate(
+        name=snapshot.name,
+        document=snapshot.document,
+        schema_id=snapshot.schema_id,
+        output_dir=output_dir,
+        context=snapshot.context.run(),
+    )
+
+
+def _pydantic(snapshot: RenderSnapshot, output_dir: str) -> None:
+    from eapexpand.render.render_pydantic import generate
+
+    generate(
+        name=snapshot.name,
+        document=snapshot.document,
+        schema_id=snapshot.schema_id,
+        output_dir=output_dir,
+        template_dir=snapshot.pydantic_templates,
+        cache=_fragment_cache(snapshot, "pydantic"),
+        context=snapshot.context.run(),
+    )
+
+
+def _shapes(snapshot: RenderSnapshot, output_dir: str) -> None:
+    from eapexpand.render.render_shapes import generate
+
+    generate(
+        snapshot.name,
+        snapshot.document,
+        ct_content=snapshot.ct_content,
+        codelists=snapshot.codelists,
+        output_dir=output_dir,
+        schema_id=snapshot.schema_id,
+        format=snapshot.shapes_format,
+        context=snapshot.context.run(),
+    )
+
+
+def _site(snapshot: RenderSnapshot, output_dir: str) -> None:
+    from eapexpand.render.render_site import generate
+
+    generate(
+        snapshot.name,
+        snapshot.document,
+        output_dir=output_dir,
+        context=snapshot.context.run(),
+    )
+
+
+def _diagrams(snapshot: RenderSnapshot, output_dir: str) -> None:
+    from eapexpand.render.render_svg import generate
+
+    generate(snapshot.name, snapshot.document, output_dir=output_dir)
+
+
+def _tabular(delimiter: str) -> Callable[[RenderSnapshot, str], None]:
+    def _render(snapshot: RenderSnapshot, output_dir: str) -> None:
+        from eapexpand.render.render_tabular import generate
+
+        generate(
+            snapshot.name,
+            snapshot.document,
+            snapshot.ct_content,
+            snapshot.codelists,
+            output_dir,
+            delimiter=delimiter,
+            context=snapshot.context.run(),
+        )
+
+    return _render
+
+
+def _workbook(snapshot: RenderSnapshot, output_dir: str) -> None:
+    if snapshot.usdm:
+        from eapexpand.render.render_usdm_workbook import generate
+
+        generate(
+            snapshot.name,
+            snapshot.document,
+            snapshot.ct_content,
+            snapshot.codelists,
+            output_dir,
+            workers=snapshot.workbook_workers,
+            context=snapshot.context.run(),
+        )
+    else:
+        from eapexpand.render.render_workbook import generate
+
+        generate(
+            snapshot.name,
+            snapshot.document,
+            output_dir=output_dir,
+            context=snapshot.context.run(),
+        )
+
+
+# the renderer for each aspect
+ASPECTS: Dict[str, Callable[[RenderSnapshot, str], None]] = {
+    "prisma": _prisma,
+    "sqlite": _sqlite,
+    "linkml": _linkml,
+    "linkml_modules": _linkml_modules,
+    "jsonschema": _jsonschema,
+    "pydantic": _pydantic,
+    "shapes": _shapes,
+    "site": _site,
+    "diagrams": _diagrams,
+    "csv": _tabular(","),
+    "tsv": _tabular("\t"),
+    "workbook": _workbook,
+}
+
+
+def render_aspect(aspect: str, snapshot: RenderSnapshot, output_dir: str) -> AspectResult:
+    """
+    Render an aspect, timing it
+    """
+    start = time.perf_counter()
+    ASPECTS[aspect](snapshot, output_dir)
+    return AspectResult(aspect, elapsed=time.perf_counter() - start)
+
+
+# the snapshot in a worker process, as handed over by the initializer
+_worker_snapshot: Optional[RenderSnapshot] = None
+
+
+def _init_worker(snapshot: RenderSnapshot) -> None:
+    global _worker_snapshot
+    _worker_snapshot = snapshot
+
+
+def _render_in_worker(aspect: str, output_dir: str) -> AspectResult:
+    start = time.perf_counter()
+    try:
+        return render_aspect(aspect, _worker_snapshot, output_dir)
+    except Exception:
+        return AspectResult(
+            aspect, elapsed=time.perf_counter() - start, error=traceback.format_exc()
+        )
+
+
+def _mp_context() -> Any:
+    # forked workers share the snapshot copy-on-write, otherwise it is pickled to each worker
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+
+def render_aspects(
+    aspects: List[str],
+    snapshot: RenderSnapshot,
+    output_dir: str,
+    parallel: bool = False,
+    max_workers: Optional[int] = None,
+) -> List[AspectResult]:
+    """
+    Render the aspects; in parallel mode each aspect is rendered in a worker process, and the
+    failures are collected rather than raised
+    :param aspects: The aspects to render
+    :param snapshot: The loaded model
+    :param output_dir: The output directory
+    :param parallel: Render each aspect in a worker process
+    :param max_workers: The number of worker processes (defaults to one per aspect)
+    :returns: the results, in the order of the aspects
+    """
+    for aspect in aspects:
+        if aspect not in ASPECTS:
+            raise ValueError(f"Unknown aspect: {aspect}")
+    os.makedirs(output_dir, exist_ok=True)
+    if not parallel or len(aspects) < 2:
+        return [render_aspect(aspect, snapshot, output_dir) for aspect in aspects]
+    # derive the shared data once, rather than in each worker
+    snapshot.context.prepare()
+    with ProcessPoolExecutor(
+        max_workers=min(max_workers or len(aspects), len(aspects)),
+        mp_context=_mp_context(),
+        initializer=_init_worker,
+        initargs=(snapshot,),
+    ) as executor:
+        futures = [executor.submit(_render_in_worker, x, output_dir) for x in aspects]
+        results = []
+        for aspect, future in zip(aspects, futures):
+            try:
+                results.append(future.result())
+            except Exception:
+                # the worker died (or the result could not be returned)
+                results.append(AspectResult(aspect, error=traceback.format_exc()))
+    for result in results:
+        if result.error:
+            logger.error(f"Rendering {result.aspect} failed:\n{result.error}")
+        else:
+            logger.info(f"Rendered {result.aspect} in {result.elapsed:.2f}s")
+    return results
+
+
+def check_results(results: List[AspectResult]) -> None:
+    """
+    Raise an error naming the aspects that failed to render
+    """
+    failed = [x.aspect for x in results if x.error]
+    if failed:
+        raise RuntimeError(f"Failed to render: {', '.join(failed)}")
@@ -0,0 +1,270 @@
+"""
+The per-run state of the renderers, and the data derived from a document that the renderers
+share; nothing a renderer learns while rendering a document is held at module level, so
+documents can be rendered concurrently (or one after another) in a process
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field, fields
+from functools import cached_property
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple, Union
+
+from eapexpand.models.eap import Attribute, Connector, Document, Object
+from eapexpand.models.usdm_ct import CodeList, DDFEntity
+
+IDENTIFIER_TYPES = ("id", "uuid")
+
+# the (LinkML) ranges for the model datatypes; read only, the classes of a document are added
+# to the mapping of the render context
+TYPE_MAPPING: Mapping[str, str] = MappingProxyType(
+    {
+        "String": "string",
+        "string": "string",
+        "Integer": "integer",
+        "Boolean": "boolean",
+        "Float": "float",
+        "Date": "date",
+    }
+)
+
+
+def codelist_enum_name(codelist: CodeList) -> str:
+    """
+    The enumeration name for a codelist
+    """
+    if codelist.preferred_term:
+        return "".join(codelist.preferred_term.split())
+    return f"{codelist.entity_name}{codelist.attribute_name.capitalize()}"
+
+
+def attribute_range(attr: Union[Attribute, Connector]) -> Tuple[Optional[str], bool]:
+    """
+    The (unmapped) type of an attribute and whether it is a list, eg `List<Code>` is `Code`
+    """
+    _type = attr.attribute_type
+    if _type and "List" in _type:
+        return _type.split("<")[1].split(">")[0], True
+    return _type, False
+
+
+def _missing_references() -> Dict[str, list]:
+    return {"objects": [], "attributes": [], "connections": []}
+
+
+@dataclass
+class RenderContext:
+    """
+    The state of rendering a document; the data derived from the document (partitions, ranges,
+    inheritance, CT joins and enumeration names) is computed once, on first use, and is shared by
+    the contexts for each rendering (see `run`), while the state collected in a rendering is not
+
+    Attributes:
+        document (Document): The document being rendered.
+        ct_content (Optional[Dict[str, DDFEntity]]): The loaded controlled terms (for USDM).
+        type_mapping (Dict[str, str]): The range for a type; the datatypes and the classes.
+        missing_types (List[str]): The types referenced before (or without) being added to the
+            type mapping.
+        missing_references (Dict[str, list]): The classes, attributes and connections missing
+            from the CT.
+        memo (Dict[Any, Any]): Values computed by a renderer in a rendering, eg enumerations.
+    """
+
+    document: Document
+    ct_content: Optional[Dict[str, DDFEntity]] = None
+    type_mapping: Dict[str, str] = field(default_factory=lambda: dict(TYPE_MAPPING))
+    missing_types: List[str] = field(default_factory=list)
+    missing_references: Dict[str, list] = field(default_factory=_missing_references)
+    memo: Dict[Any, Any] = field(default_factory=dict)
+
+    def __post_init__(self):
+        # the classes are types
+        for obj in self.classes:
+            self.type_mapping.setdefault(obj.name, obj.name)
+
+    def __getstate__(self) -> dict:
+        # the derived data is keyed by object identity, so it is derived again once unpickled
+        return {x.name: self.__dict__[x.name] for x in fields(self)}
+
+    def run(self) -> RenderContext:
+        """
+        A context for a rendering, sharing the derived data of this context
+        """
+        context = object.__new__(type(self))
+        # a shallow copy, holding the derived data of this context
+        context.__dict__.update(self.__dict__)
+        context.type_mapping = dict(self.type_mapping)
+        context.missing_types = []
+        context.missing_references = _missing_references()
+        context.memo = {}
+        return context
+
+    def prepare(self) -> RenderContext:
+        """
+        Compute all the derived data, eg before the context is shared with worker processes
+        """
+        for name in (
+            "objects",
+            "partitions",
+            "inherited_attributes",
+            "ranges",
+            "ct_entities",
+            "ct_attributes",
+            "enums",
+        ):
+            getattr(self, name)
+        return self
+
+    @cached_property
+    def objects(self) -> Dict[int, Object]:
+        """
+        The objects of the document, by object id
+        """
+        return {x.object_id: x for x in self.document.objects}
+
+    @cached_property
+    def classes(self) -> List[Object]:
+        """
+        The classes of the document, in document order
+        """
+        return [x for x in self.document.objects if x.object_type == "Class"]
+
+    @cached_property
+    def packages(self) -> Dict[int, Object]:
+        """
+        The packages, by package id
+        """
+        return {x.package_id: x for x in self.document.objects if x.object_type == "Package"}
+
+    @cached_property
+    def partitions(self) -> Dict[str, List[Object]]:
+        """
+        The objects in a package, by package name
+        """
+        partitions = {}
+        for _object in self.document.objects:
+            if _object.package_id in self.packages:
+                partitions.setdefault(self.packages[_object.package_id].name, []).append(_object)
+        return partitions
+
+    @cached_property
+    def orphans(self) -> List[Object]:
+        """
+        The objects that are not in a package
+        """
+        return [x for x in self.document.objects if x.package_id not in self.packages]
+
+    @cached_property
+    def attributes(self) -> Dict[int, List[Union[Attribute, Connector]]]:
+        """
+        The attributes and associations of each class, by object id
+        """
+        return {x.object_id: x.all_attributes for x in self.classes}
+
+    @cached_property
+    def superclasses(self) -> Dict[int, Object]:
+        """
+        The superclass of each (specialised) class, by object id
+        """
+        return {
+            x.object_id: self.objects.get(
+                x.generalizations[0].end_object_id, x.generalizations[0].target_object
+            )
+            for x in self.classes
+            if x.generalizations
+        }
+
+    @cached_property
+    def inherited_attributes(self) -> Dict[int, List[Union[Attribute, Connector]]]:
+        """
+        The attributes of each class, including those inherited from the superclasses
+        """
+        return {x.object_id: x.attributes for x in self.classes}
+
+    @cached_property
+    def ranges(self) -> Dict[int, Tuple[Optional[str], bool]]:
+        """
+        The (unmapped) type of each attribute and whether it is a list, by the id of the attribute
+        """
+        return {
+            id(attr): attribute_range(attr)
+            for attributes in self.attributes.values()
+            for attr in attributes
+        }
+
+    @cached_property
+    def ct_entities(self) -> Dict[int, Optional[DDFEntity]]:
+        """
+        The CT entity the attributes of a class are resolved against (that of the superclass for
+        a specialised class), by object id; the classes missing from the CT are not included
+        """
+        if not self.ct_content:
+            return {}
+        entities = {}
+        for obj in self.classes:
+            if obj.name not in self.ct_content:
+                continue
+            superclass = self.superclasses.get(obj.object_id)
+            entities[obj.object_id] = self.ct_content.get(
+                superclass.name if superclass else obj.name
+            )
+        return entities
+
+    @cached_property
+    def ct_attributes(self) -> Dict[Tuple[int, int], Optional[DDFEntity]]:
+        """
+        The CT attribute for each attribute and association of the classes joined to the CT, by
+        the object id and the id of the attribute (an inherited attribute is resolved against the
+        CT entity of each class); None where the CT entity has no such attribute
+        """
+        joined = {}
+        for object_id, entity in self.ct_entities.items():
+            if entity is None:
+                continue
+            obj = self.objects[object_id]
+            for attr in self.inherited_attributes[object_id] + obj.outgoing_connections:
+                joined.setdefault((object_id, id(attr)), entity.get_attribute(attr.name))
+        return joined
+
+    @cached_property
+    def codelists(self) -> Dict[int, CodeList]:
+        """
+        The codelists of the attributes, by the id of the codelist, in document order
+        """
+        codelists = {}
+        for attributes in self.attributes.values():
+            for attr in attributes:
+                if attr.codelist:
+                    codelists.setdefault(id(attr.codelist), attr.codelist)
+        return codelists
+
+    @cached_property
+    def enum_names(self) -> Dict[int, str]:
+        """
+        The enumeration name for each codelist, by the id of the codelist
+        """
+        return {key: codelist_enum_name(x) for key, x in self.codelists.items()}
+
+    @cached_property
+    def enums(self) -> Dict[str, CodeList]:
+        """
+        The codelist for each enumeration; the first codelist with a name is used
+        """
+        enums = {}
+        for key, codelist in self.codelists.items():
+            enums.setdefault(self.enum_names[key], codelist)
+        return enums
+
+    def range_for(self, type_name: str) -> str:
+        """
+        The range for a type, the type itself if it is not mapped
+        """
+        return self.type_mapping.get(type_name, type_name)
+
+    def is_inherited(self, obj: Object, attribute: Attribute) -> bool:
+        """
+        Is the attribute one of the superclass attributes
+        """
+        superclass = self.superclasses.get(obj.object_id)
+        return superclass is not None and attribute in superclass.object_attributes
@@ -0,0 +1,154 @@
+"""
+On disk cache of the rendered LinkML class fragments, keyed by a fingerprint of the class inputs
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import pickle
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+from eapexpand.helpers.ct_cache import default_cache_dir
+from eapexpand.models.eap import Attribute, Connector, Object
+from eapexpand.models.usdm_ct import CodeList
+
+# bump when the rendered fragments change
+CACHE_VERSION = 1
+
+
+def _codelist_inputs(codelist: CodeList) -> list:
+    return [
+        codelist.concept_c_code,
+        codelist.preferred_term,
+        codelist.synonyms,
+        codelist.definition,
+        codelist.entity_name,
+        codelist.attribute_name,
+        [
+            (x.concept_c_code, x.preferred_term, x.synonyms, x.definition)
+            for x in codelist.items
+        ],
+    ]
+
+
+def _attribute_inputs(attr: Union[Attribute, Connector]) -> list:
+    values = [
+        type(attr).__name__,
+        attr.name,
+        attr.reference_url,
+        attr.description,
+        attr.attribute_type,
+        attr.preferred_term,
+        attr.synonyms,
+    ]
+    if isinstance(attr, Connector):
+        values.extend([attr.multivalued, attr.optional])
+    else:
+        values.extend([attr.lower_bound, attr.upper_bound])
+    values.append(_codelist_inputs(attr.codelist) if attr.codelist else None)
+    return values
+
+
+def class_fingerprint(
+    obj: Object,
+    context: Any = None,
+    attributes: Optional[List[Union[Attribute, Connector]]] = None,
+) -> str:
+    """
+    The fingerprint of everything the fragment for a class is rendered from; the class, its
+    attributes and associations, as enriched from the CT (and the API metadata), and the codelists
+    :param obj: The class
+    :param context: Any other (JSON serialisable) input to the rendering, eg the type mapping
+    :param attributes: The attributes and associations of the class, if already collected
+    """
+    if attributes is None:
+        attributes = obj.all_attributes
+    content = [
+        CACHE_VERSION,
+        context,
+        obj.name,
+        obj.description,
+        obj.reference_url,
+        obj.preferred_term,
+        obj.synonyms,
+        obj.generalizations[0].target_object.name if obj.generalizations else None,
+        bool(obj.specializations),
+        [_attribute_inputs(x) for x in attributes],
+    ]
+    return hashlib.sha256(
+        json.dumps(content, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+class FragmentCache:
+    """
+    Caches the rendered fragments for a schema; the entries not used in a run are dropped when
+    the cache is saved, so each output (eg `linkml` or `pydantic`) has its own cache file, and
+    the outputs rendered concurrently don't overwrite each other's entries
+
+    Methods:
+        get(fingerprint) -> Optional[Any]:
+            Returns the cached fragment.
+        put(fingerprint, fragment):
+            Caches the fragment.
+        save():
+            Writes the fragments used in this run.
+    """
+
+    def __init__(self, name: str, cache_dir: Optional[str] = None, output: Optional[str] = None):
+        cache_dir = Path(cache_dir) if cache_dir else default_cache_dir() / "linkml"
+        self.path = cache_dir / (f"{name}.{output}.pickle" if output else f"{name}.pickle")
+        self.hits = 0
+        self.misses = 0
+        self._entries = self._read()
+        self._used: Dict[str, Any] = {}
+
+    def _read(self) -> Dict[str, Any]:
+        if not self.path.is_file():
+            return {}
+        try:
+            with open(self.path, "rb") as fh:
+                content = pickle.load(fh)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as exc:
+            logger.warning(f"Ignoring unreadable fragment cache {self.path}: {exc}")
+            return {}
+        if content.get("version") != CACHE_VERSION:
+            return {}
+        return content["fragments"]
+
+    def get(self, fingerprint: str) -> Optional[Any]:
+        fragment = self._entries.get(fingerprint)
+        if fragment is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._used[fingerprint] = fragment
+        return fragment
+
+    def put(self, fingerprint: str, fragment: Any) -> None:
+        self._used[fingerprint] = fragment
+
+    def save(self) -> Path:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # written aside and renamed into place, so a reader never sees a partial file
+        _tmp = self.path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(_tmp, "wb") as fh:
+            pickle.dump(
+                dict(version=CACHE_VERSION, fragments=self._used),
+                fh,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(_tmp, self.path)
+        logger.info(
+            f"Rendered {self.misses} of {self.hits + self.misses} class fragments "
+            f"({self.hits} cached)"
+        )
+        return self.path
@@ -0,0 +1,603 @@
+"""
+Emit the LinkML schema for a model directly as plain dictionaries
+
+The output matches `render_linkml.generate_schema_builder` (the `SchemaBuilder` output compacted
+by `as_dict`), without building and then serialising the metamodel objects
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+import yaml
+
+from eapexpand.models.eap import Attribute, Connector, Document, Object
+from eapexpand.models.usdm_ct import CodeList
+from eapexpand.render.fragment_cache import FragmentCache, class_fingerprint
+from eapexpand.render.context import (
+    IDENTIFIER_TYPES,
+    TYPE_MAPPING,
+    RenderContext,
+    attribute_range,
+    codelist_enum_name,
+)
+
+
+
+class _SchemaDumper(yaml.Dumper):
+    """
+    The elements share lists (eg synonyms) with the model, which are written out in full
+    """
+
+    def ignore_aliases(self, data):
+        return True
+
+
+if getattr(yaml, "CDumper", None) is not None:
+
+    class _FastSchemaDumper(yaml.CDumper):
+        def ignore_aliases(self, data):
+            return True
+
+else:
+    _FastSchemaDumper = _SchemaDumper
+
+# the width of the (top level) document, the elements are written indented
+YAML_WIDTH = 80
+ELEMENT_INDENT = 2
+
+# the key order follows the LinkML metamodel
+SCHEMA_KEYS = ("name", "id", "imports", "prefixes", "default_prefix", "default_range", "enums", "classes")
+CLASS_KEYS = ("definition_uri", "description", "title", "aliases", "is_a", "abstract", "attributes")
+SLOT_KEYS = (
+    "definition_uri",
+    "description",
+    "title",
+    "aliases",
+    "identifier",
+    "range",
+    "required",
+    "multivalued",
+    "inlined",
+    "inlined_as_list",
+    "minimum_cardinality",
+    "any_of",
+)
+ENUM_KEYS = ("definition_uri", "description", "title", "aliases", "enum_uri", "code_set", "permissible_values")
+PV_KEYS = ("description", "meaning", "title", "aliases")
+
+# the superclasses that are represented as a union of their subclasses
+SCHEDULED_INSTANCES = ["ScheduledInstance", "ScheduledDecisionInstance", "ScheduledActivityInstance"]
+
+
+def _element(keys: Iterable[str], values: Dict[str, Any]) -> dict:
+    """
+    The element in metamodel key order, dropping the empty (unset) values
+    """
+    element = {}
+    for key in keys:
+        value = values.get(key)
+        if value is None or (isinstance(value, (list, dict)) and not value):
+            continue
+        element[key] = value
+    return element
+
+
+def _slot(**values) -> dict:
+    return _element(SLOT_KEYS, values)
+
+
+def _definition_uri(reference_url: Optional[str]) -> Optional[str]:
+    if not reference_url:
+        return None
+    if reference_url.startswith("C") and reference_url != "CNEW":
+        # if a NCI C-code
+        return "ncit:" + reference_url
+    # a verbatim reference url
+    return reference_url
+
+
+def builtin_classes() -> Dict[str, dict]:
+    """
+    The Message, Code, AliasCode and Rule classes that every USDM schema carries
+    """
+    _id = _slot(
+        description="One or more characters used to identify, name, or characterize the nature, properties, or contents of a thing.",
+        range="string",
+        required=False,
+    )
+    return {
+        "Message": _element(
+            CLASS_KEYS,
+            dict(
+                description="A USDM message",
+                attributes={
+                    "study": _slot(range="Study", required=True, inlined=True),
+                    "usdmVersion": _slot(range="string", required=True),
+                    "systemVersion": _slot(range="string", required=True),
+                    "systemName": _slot(range="string", required=True),
+                },
+            ),
+        ),
+        "Code": _element(
+            CLASS_KEYS,
+            dict(
+                description="A USDM Code Reference",
+                attributes={
+                    "id": dict(_id),
+                    "code": _slot(range="string", required=True, description="The literal value of a code."),
+                    "codeSystem": _slot(
+                        range="string",
+                        required=True,
+                        description="The literal identifier (i.e., distinctive designation) of the system used to assign and/or manage codes.",
+                    ),
+                    "codeSystemVersion": _slot(
+                        range="string", required=True, description="The version of the code system."
+                    ),
+                    "decode": _slot(
+                        range="string",
+                        required=True,
+                        description="Standardized or dictionary-derived human readable text associated with a code.",
+                    ),
+                },
+            ),
+        ),
+        "AliasCode": _element(
+            CLASS_KEYS,
+            dict(
+                description="An alias for a USDM Code",
+                abstract=True,
+                attributes={
+                    "id": dict(_id),
+                    "standardCodeAliases": _slot(
+                        range="Code",
+                        multivalued=True,
+                        description="Other terms by which the standard code is known",
+                    ),
+                },
+            ),
+        ),
+        "Rule": _element(
+            CLASS_KEYS,
+            dict(
+                description="A USDM CDISC Core rule",
+                attributes={
+                    "text": _slot(range="string", description="Verbatim Text describing the rule", required=True),
+                    "resultType": _slot(description="Type of Result (WARNING/ERROR)", range="string", required=True),
+                    "targetEntities": _slot(description="Entities to which this rule applies", range="string", minimum_cardinality=0),
+                    "targetAttributes": _slot(description="Entity attributes to which this rule applies", range="string", minimum_cardinality=0),
+                    "coreRuleId": _slot(description="CORE Rule Identifier", range="string", required=True),
+                    "checkId": _slot(description="Check Identifier", range="string", required=True),
+                },
+            ),
+        ),
+    }
+
+
+def codelist_enum(codelist: CodeList) -> dict:
+    """
+    The enumeration for a codelist
+    """
+    values = dict(
+        title=codelist.preferred_term if codelist.preferred_term else codelist.attribute_name,
+        aliases=codelist.synonyms or None,
+        description=codelist.definition,
+    )
+    if " " in codelist.concept_c_code:
+        logger.warning(f"Concept code contains a space: {codelist.concept_c_code}")
+    else:
+        values["definition_uri"] = "ncit:" + codelist.concept_c_code
+        values["enum_uri"] = "ncit:" + codelist.concept_c_code
+        values["code_set"] = codelist.concept_c_code
+    permissible_values = {}
+    for pv in codelist.items:
+        text = pv.preferred_term if pv.preferred_term else str(pv.preferred_term)
+        permissible_values[text] = _element(
+            PV_KEYS,
+            dict(
+                meaning="ncit:" + pv.concept_c_code,
+                title=pv.preferred_term or None,
+                aliases=pv.synonyms or None,
+                description=pv.definition or None,
+            ),
+        )
+    values["permissible_values"] = permissible_values
+    return _element(ENUM_KEYS, values)
+
+
+@dataclass
+class ClassFragment:
+    """
+    The schema elements contributed by a class; the class itself, the AliasCode classes and the
+    enumerations for its codelists and the (non-class) types it references
+
+    Attributes:
+        name (str): The name of the class.
+        classes (Dict[str, dict]): The classes, in schema order.
+        enums (Dict[str, dict]): The enumerations, in schema order.
+        types (List[str]): The referenced attribute types.
+        rendered (Dict[Tuple[str, str], str]): The YAML for the elements, by section and name.
+    """
+
+    name: str
+    classes: Dict[str, dict] = field(default_factory=dict)
+    enums: Dict[str, dict] = field(default_factory=dict)
+    types: List[str] = field(default_factory=list)
+    rendered: Dict[Tuple[str, str], str] = field(default_factory=dict)
+
+    def render(self) -> None:
+        """
+        Render the YAML for the enumerations and classes
+        """
+        for section in ("enums", "classes"):
+            for name, element in getattr(self, section).items():
+                self.rendered[(section, name)] = dump_element(name, element)
+
+
+def _range_for(type_name: str, context: Optional[RenderContext] = None) -> str:
+    """
+    The range for a type, from the type mapping of the context, if supplied
+    """
+    if context is not None:
+        return context.range_for(type_name)
+    return TYPE_MAPPING.get(type_name, type_name)
+
+
+def _attribute_slot(
+    obj: Object,
+    attr: Union[Attribute, Connector],
+    fragment: ClassFragment,
+    context: Optional[RenderContext] = None,
+) -> Tuple[str, dict]:
+    """
+    The name and definition of the slot for an attribute (or association); the range, enumeration
+    name and enumeration are those of the context, if supplied
+    """
+    values = dict(multivalued=False)
+    if attr.name == "name":
+        # attribute name where "name" gets blitzed, eg protocolVersion
+        _name = obj.name.lower() + attr.name.capitalize()
+        values.update(aliases=["name"], required=False)
+    else:
+        _name = attr.name
+    values["definition_uri"] = _definition_uri(attr.reference_url)
+    if attr.description:
+        values["description"] = attr.description
+    if attr.attribute_type:
+        if context is not None:
+            _attr_type, _listed = context.ranges[id(attr)]
+        else:
+            _attr_type, _listed = attribute_range(attr)
+        # Multivalued attributes are represented as lists
+        if _listed:
+            values.update(multivalued=True, inlined_as_list=True)
+            fragment.types.append(_attr_type)
+            values["range"] = _range_for(_attr_type, context)
+        else:
+            fragment.types.append(attr.attribute_type)
+            # NOTE: the different types of superclass
+            if attr.attribute_type in SCHEDULED_INSTANCES:
+                values["any_of"] = [{"range": x} for x in SCHEDULED_INSTANCES]
+            elif attr.attribute_type in ["StudySite" "StudyCohort"]:
+                values["any_of"] = [
+                    {"range": x} for x in ["StudySite", "StudyCohort", "GeographicScope"]
+                ]
+            else:
+                values["range"] = _range_for(attr.attribute_type, context)
+    if attr.name in IDENTIFIER_TYPES:
+        values["identifier"] = True
+    if isinstance(attr, (Connector,)):
+        # Connector uses cardinality
+        if attr.multivalued:
+            values.update(multivalued=True, inlined_as_list=True)
+        else:
+            values.update(multivalued=False, inlined=True)
+        values["required"] = not attr.optional
+    else:
+        # Attribute uses the lower_bound and upper_bound
+        if attr.lower_bound == "1":
+            values["required"] = True
+        if attr.upper_bound == "1":
+            values.update(multivalued=False, inlined=True)
+        else:
+            values.update(multivalued=True, inlined_as_list=True)
+    if attr.preferred_term:
+        values["title"] = attr.preferred_term
+    if attr.synonyms:
+        values["aliases"] = attr.synonyms
+    if attr.codelist:
+        # are there code values for this attribute?
+        _codelist = attr.codelist  # type: CodeList
+        if context is not None:
+            _codelist_name = context.enum_names[id(_codelist)]
+        else:
+            _codelist_name = codelist_enum_name(_codelist)
+        if _codelist_name not in fragment.enums:
+            if context is not None:
+                # a codelist is rendered once, however many attributes use it
+                _key = ("linkml enum", id(_codelist))
+                if _key not in context.memo:
+                    context.memo[_key] = codelist_enum(_codelist)
+                fragment.enums[_codelist_name] = context.memo[_key]
+            else:
+                fragment.enums[_codelist_name] = codelist_enum(_codelist)
+        if attr.attribute_type == "AliasCode":
+            fragment.classes[f"{_codelist_name}AliasCode"] = _element(
+                CLASS_KEYS,
+                dict(
+                    description=f"An alias for a {_codelist_name} code",
+                    is_a="AliasCode",
+                    attributes={
+                        "standardCode": _slot(
+                            range=f"{_codelist_name}",
+                            required=True,
+                            description="The standard code",
+                        )
+                    },
+                ),
+            )
+            values["range"] = f"{_codelist_name}AliasCode"
+        else:
+            values["range"] = _codelist_name
+    return _name, _slot(**values)
+
+
+def class_fragment(obj: Object, context: Optional[RenderContext] = None) -> ClassFragment:
+    """
+    Render a class (and the enumerations and AliasCode classes for its codelists)
+    :param obj: The class
+    :param context: The render context (for the precomputed attributes, ranges and enumerations)
+    """
+    fragment = ClassFragment(obj.name)
+    values = dict(
+        description=obj.description or None,
+        definition_uri=_definition_uri(obj.reference_url),
+        title=obj.preferred_term or None,
+        aliases=obj.synonyms or None,
+    )
+    if context is not None:
+        superclass = context.superclasses.get(obj.object_id)
+        if superclass is not None:
+            values["is_a"] = superclass.name
+        all_attributes = context.attributes[obj.object_id]
+    else:
+        if obj.generalizations:
+            values["is_a"] = obj.generalizations[0].target_object.name
+        all_attributes = obj.all_attributes
+    if obj.specializations:
+        # make super classes abstract
+        values["abstract"] = True
+    attributes = {}
+    for attr in all_attributes:
+        _name, _slot_def = _attribute_slot(obj, attr, fragment, context)
+        attributes[_name] = _slot_def
+    values["attributes"] = attributes
+    fragment.classes[obj.name] = _element(CLASS_KEYS, values)
+    return fragment
+
+
+def schema_header(name: str, document: Document, schema_id: Optional[str] = None) -> dict:
+    """
+    The schema metadata (as laid down by `SchemaBuilder.add_defaults`)
+    """
+    if schema_id:
+        _id = schema_id
+    else:
+        _id = document.prefix
+    _prefix = "_".join(name.strip().split()).replace(",", "").replace("-", "_")
+    prefixes = {"linkml": "https://w3id.org/linkml/", _prefix: f"{_id}/"}
+    prefixes.update(document.prefixes)
+    return dict(
+        name=name,
+        id=_id,
+        imports=["linkml:types"],
+        prefixes=prefixes,
+        default_prefix=_prefix,
+        default_range="string",
+    )
+
+
+def render_fragments(
+    document: Document,
+    cache: Optional[FragmentCache] = None,
+    context: Optional[RenderContext] = None,
+) -> List[ClassFragment]:
+    """
+    The fragments for the classes of the document; with a cache, only the classes whose inputs
+    have changed since the fragments were cached are rendered (with their YAML)
+    """
+    if context is None:
+        context = RenderContext(document)
+    if cache is None:
+        return [class_fragment(obj, context) for obj in context.classes]
+    type_mapping = sorted(context.type_mapping.items())
+    fragments = []
+    for obj in context.classes:
+        fingerprint = class_fingerprint(obj, type_mapping, context.attributes[obj.object_id])
+        fragment = cache.get(fingerprint)
+        if fragment is None:
+            fragment = class_fragment(obj, context)
+            fragment.render()
+            cache.put(fingerprint, fragment)
+        fragments.append(fragment)
+    return fragments
+
+
+def rendered_elements(fragments: Iterable[ClassFragment]) -> Dict[Tuple[str, str], str]:
+    """
+    The rendered YAML of the fragments, following the merge of the fragments
+    """
+    rendered = {}
+    for fragment in fragments:
+        for (section, name), text in fragment.rendered.items():
+            if section == "enums":
+                rendered.setdefault((section, name), text)
+            else:
+                rendered[(section, name)] = text
+    return rendered
+
+
+def merge_fragments(
+    fragments: Iterable[ClassFragment],
+    classes: Dict[str, dict],
+    context: Optional[RenderContext] = None,
+) -> Tuple[Dict[str, dict], Dict[str, dict]]:
+    """
+    Merge the class fragments; the first definition of an enumeration is used, and a redefined
+    class keeps its place
+    :param fragments: The fragments for the classes, in document order
+    :param classes: The classes preceding the model classes
+    :param context: The render context (for the type mapping, and to collect the missing types)
+    :returns: the enumerations and the classes
+    """
+    enums = {}
+    classes = dict(classes)
+    types = []
+    # the model classes are types, the builtin classes are not
+    class_names = set()
+    for fragment in fragments:
+        class_names.add(fragment.name)
+        for enum_name, enum in fragment.enums.items():
+            enums.setdefault(enum_name, enum)
+        classes.update(fragment.classes)
+        types.extend(fragment.types)
+    type_mapping = context.type_mapping if context is not None else TYPE_MAPPING
+    missing_types = [
+        x for x in dict.fromkeys(types) if x not in type_mapping and x not in class_names
+    ]
+    if context is not None:
+        context.missing_types.extend(x for x in missing_types if x not in context.missing_types)
+    if "Map" in missing_types:
+        logger.info("Adding Map type")
+        # add a map class
+        classes["Map"] = dict(
+            description="A map of key-value pairs",
+            attributes={"key": dict(range="string"), "value": dict(range="string")},
+        )
+    for absent_type in missing_types:
+        logger.warning(f"Missing type: {absent_type}")
+    return enums, classes
+
+
+def schema_metadata(schema: dict, document: Document) -> dict:
+    """
+    Append the description and version of the document to the schema
+    """
+    schema["description"] = document.description
+    if document.version:
+        # remove the v prefix
+        schema["version"] = document.version.replace("v", "")
+    return schema
+
+
+def assemble_schema(
+    header: dict,
+    fragments: Iterable[ClassFragment],
+    classes: Dict[str, dict],
+    document: Document,
+    context: Optional[RenderContext] = None,
+) -> dict:
+    """
+    Assemble the class fragments into the schema
+    :param header: The schema metadata
+    :param fragments: The fragments for the classes, in document order
+    :param classes: The classes preceding the model classes
+    :param context: The render context (to collect the missing types)
+    """
+    enums, classes = merge_fragments(fragments, classes, context)
+    schema = _element(SCHEMA_KEYS, dict(header, enums=enums, classes=classes))
+    return schema_metadata(schema, document)
+
+
+def build_schema(name: str, document: Document, schema_id: Optional[str] = None) -> dict:
+    """
+    Build the LinkML schema for the document
+    """
+    header = schema_header(name, document, schema_id)
+    return assemble_schema(header, render_fragments(document), builtin_classes(), document)
+
+
+def _printable(value: Any) -> bool:
+    """
+    Is all the text printable ASCII; libyaml folds (and escapes) other text differently from PyYAML
+    """
+    if isinstance(value, str):
+        return value.isascii() and value.isprintable()
+    if isinstance(value, dict):
+        return all(_printable(k) and _printable(v) for k, v in value.items())
+    if isinstance(value, list):
+        return all(_printable(x) for x in value)
+    return True
+
+
+def dump_element(name: str, element: dict) -> str:
+    """
+    The YAML for an enumeration or class, as it is written (indented) in the schema; the C emitter
+    is used where it writes the same YAML as PyYAML
+    """
+    dumper = _FastSchemaDumper if _printable(element) and _printable(name) else _SchemaDumper
+    text = yaml.dump(
+        {name: element},
+        Dumper=dumper,
+        sort_keys=False,
+        width=YAML_WIDTH - ELEMENT_INDENT,
+    )
+    return "".join(
+        " " * ELEMENT_INDENT + line if line.strip() else line
+        for line in text.splitlines(keepends=True)
+    )
+
+
+def dump_schema(
+    schema: dict, fh, rendered: Optional[Dict[Tuple[str, str], str]] = None
+) -> None:
+    """
+    Write the schema, element by element
+    :param schema: The schema
+    :param fh: The file to write to
+    :param rendered: The YAML already rendered for the elements, by section and name
+    """
+    rendered = rendered or {}
+    for key, value in schema.items():
+        if key in ("enums", "classes"):
+            fh.write(f"{key}:\n")
+            for name, element in value.items():
+                text = rendered.get((key, name))
+                fh.write(text if text is not None else dump_element(name, element))
+        else:
+            fh.write(yaml.dump({key: value}, Dumper=_SchemaDumper, sort_keys=False))
+
+
+def generate(
+    name: str,
+    document: Document,
+    schema_id: Optional[str] = None,
+    output_dir: Optional[str] = "output",
+    cache: Optional[FragmentCache] = None,
+    context: Optional[RenderContext] = None,
+):
+    """
+    Generate the LinkML schema for the document, as `generate_schema_builder` does
+    :param name: The name of the schema
+    :param document: The loaded document
+    :param schema_id: The schema id (defaults to the document prefix)
+    :param output_dir: The output directory
+    :param cache: The cache of rendered class fragments
+    :param context: The render context (defaults to a new context for the document)
+    """
+    if context is None:
+        context = RenderContext(document)
+    fragments = render_fragments(document, cache, context)
+    schema = assemble_schema(
+        schema_header(name, document, schema_id), fragments, builtin_classes(), document, context
+    )
+    print("Writing model to", output_dir)
+    with open(f"{output_dir}/{name}.yaml", "w") as fh:
+        dump_schema(schema, fh, rendered_elements(fragments))
+    if cache is not None:
+        cache.save()
@@ -0,0 +1,233 @@
+"""
+Write the LinkML schema as a set of modules; a module for each EA package (or partition of the
+packages), a common module with the shared enumerations and the Code/AliasCode helpers, and a
+root schema that imports them
+"""
+
+from __future__ import annotations
+
+import io
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from eapexpand.models.eap import Document
+from eapexpand.render.context import RenderContext
+from eapexpand.render.fragment_cache import FragmentCache
+from eapexpand.render.linkml_emitter import (
+    SCHEMA_KEYS,
+    ClassFragment,
+    _element,
+    builtin_classes,
+    dump_schema,
+    merge_fragments,
+    render_fragments,
+    rendered_elements,
+    schema_header,
+    schema_metadata,
+)
+
+COMMON_MODULE = "common"
+UNPACKAGED_MODULE = "unpackaged"
+
+
+def module_slug(name: str) -> str:
+    """
+    The module name for a package (or partition) name, eg `Study Design` -> `study_design`
+    """
+    return re.sub(r"[^0-9a-zA-Z]+", "_", name).strip("_").lower() or UNPACKAGED_MODULE
+
+
+def class_modules(
+    document: Document, partition: Optional[Dict[str, str]] = None
+) -> Dict[str, str]:
+    """
+    The module for each model class
+    :param document: The loaded document
+    :param partition: The partition for a package (by package name); packages not in the
+        partition are a module of their own
+    """
+    partition = partition or {}
+    packages = {x.package_id: x.name for x in document.packages}
+    modules = {}
+    for obj in document.objects:
+        if obj.object_type != "Class":
+            continue
+        package_name = packages.get(obj.package_id, UNPACKAGED_MODULE)
+        modules[obj.name] = module_slug(partition.get(package_name, package_name))
+    return modules
+
+
+def _references(element: dict) -> Iterator[str]:
+    """
+    The names of the elements a class refers to (superclass and slot ranges)
+    """
+    if element.get("is_a"):
+        yield element["is_a"]
+    for slot in element.get("attributes", {}).values():
+        if slot.get("range"):
+            yield slot["range"]
+        for option in slot.get("any_of", []):
+            yield option["range"]
+
+
+def build_modules(
+    name: str,
+    document: Document,
+    schema_id: Optional[str] = None,
+    partition: Optional[Dict[str, str]] = None,
+    fragments: Optional[List[ClassFragment]] = None,
+    context: Optional[RenderContext] = None,
+) -> Dict[str, dict]:
+    """
+    Build the LinkML modules for the document; the elements are those of `build_schema`
+    :param name: The name of the (root) schema
+    :param document: The loaded document
+    :param schema_id: The schema id (defaults to the document prefix)
+    :param partition: The partition for a package (by package name)
+    :param fragments: The fragments for the classes (rendered if not supplied)
+    :param context: The render context (to collect the missing types)
+    :returns: the schemas by module name, the common module first and the root schema last
+    """
+    header = schema_header(name, document, schema_id)
+    owners = class_modules(document, partition)
+    if fragments is None:
+        fragments = render_fragments(document, context=context)
+    enums, classes = merge_fragments(fragments, builtin_classes(), context)
+    root_classes = {}
+    # the modules (as the classes first appear), with their classes in schema order
+    placed: Dict[str, Dict[str, dict]] = {COMMON_MODULE: {}}
+    for class_name, element in classes.items():
+        if class_name in owners:
+            placed.setdefault(owners[class_name], {})[class_name] = element
+        elif class_name == "Message":
+            # the message refers to the model, so it is held in the root
+            root_classes[class_name] = element
+        else:
+            placed[COMMON_MODULE][class_name] = element
+    located = {x: COMMON_MODULE for x in enums}
+    located.update({x: module for module, elements in placed.items() for x in elements})
+    order = list(placed)
+    modules = {}
+    for module, elements in placed.items():
+        dependencies = {
+            located[reference]
+            for element in elements.values()
+            for reference in _references(element)
+            if reference in located
+        } - {module}
+        module_name = f"{name}_{module}"
+        modules[module_name] = _element(
+            SCHEMA_KEYS,
+            dict(
+                header,
+                name=module_name,
+                id=f"{header['id']}/{module}",
+                imports=header["imports"]
+                + [f"{name}_{x}" for x in order if x in dependencies],
+                enums=enums if module == COMMON_MODULE else None,
+                classes=elements,
+            ),
+        )
+    root = _element(
+        SCHEMA_KEYS,
+        dict(header, imports=header["imports"] + list(modules), classes=root_classes),
+    )
+    modules[name] = schema_metadata(root, document)
+    return modules
+
+
+def write_module(
+    filename: str, schema: dict, rendered: Optional[Dict[Tuple[str, str], str]] = None
+) -> bool:
+    """
+    Write a module, leaving the file untouched if the content is unchanged
+    :returns: whether the file was written
+    """
+    buffer = io.StringIO()
+    dump_schema(schema, buffer, rendered)
+    content = buffer.getvalue()
+    if os.path.exists(filename):
+        with open(filename, "r") as fh:
+            if fh.read() == content:
+                return False
+    with open(filename, "w") as fh:
+        fh.write(content)
+    return True
+
+
+def _write_module(args: Tuple[str, dict, dict]) -> bool:
+    return write_module(*args)
+
+
+def write_modules(
+    modules: Dict[str, dict],
+    directory: str,
+    max_workers: Optional[int] = None,
+    rendered: Optional[Dict[Tuple[str, str], str]] = None,
+) -> List[str]:
+    """
+    Write the modules (in worker processes)
+    :param rendered: The YAML already rendered for the elements, by section and name
+    :returns: the files that were written
+    """
+    rendered = rendered or {}
+    jobs = [
+        (
+            os.path.join(directory, f"{x}.yaml"),
+            schema,
+            # only the YAML for the elements of the module is passed to the worker
+            {
+                (section, element): rendered[(section, element)]
+                for section in ("enums", "classes")
+                for element in schema.get(section, {})
+                if (section, element) in rendered
+            },
+        )
+        for x, schema in modules.items()
+    ]
+    if max_workers == 1 or len(jobs) < 3:
+        written = [_write_module(x) for x in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            written = list(executor.map(_write_module, jobs))
+    return [filename for (filename, _, _), changed in zip(jobs, written) if changed]
+
+
+def generate(
+    name: str,
+    document: Document,
+    schema_id: Optional[str] = None,
+    output_dir: Optional[str] = "output",
+    partition: Optional[Dict[str, str]] = None,
+    max_workers: Optional[int] = None,
+    cache: Optional[FragmentCache] = None,
+    context: Optional[RenderContext] = None,
+) -> List[str]:
+    """
+    Generate the LinkML modules for the document in `{output_dir}/{name}`; the root schema is
+    `{name}.yaml` and the modules are `{name}_{module}.yaml`
+    :param name: The name of the schema
+    :param document: The loaded document
+    :param schema_id: The schema id (defaults to the document prefix)
+    :param output_dir: The output directory
+    :param partition: The partition for a package (by package name)
+    :param max_workers: Write the modules in this many worker processes
+    :param cache: The cache of rendered class fragments
+    :param context: The render context (defaults to a new context for the document)
+    :returns: the module files that changed
+    """
+    if context is None:
+        context = RenderContext(document)
+    fragments = render_fragments(document, cache, context)
+    modules = build_modules(name, document, schema_id, partition, fragments, context)
+    directory = os.path.join(output_dir, name)
+    os.makedirs(directory, exist_ok=True)
+    changed = write_modules(modules, directory, max_workers, rendered_elements(fragments))
+    if cache is not None:
+        cache.save()
+    print(f"Wrote {len(changed)} of {len(modules)} LinkML modules to {directory}")
+    for filename in changed:
+        print("Changed module:", filename)
+    return changed
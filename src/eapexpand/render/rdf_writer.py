@@ -0,0 +1,220 @@
+"""
+A streaming RDF writer (N-Triples or Turtle); the statements are written as they are produced,
+subject by subject, without building a graph
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import IO, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+from urllib.parse import quote
+
+RDF = "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+RDFS = "http://www.w3.org/2000/01/rdf-schema#"
+XSD = "http://www.w3.org/2001/XMLSchema#"
+SH = "http://www.w3.org/ns/shacl#"
+SKOS = "http://www.w3.org/2004/02/skos/core#"
+
+# the characters that are escaped in an IRI
+_IRI_SAFE = ":/?#[]@!$&'()*+,;=%~"
+_LOCAL_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_\-]*$")
+_ESCAPES = {"\\": "\\\\", '"': '\\"', "\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+
+class IRI(str):
+    """
+    An IRI (the text is escaped where it is not a valid IRI)
+    """
+
+    def __new__(cls, value: str):
+        return super().__new__(cls, quote(value, safe=_IRI_SAFE))
+
+
+@dataclass(frozen=True)
+class Literal:
+    """
+    A literal, with an optional datatype (IRI) or language tag
+    """
+
+    value: Union[str, int, bool]
+    datatype: Optional[str] = None
+    language: Optional[str] = None
+
+    @property
+    def lexical(self) -> str:
+        if isinstance(self.value, bool):
+            return "true" if self.value else "false"
+        return str(self.value)
+
+
+@dataclass(frozen=True)
+class RDFList:
+    """
+    A collection (`rdf:List`) of terms
+    """
+
+    items: Tuple[Union[IRI, Literal], ...]
+
+
+Term = Union[IRI, Literal, RDFList]
+Statements = Sequence[Tuple[IRI, Term]]
+
+
+def _escape(text: str) -> str:
+    return "".join(_ESCAPES.get(x, x) for x in text)
+
+
+def _literal_datatype(literal: Literal) -> Optional[str]:
+    if literal.datatype:
+        return literal.datatype
+    if isinstance(literal.value, bool):
+        return XSD + "boolean"
+    if isinstance(literal.value, int):
+        return XSD + "integer"
+    return None
+
+
+class NTriplesWriter:
+    """
+    Writes the statements as N-Triples; collections are written as `rdf:first`/`rdf:rest` chains
+    of blank nodes
+
+    Methods:
+        write(subject, statements):
+            Writes the statements about a subject.
+        close():
+            Completes the document.
+    """
+
+    def __init__(self, fh: IO[str], prefixes: Optional[Dict[str, str]] = None):
+        self.fh = fh
+        self.prefixes = prefixes or {}
+        self.count = 0
+        self._bnodes = 0
+
+    def iri(self, value: str) -> str:
+        return f"<{value}>"
+
+    def literal(self, literal: Literal) -> str:
+        text = f'"{_escape(literal.lexical)}"'
+        if literal.language:
+            return f"{text}@{literal.language}"
+        datatype = _literal_datatype(literal)
+        if datatype and datatype != XSD + "string":
+            return f"{text}^^{self.iri(datatype)}"
+        return text
+
+    def term(self, term: Union[IRI, Literal]) -> str:
+        if isinstance(term, Literal):
+            return self.literal(term)
+        return self.iri(term)
+
+    def _triple(self, subject: str, predicate: str, obj: str) -> None:
+        self.fh.write(f"{subject} {predicate} {obj} .\n")
+        self.count += 1
+
+    def _bnode(self) -> str:
+        self._bnodes += 1
+        return f"_:l{self._bnodes}"
+
+    def _collection(self, collection: RDFList) -> str:
+        if not collection.items:
+            return self.iri(RDF + "nil")
+        nodes = [self._bnode() for _ in collection.items]
+        for idx, (node, item) in enumerate(zip(nodes, collection.items)):
+            rest = nodes[idx + 1] if idx + 1 < len(nodes) else self.iri(RDF + "nil")
+            self._triple(node, self.iri(RDF + "first"), self.term(item))
+            self._triple(node, self.iri(RDF + "rest"), rest)
+        return nodes[0]
+
+    def write(self, subject: IRI, statements: Statements) -> None:
+        for predicate, obj in statements:
+            if isinstance(obj, RDFList):
+                value = self._collection(obj)
+            else:
+                value = self.term(obj)
+            self._triple(self.iri(subject), self.iri(predicate), value)
+
+    def close(self) -> None:
+        pass
+
+
+class TurtleWriter(NTriplesWriter):
+    """
+    Writes the statements as Turtle; the statements about a subject are grouped, and the IRIs in
+    the bound namespaces are abbreviated
+    """
+
+    def __init__(self, fh: IO[str], prefixes: Optional[Dict[str, str]] = None):
+        super().__init__(fh, prefixes)
+        # the longest namespace first, where namespaces overlap
+        self._namespaces = sorted(self.prefixes.items(), key=lambda x: -len(x[1]))
+        for prefix, namespace in self.prefixes.items():
+            self.fh.write(f"@prefix {prefix}: <{namespace}> .\n")
+        self.fh.write("\n")
+
+    def iri(self, value: str) -> str:
+        if value == RDF + "type":
+            return "a"
+        for prefix, namespace in self._namespaces:
+            if value.startswith(namespace) and _LOCAL_NAME.match(value[len(namespace):]):
+                return f"{prefix}:{value[len(namespace):]}"
+        return f"<{value}>"
+
+    def literal(self, literal: Literal) -> str:
+        if literal.language is None and not literal.datatype:
+            if isinstance(literal.value, bool):
+                return literal.lexical
+            if isinstance(literal.value, int):
+                return str(literal.value)
+        text = _escape(literal.lexical)
+        if literal.language:
+            return f'"{text}"@{literal.language}'
+        if literal.datatype and literal.datatype != XSD + "string":
+            return f'"{text}"^^{self.iri(literal.datatype)}'
+        return f'"{text}"'
+
+    def write(self, subject: IRI, statements: Statements) -> None:
+        if not statements:
+            return
+        objects: Dict[str, List[str]] = {}
+        for predicate, obj in statements:
+            if isinstance(obj, RDFList):
+                value = "( {} )".format(" ".join(self.term(x) for x in obj.items))
+            else:
+                value = self.term(obj)
+            objects.setdefault(self.iri(predicate), []).append(value)
+            self.count += 1
+        lines = [
+            f"    {predicate} " + ",\n        ".join(values)
+            for predicate, values in objects.items()
+        ]
+        self.fh.write(f"{self.iri(subject)}\n" + " ;\n".join(lines) + " .\n\n")
+
+
+RDF_FORMATS = {"turtle": (TurtleWriter, "ttl"), "nt": (NTriplesWriter, "nt")}
+
+
+def rdf_writer(
+    fh: IO[str], format: str = "turtle", prefixes: Optional[Dict[str, str]] = None
+) -> NTriplesWriter:
+    """
+    The writer for an RDF format (`turtle` or `nt`)
+    """
+    if format not in RDF_FORMATS:
+        raise ValueError(f"Unknown RDF format: {format}")
+    return RDF_FORMATS[format][0](fh, prefixes)
+
+
+def write_statements(
+    writer: NTriplesWriter, statements: Iterable[Tuple[IRI, Statements]]
+) -> int:
+    """
+    Write the statements about each subject, as they are produced
+    :returns: the number of statements written
+    """
+    for subject, about in statements:
+        writer.write(subject, about)
+    writer.close()
+    return writer.count
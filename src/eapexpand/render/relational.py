@@ -0,0 +1,232 @@
+"""
+The relational mapping of a model, shared by the Prisma schema, the SQLite DDL and the instance
+loader; a table for each class, a foreign key column for each single valued association and a
+junction table for each multivalued association
+
+Every row has a surrogate key (`pk`) that is unique across the tables (the instance ids are
+only unique within a study), so a reference to a superclass (any of its subclass tables) is a
+plain key column
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Tuple, Union
+
+from eapexpand.models.eap import Attribute, Connector, Document, Object
+from eapexpand.render.context import RenderContext
+
+PRIMARY_KEY = "pk"
+# the loaded instance documents
+DOCUMENT_TABLE = "InstanceDocument"
+DOCUMENT_KEY = "document_pk"
+
+# the SQLite and Prisma types for the (LinkML) ranges of the datatypes
+SQL_TYPES: Mapping[str, Tuple[str, str]] = MappingProxyType(
+    {
+        "string": ("TEXT", "String"),
+        "integer": ("INTEGER", "Int"),
+        "boolean": ("BOOLEAN", "Boolean"),
+        "float": ("REAL", "Float"),
+        "date": ("TEXT", "String"),
+    }
+)
+# values without a column type (lists of values, maps) are held as JSON text
+JSON_TYPE = ("TEXT", "String")
+
+# the kinds of column
+VALUE = "value"
+JSON = "json"
+REFERENCE = "reference"
+
+
+@dataclass
+class Column:
+    """
+    A column of a table
+
+    Attributes:
+        name (str): The column name.
+        sql_type (str): The SQLite type.
+        prisma_type (str): The Prisma scalar type.
+        kind (str): `value`, `json` (the value as JSON text) or `reference` (a row key).
+        attribute (Optional[str]): The attribute of the instance held in the column.
+        references (Optional[str]): The table referenced (by key); a reference to a class with
+            subclasses has no table.
+        range (Optional[str]): The class of the referenced instances.
+    """
+
+    name: str
+    sql_type: str
+    prisma_type: str
+    kind: str = VALUE
+    attribute: Optional[str] = None
+    references: Optional[str] = None
+    range: Optional[str] = None
+
+
+@dataclass
+class Table:
+    """
+    A table; the rows of a class, or the items of a multivalued association (a junction table)
+
+    Attributes:
+        name (str): The table name.
+        columns (List[Column]): The columns, after the primary key.
+        class_name (Optional[str]): The class (for a class table).
+        owner (Optional[str]): The owning table (for a junction table).
+        attribute (Optional[str]): The attribute (for a junction table).
+        target (Optional[str]): The table of the items (for a junction table), if not polymorphic.
+        junctions (Dict[str, str]): The junction table for each multivalued association.
+    """
+
+    name: str
+    columns: List[Column] = field(default_factory=list)
+    class_name: Optional[str] = None
+    owner: Optional[str] = None
+    attribute: Optional[str] = None
+    target: Optional[str] = None
+    junctions: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def is_junction(self) -> bool:
+        return self.owner is not None
+
+    @property
+    def column_names(self) -> List[str]:
+        return [PRIMARY_KEY] + [x.name for x in self.columns]
+
+
+def junction_columns(owner: str, target: Optional[str], _range: str) -> List[Column]:
+    return [
+        Column("owner_pk", "INTEGER", "Int", REFERENCE, references=owner),
+        Column("item_pk", "INTEGER", "Int", REFERENCE, references=target, range=_range),
+        Column("position", "INTEGER", "Int"),
+    ]
+
+
+@dataclass
+class RelationalModel:
+    """
+    The tables for a document; the instance documents, then the class tables in class order,
+    each followed by its junction tables
+
+    Attributes:
+        tables (Dict[str, Table]): The tables, by name.
+        subclasses (Dict[str, List[str]]): The (direct) subclasses of a class.
+
+    Methods:
+        table_for(class_name, instance_type) -> Optional[Table]:
+            The table for an instance of a class (or of a subclass named by the instance type).
+    """
+
+    tables: Dict[str, Table] = field(default_factory=dict)
+    subclasses: Dict[str, List[str]] = field(default_factory=dict)
+
+    @property
+    def class_tables(self) -> List[Table]:
+        return [x for x in self.tables.values() if x.class_name]
+
+    def descendants(self, class_name: str) -> List[str]:
+        found = []
+        for subclass in self.subclasses.get(class_name, []):
+            found.append(subclass)
+            found.extend(self.descendants(subclass))
+        return found
+
+    def table_for(self, class_name: str, instance_type: Optional[str] = None) -> Optional[Table]:
+        if instance_type and (
+            instance_type == class_name or instance_type in self.descendants(class_name)
+        ):
+            return self.tables.get(instance_type)
+        return self.tables.get(class_name)
+
+
+def _attribute_range(
+    context: RenderContext, attr: Union[Attribute, Connector]
+) -> Tuple[str, bool, bool]:
+    """
+    The range of an attribute, whether it is multivalued and whether the range is a class
+    """
+    _type, _listed = context.ranges.get(id(attr)) or (attr.attribute_type, False)
+    if isinstance(attr, Connector):
+        multivalued = attr.multivalued
+    else:
+        multivalued = _listed or attr.upper_bound != "1"
+    _range = context.range_for(_type) if _type else "string"
+    return _range, multivalued, _range in context.type_mapping and _range not in SQL_TYPES
+
+
+def class_table(context: RenderContext, model: RelationalModel, obj: Object) -> List[Table]:
+    """
+    The table for a class (with the inherited attributes) and its junction tables
+    """
+    table = Table(obj.name, class_name=obj.name)
+    table.columns.append(
+        Column(DOCUMENT_KEY, "INTEGER", "Int", REFERENCE, references=DOCUMENT_TABLE)
+    )
+    junctions = []
+    names = {PRIMARY_KEY, DOCUMENT_KEY}
+    for attr in context.inherited_attributes[obj.object_id]:
+        if attr.name in names:
+            continue
+        names.add(attr.name)
+        _range, multivalued, is_class = _attribute_range(context, attr)
+        if is_class:
+            target = None if model.subclasses.get(_range) else _range
+            if multivalued:
+                junction = Table(
+                    f"{obj.name}_{attr.name}",
+                    columns=junction_columns(obj.name, target, _range),
+                    owner=obj.name,
+                    attribute=attr.name,
+                    target=target,
+                )
+                table.junctions[attr.name] = junction.name
+                junctions.append(junction)
+            else:
+                table.columns.append(
+                    Column(
+                        f"{attr.name}_pk",
+                        "INTEGER",
+                        "Int",
+                        REFERENCE,
+                        attribute=attr.name,
+                        references=target,
+                        range=_range,
+                    )
+                )
+        elif multivalued or _range not in SQL_TYPES:
+            if _range not in SQL_TYPES and _range not in context.missing_types:
+                context.missing_types.append(_range)
+            table.columns.append(Column(attr.name, *JSON_TYPE, JSON, attribute=attr.name))
+        else:
+            table.columns.append(Column(attr.name, *SQL_TYPES[_range], attribute=attr.name))
+    return [table] + junctions
+
+
+def relational_model(
+    document: Document, context: Optional[RenderContext] = None
+) -> RelationalModel:
+    """
+    The relational mapping of the document
+    """
+    if context is None:
+        context = RenderContext(document)
+    model = RelationalModel()
+    for object_id, superclass in context.superclasses.items():
+        model.subclasses.setdefault(superclass.name, []).append(context.objects[object_id].name)
+    model.tables[DOCUMENT_TABLE] = Table(
+        DOCUMENT_TABLE,
+        columns=[
+            Column("source", "TEXT", "String"),
+            Column("root_table", "TEXT", "String"),
+            Column("root_pk", "INTEGER", "Int", REFERENCE),
+            Column("metadata", *JSON_TYPE, JSON),
+        ],
+    )
+    for obj in context.classes:
+        for table in class_table(context, model, obj):
+            model.tables[table.name] = table
+    return model
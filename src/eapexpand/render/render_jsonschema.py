@@ -0,0 +1,301 @@
+"""
+Generate a JSON Schema for a model directly from the document; a definition (in `$defs`) for each
+class and for each codelist (as an enumeration of the preferred terms of its items)
+
+The classes and ranges follow the LinkML schema (see `linkml_emitter`), without going through
+the LinkML generators
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Tuple, Union
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+from eapexpand.models.eap import Attribute, Connector, Document, Object
+from eapexpand.models.usdm_ct import CodeList
+from eapexpand.render.context import RenderContext
+from eapexpand.render.linkml_emitter import SCHEDULED_INSTANCES, builtin_classes
+
+JSON_SCHEMA_DIALECT = "https://json-schema.org/draft/2019-09/schema"
+
+# the JSON Schema for the (LinkML) ranges of the datatypes
+JSON_TYPES: Mapping[str, dict] = MappingProxyType(
+    {
+        "string": {"type": "string"},
+        "integer": {"type": "integer"},
+        "boolean": {"type": "boolean"},
+        "float": {"type": "number"},
+        "date": {"type": "string", "format": "date"},
+    }
+)
+
+# a map of key-value pairs (the `Map` type of the API metadata)
+MAP_SCHEMA = {"type": "object", "additionalProperties": {"type": "string"}}
+
+
+def _ref(name: str) -> dict:
+    return {"$ref": f"#/$defs/{name}"}
+
+
+def _without_empty(values: dict) -> dict:
+    return {k: v for k, v in values.items() if v is not None and v != [] and v != ""}
+
+
+def codelist_definition(codelist: CodeList) -> dict:
+    """
+    The enumeration for a codelist; the values are the preferred terms of the items (or the
+    submission value, or the C-code, for an item without a preferred term)
+    """
+    return _without_empty(
+        {
+            "title": codelist.preferred_term or codelist.attribute_name,
+            "description": codelist.definition,
+            "type": "string",
+            "enum": list(
+                dict.fromkeys(
+                    x.preferred_term or x.submission_value or x.concept_c_code
+                    for x in codelist.items
+                )
+            ),
+        }
+    )
+
+
+def alias_code_definition(enum_name: str) -> dict:
+    """
+    The AliasCode for a codelist, the standard code taking the values of the codelist
+    """
+    return {
+        "description": f"An alias for a {enum_name} code",
+        "type": "object",
+        "additionalProperties": False,
+        "properties": {
+            "id": {"type": "string"},
+            "standardCode": _ref(enum_name),
+            "standardCodeAliases": {"type": "array", "items": _ref("Code")},
+        },
+        "required": ["standardCode"],
+    }
+
+
+def property_schema(
+    item: dict,
+    multivalued: bool = False,
+    required: bool = False,
+    description: Optional[str] = None,
+    title: Optional[str] = None,
+) -> dict:
+    """
+    The schema for a property, given the schema for a value
+    """
+    if multivalued:
+        schema = {"type": "array", "items": item}
+    elif not required:
+        # an optional value may be null
+        schema = {"anyOf": [item, {"type": "null"}]}
+    else:
+        schema = dict(item)
+    return _without_empty(dict(schema, description=description, title=title))
+
+
+class JSONSchemaBuilder:
+    """
+    Builds the JSON Schema for a document, from the data derived by a render context
+
+    Methods:
+        class_reference(name) -> dict:
+            The schema for a value of a class (any of the concrete subclasses of a superclass).
+        type_schema(type_name) -> dict:
+            The schema for a value of a type.
+        attribute_property(obj, attr) -> Tuple[str, dict, bool]:
+            The name, schema and whether an attribute (or association) is required.
+        class_definition(obj) -> dict:
+            The definition of a class.
+        build(name, schema_id) -> dict:
+            The JSON Schema.
+    """
+
+    def __init__(self, document: Document, context: Optional[RenderContext] = None):
+        self.document = document
+        self.context = context if context is not None else RenderContext(document)
+        self.definitions: Dict[str, dict] = {}
+        self.subclasses: Dict[str, List[str]] = {}
+        for object_id, superclass in self.context.superclasses.items():
+            self.subclasses.setdefault(superclass.name, []).append(
+                self.context.objects[object_id].name
+            )
+
+    def _concrete(self, name: str) -> List[str]:
+        if name not in self.subclasses:
+            return [name]
+        return [x for subclass in self.subclasses[name] for x in self._concrete(subclass)]
+
+    def class_reference(self, name: str) -> dict:
+        concrete = self._concrete(name)
+        if len(concrete) == 1:
+            return _ref(concrete[0])
+        return {"anyOf": [_ref(x) for x in concrete]}
+
+    def type_schema(self, type_name: str) -> dict:
+        _range = self.context.range_for(type_name)
+        if _range in JSON_TYPES:
+            return dict(JSON_TYPES[_range])
+        if _range in self.subclasses or _range in self.context.type_mapping:
+            return self.class_reference(_range)
+        if _range in self.definitions:
+            return _ref(_range)
+        if _range == "Map":
+            self.definitions.setdefault("Map", MAP_SCHEMA)
+            return _ref("Map")
+        if _range not in self.context.missing_types:
+            self.context.missing_types.append(_range)
+        # the default range
+        return {"type": "string"}
+
+    def attribute_property(
+        self, obj: Object, attr: Union[Attribute, Connector]
+    ) -> Tuple[str, dict, bool]:
+        _type, _listed = self.context.ranges.get(id(attr)) or (attr.attribute_type, False)
+        if attr.codelist:
+            enum_name = self.context.enum_names[id(attr.codelist)]
+            if attr.attribute_type == "AliasCode":
+                self.definitions.setdefault(
+                    f"{enum_name}AliasCode", alias_code_definition(enum_name)
+                )
+                item = _ref(f"{enum_name}AliasCode")
+            else:
+                item = _ref(enum_name)
+        elif _type is None:
+            item = {"type": "string"}
+        else:
+            # NOTE: the different types of superclass
+            options = [x for x in SCHEDULED_INSTANCES if x in self.context.type_mapping]
+            if not _listed and _type in SCHEDULED_INSTANCES and options:
+                item = {"anyOf": [_ref(x) for x in options]}
+            else:
+                item = self.type_schema(_type)
+        if isinstance(attr, Connector):
+            multivalued = attr.multivalued
+            required = not attr.optional
+        else:
+            multivalued = _listed or attr.upper_bound != "1"
+            required = attr.lower_bound == "1"
+        schema = property_schema(
+            item,
+            multivalued=multivalued,
+            required=required,
+            description=attr.description,
+            title=attr.preferred_term,
+        )
+        return attr.name, schema, required
+
+    def class_definition(self, obj: Object) -> dict:
+        properties = {}
+        required = []
+        # the attributes of the class first, then those inherited
+        for attr in self.context.inherited_attributes[obj.object_id]:
+            _name, _schema, _required = self.attribute_property(obj, attr)
+            if _name in properties:
+                continue
+            properties[_name] = _schema
+            if _required:
+                required.append(_name)
+        return _without_empty(
+            {
+                "title": obj.preferred_term or obj.name,
+                "description": obj.description,
+                "type": "object",
+                "additionalProperties": False,
+                "properties": properties,
+                "required": required,
+            }
+        )
+
+    def _builtin_definition(self, element: dict) -> dict:
+        properties = {}
+        required = []
+        for name, slot in element["attributes"].items():
+            _range = slot.get("range", "string")
+            item = dict(JSON_TYPES[_range]) if _range in JSON_TYPES else self.class_reference(_range)
+            properties[name] = property_schema(
+                item,
+                multivalued=slot.get("multivalued", False),
+                required=slot.get("required", False),
+                description=slot.get("description"),
+            )
+            if slot.get("required"):
+                required.append(name)
+        return _without_empty(
+            {
+                "description": element.get("description"),
+                "type": "object",
+                "additionalProperties": False,
+                "properties": properties,
+                "required": required,
+            }
+        )
+
+    def build(self, name: str, schema_id: Optional[str] = None) -> dict:
+        self.definitions = {}
+        for enum_name, codelist in self.context.enums.items():
+            self.definitions[enum_name] = codelist_definition(codelist)
+        # the model classes replace the builtin classes
+        for class_name, element in builtin_classes().items():
+            if class_name not in self.context.type_mapping:
+                self.definitions[class_name] = self._builtin_definition(element)
+        for obj in self.context.classes:
+            self.definitions[obj.name] = self.class_definition(obj)
+        for absent_type in self.context.missing_types:
+            logger.warning(f"Missing type: {absent_type}")
+        root = self.document.root_item if self.document.root_item in self.definitions else "Message"
+        schema = {
+            "$schema": JSON_SCHEMA_DIALECT,
+            "$id": schema_id or self.document.prefix,
+            "title": name,
+            "description": self.document.description,
+            "version": self.document.version.replace("v", "") if self.document.version else None,
+            "$ref": f"#/$defs/{root}",
+            "$defs": self.definitions,
+        }
+        return _without_empty(schema)
+
+
+def build_jsonschema(
+    name: str,
+    document: Document,
+    schema_id: Optional[str] = None,
+    context: Optional[RenderContext] = None,
+) -> dict:
+    """
+    Build the JSON Schema for the document
+    :param name: The name (title) of the schema
+    :param document: The loaded document
+    :param schema_id: The schema id (defaults to the document prefix)
+    :param context: The render context (defaults to a new context for the document)
+    """
+    return JSONSchemaBuilder(document, context).build(name, schema_id)
+
+
+def generate(
+    name: str,
+    document: Document,
+    schema_id: Optional[str] = None,
+    output_dir: Optional[str] = "output",
+    context: Optional[RenderContext] = None,
+) -> str:
+    """
+    Generate the JSON Schema for the document as `{output_dir}/{name}.schema.json`
+    :returns: the schema file
+    """
+    schema = build_jsonschema(name, document, schema_id, context)
+    filename = os.path.join(output_dir, f"{name}.schema.json")
+    print("Writing JSON Schema to", filename)
+    with open(filename, "w") as fh:
+        json.dump(schema, fh, indent=2)
+    return filename
@@ -14,18 +14,8 @@ from linkml.utils.schema_builder import (
 import inflect
 from ..models.eap import Attribute, Connector, Document
 from ..models.usdm_ct import CodeList
+from .context import IDENTIFIER_TYPES, TYPE_MAPPING, RenderContext
 
-IDENTIFIER_TYPES = ["id", "uuid"]
-
-
-TYPE_MAPPING = {
-    "String": "string",
-    "string": "string",
-    "Integer": "integer",
-    "Boolean": "boolean",
-    "Float": "float",
-    "Date": "date",
-}
 
 
 def generate_schema_builder(
@@ -33,6 +23,7 @@ def generate_schema_builder(
     document: Document,
     schema_id: Optional[str] = None,
     output_dir: Optional[str] = "output",
+    context: Optional[RenderContext] = None,
 ):
     """
     Generate a schema builder for creating a LinkML document.
@@ -49,6 +40,8 @@ def generate_schema_builder(
             prefix will be used. Defaults to None.
         output_dir (Optional[str], optional): The directory where the generated schema YAML file
             will be saved. Defaults to "output".
+        context (Optional[RenderContext], optional): The state of the rendering (the type
+            mapping and the missing types). Defaults to a new context for the document.
 
     Raises:
         ValueError: If required attributes or configurations are missing in the document.
@@ -73,6 +66,10 @@ def generate_schema_builder(
     elif document.prefix:
         logger.info(f"Using document prefix: {document.prefix}")
         _id = document.prefix
+    if context is None:
+        context = RenderContext(document)
+    type_mapping = context.type_mapping
+    _missing_types = context.missing_types
     p = inflect.engine()
     sb = SchemaBuilder(name, id=_id)
     sb.description = document.description
@@ -80,7 +77,6 @@ def generate_schema_builder(
     sb.add_defaults()
     for prefix, uri in document.prefixes.items():
         sb.add_prefix(prefix, uri)
-    _missing_types = []
     # ADD a container
     # sb.add_class(ClassDefinition(name, tree_root=True))
     message = ClassDefinition(
@@ -218,10 +214,10 @@ def generate_schema_builder(
             if obj.synonyms:
                 _class.aliases = obj.synonyms
             # add the classes as datatypes
-            TYPE_MAPPING[obj.name] = obj.name
+            type_mapping[obj.name] = obj.name
             _attributes: List[SlotDefinition] = []
             for attr in obj.all_attributes:
-                if attr.range not in TYPE_MAPPING:
+                if attr.range not in type_mapping:
                     # can we work out the --Id attributes
                     pass
                 if attr.name in ["dictionaries"]:
@@ -259,11 +255,11 @@ def generate_schema_builder(
                         _attr.multivalued = True
                         _attr.inlined_as_list = True
                         _attr_type = attr.attribute_type.split("<")[1].split(">")[0]
-                        if _attr_type not in TYPE_MAPPING:
+                        if _attr_type not in type_mapping:
                             _missing_types.append(_attr_type)
-                        _attr.range = TYPE_MAPPING.get(_attr_type, _attr_type)
+                        _attr.range = type_mapping.get(_attr_type, _attr_type)
                     else:
-                        if attr.attribute_type not in TYPE_MAPPING:
+                        if attr.attribute_type not in type_mapping:
                             _missing_types.append(attr.attribute_type)
                         # NOTE: this is a hack to handle the different types of superclass
                         if attr.attribute_type in ["ScheduledInstance", "ScheduledDecisionInstance", "ScheduledActivityInstance"]:
@@ -272,7 +268,7 @@ def generate_schema_builder(
                         elif attr.attribute_type in ["StudySite" "StudyCohort"]:
                             _attr.any_of = [{"range": x} for x in ["StudySite", "StudyCohort", "GeographicScope"]] 
                         else:
-                            _attr.range = TYPE_MAPPING.get(
+                            _attr.range = type_mapping.get(
                                 attr.attribute_type, attr.attribute_type
                             )
                 if attr.name in IDENTIFIER_TYPES:
@@ -391,7 +387,7 @@ def generate_schema_builder(
                 # _class.attributes[_attr.name] = _attr
             # _class.attributes = _attributes
             sb.add_class(_class, slots=_attributes, use_attributes=True)
-    if "Map" in set(_missing_types) - set(TYPE_MAPPING.keys()):
+    if "Map" in set(_missing_types) - set(type_mapping.keys()):
         print("Adding Map type")
         # add a map class
         _map = ClassDefinition("Map")
@@ -401,7 +397,7 @@ def generate_schema_builder(
         _map.attributes["value"] = SlotDefinition("value")
         _map.attributes["value"].range = "string"
         sb.add_class(_map)
-    for absent_type in set(_missing_types) - set(TYPE_MAPPING.keys()):
+    for absent_type in set(_missing_types) - set(type_mapping.keys()):
         print("Missing type:", absent_type)
     print("Writing model to", output_dir)
     _schema = sb.as_dict()
@@ -1,13 +1,77 @@
-from typing import Optional
+"""
+Generates the Prisma schema for the relational mapping of a model (see `relational`); a model for
+each table, with a relation (and the back relation on the referenced model) for each reference
+to a table
+"""
 
+from __future__ import annotations
 
-def generate(name: str,
-             packages: dict, 
-             objects: dict, 
-             attributes: dict, 
-             connectors: dict, 
-             output_dir: Optional[str] = "output"):
+import os
+from typing import Dict, List, Optional
+
+from eapexpand.models.eap import Document
+from eapexpand.render.context import RenderContext
+from eapexpand.render.relational import PRIMARY_KEY, Column, RelationalModel, relational_model
+
+PRISMA_HEADER = """datasource db {
+  provider = "sqlite"
+  url      = env("DATABASE_URL")
+}
+
+generator client {
+  provider = "prisma-client-js"
+}
+"""
+
+
+def _relation_field(column: Column) -> str:
+    # the relation for a reference column, eg studyType_pk -> studyType
+    if column.attribute:
+        return column.attribute
+    return column.name[: -len("_pk")] if column.name.endswith("_pk") else f"{column.name}_ref"
+
+
+def prisma_schema(model: RelationalModel) -> str:
+    """
+    The Prisma schema for the tables of the model
+    """
+    # the back relations on each model, as (field, model, relation name)
+    back_relations: Dict[str, List[tuple]] = {}
+    for table in model.tables.values():
+        for column in table.columns:
+            if column.references:
+                back_relations.setdefault(column.references, []).append(
+                    (f"{table.name}_{_relation_field(column)}", table.name, f"{table.name}_{column.name}")
+                )
+    blocks = [PRISMA_HEADER]
+    for table in model.tables.values():
+        lines = [f"  {PRIMARY_KEY} Int @id"]
+        for column in table.columns:
+            lines.append(f"  {column.name} {column.prisma_type}?")
+            if column.references:
+                lines.append(
+                    f"  {_relation_field(column)} {column.references}? "
+                    f'@relation("{table.name}_{column.name}", '
+                    f"fields: [{column.name}], references: [{PRIMARY_KEY}])"
+                )
+        for field_name, owner, relation in back_relations.get(table.name, []):
+            lines.append(f'  {field_name} {owner}[] @relation("{relation}")')
+        blocks.append(f"model {table.name} {{\n" + "\n".join(lines) + "\n}\n")
+    return "\n".join(blocks)
+
+
+def generate(
+    name: str,
+    document: Document,
+    output_dir: Optional[str] = "output",
+    context: Optional[RenderContext] = None,
+) -> str:
     """
-    Create PRISMA models from the EAP model
+    Create the Prisma schema for the document as `{output_dir}/{name}.prisma`
+    :returns: the schema file
     """
-    pass
+    filename = os.path.join(output_dir, f"{name}.prisma")
+    print("Writing Prisma schema to", filename)
+    with open(filename, "w") as fh:
+        fh.write(prisma_schema(relational_model(document, context)))
+    return filename
@@ -0,0 +1,394 @@
+"""
+Generate the Pydantic model for a document in process; the classes are those of the LinkML schema
+(see `linkml_emitter`), rendered with the `gen-pydantic` templates (and any overriding templates,
+eg `docs/pydantic_templates`) without loading the schema into a SchemaView
+"""
+
+from __future__ import annotations
+
+import importlib.util
+import os
+import re
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+from jinja2 import ChoiceLoader, Environment, FileSystemLoader
+
+from eapexpand.models.eap import Document
+from eapexpand.render.context import RenderContext
+from eapexpand.render.fragment_cache import FragmentCache
+from eapexpand.render.linkml_emitter import (
+    builtin_classes,
+    merge_fragments,
+    render_fragments,
+    schema_header,
+)
+
+BASE_MODEL = "ConfiguredBaseModel"
+
+# the Python types for the (LinkML) ranges of the datatypes
+PYTHON_TYPES: Mapping[str, str] = MappingProxyType(
+    {
+        "string": "str",
+        "integer": "int",
+        "boolean": "bool",
+        "float": "float",
+        "double": "float",
+        "decimal": "Decimal",
+        "date": "date",
+        "datetime": "datetime",
+        "time": "time",
+        "uri": "str",
+        "uriorcurie": "str",
+    }
+)
+
+# the slot metadata that is rendered by the attribute template (or not rendered), as
+# `gen-pydantic` leaves it out of the `linkml_meta` of a field
+SLOT_FIELDS = frozenset(
+    (
+        "required",
+        "identifier",
+        "range",
+        "title",
+        "description",
+        "multivalued",
+        "minimum_cardinality",
+        "maximum_cardinality",
+        "exact_cardinality",
+        "minimum_value",
+        "maximum_value",
+        "equals_number",
+        "pattern",
+        "inlined",
+        "inlined_as_list",
+    )
+)
+CLASS_FIELDS = frozenset(("description", "is_a", "attributes"))
+
+PYTHON_IMPORTS = """from __future__ import annotations
+
+import re
+import sys
+from datetime import (
+    date,
+    datetime,
+    time
+)
+from decimal import Decimal
+from enum import Enum
+from typing import (
+    Any,
+    ClassVar,
+    Literal,
+    Optional,
+    Union
+)
+
+from pydantic import (
+    BaseModel,
+    ConfigDict,
+    Field,
+    RootModel,
+    field_validator
+)
+"""
+
+# the class holding the LinkML metadata of the schema, classes and fields
+LINKML_META = """class LinkMLMeta(RootModel):
+    root: dict[str, Any] = {}
+    model_config = ConfigDict(frozen=True)
+
+    def __getattr__(self, key:str):
+        return getattr(self.root, key)
+
+    def __getitem__(self, key:str):
+        return self.root[key]
+
+    def __setitem__(self, key:str, value):
+        self.root[key] = value
+
+    def __contains__(self, key:str) -> bool:
+        return key in self.root
+
+"""
+
+# render the classes in worker processes for (at least) this many classes
+PARALLEL_CLASSES = 50
+
+
+def linkml_template_dir() -> Path:
+    """
+    The directory of the `gen-pydantic` templates (without importing the generator)
+    """
+    spec = importlib.util.find_spec("linkml")
+    return Path(spec.origin).parent / "generators" / "pydanticgen" / "templates"
+
+
+@lru_cache(maxsize=None)
+def template_environment(template_dir: Optional[str] = None) -> Environment:
+    """
+    The template environment; the templates in `template_dir` override the `gen-pydantic`
+    templates, and each template is compiled once (per process)
+    """
+    loaders = [FileSystemLoader(str(linkml_template_dir()))]
+    if template_dir:
+        loaders.insert(0, FileSystemLoader(str(template_dir)))
+    return Environment(loader=ChoiceLoader(loaders), trim_blocks=True, lstrip_blocks=True)
+
+
+def render_template(template_dir: Optional[str], template: str, values: Dict[str, Any]) -> str:
+    return template_environment(template_dir).get_template(template).render(**values)
+
+
+def enum_label(value: str) -> str:
+    """
+    The (Python identifier) label for a permissible value, as `gen-pydantic` makes it
+    """
+    label = re.sub(r"\s+", "_", value.strip()).replace(",", "").replace("-", "_")
+    if label.isidentifier():
+        return label
+    label = re.sub(r"(?=^\d)", "number_", label)
+    return "".join(
+        x if x.isalpha() or x.isnumeric() or x == "_" else enum_label(unicodedata.name(x))
+        for x in label
+    )
+
+
+def _render_class(job: Tuple[Optional[str], dict]) -> str:
+    template_dir, values = job
+    attributes = {
+        name: render_template(template_dir, "attribute.py.jinja", attribute)
+        for name, attribute in values["attributes"].items()
+    }
+    return render_template(template_dir, "class.py.jinja", dict(values, attributes=attributes))
+
+
+class PydanticModelBuilder:
+    """
+    Builds the template values for the Pydantic model of a document, from the LinkML classes
+
+    Methods:
+        python_range(slot) -> str:
+            The type annotation for a slot.
+        attribute_values(slot_name, slot) -> dict:
+            The values for the attribute template.
+        class_values(class_name) -> dict:
+            The values for the class template (with the values for its attributes).
+        enum_values(enum_name) -> dict:
+            The values for the enum template.
+        module_values(enums, classes) -> dict:
+            The values for the module template, given the rendered enums and classes.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        document: Document,
+        schema_id: Optional[str] = None,
+        cache: Optional[FragmentCache] = None,
+        context: Optional[RenderContext] = None,
+    ):
+        self.document = document
+        self.context = context if context is not None else RenderContext(document)
+        self.header = schema_header(name, document, schema_id)
+        self.enums, self.classes = merge_fragments(
+            render_fragments(document, cache, self.context), builtin_classes(), self.context
+        )
+        # the classes a slot is an attribute of, in schema order
+        self.domains: Dict[str, List[str]] = {}
+        for class_name, element in self.classes.items():
+            for slot_name in element.get("attributes", {}):
+                self.domains.setdefault(slot_name, []).append(class_name)
+
+    def induced_slots(self, class_name: str) -> Dict[str, dict]:
+        """
+        The slots of a class, followed by those of its superclasses
+        """
+        slots = {}
+        while class_name in self.classes:
+            element = self.classes[class_name]
+            for slot_name, slot in element.get("attributes", {}).items():
+                slots.setdefault(slot_name, slot)
+            class_name = element.get("is_a")
+        return slots
+
+    def _identifier(self, class_name: str) -> Optional[dict]:
+        for slot in self.induced_slots(class_name).values():
+            if slot.get("identifier"):
+                return slot
+        return None
+
+    def _single_range(self, _range: Optional[str], slot: dict) -> str:
+        if _range is None:
+            _range = self.header["default_range"]
+        if _range in self.enums:
+            return _range
+        if _range in self.classes:
+            identifier = self._identifier(_range)
+            if identifier is not None and not (slot.get("inlined") or slot.get("inlined_as_list")):
+                # a reference (by identifier) to an instance
+                return self._single_range(identifier.get("range"), identifier)
+            return _range
+        if _range in PYTHON_TYPES:
+            return PYTHON_TYPES[_range]
+        if _range not in self.context.missing_types:
+            self.context.missing_types.append(_range)
+        return "str"
+
+    def python_range(self, slot: dict) -> str:
+        if slot.get("any_of"):
+            _range = "Union[{}]".format(
+                ", ".join(self._single_range(x.get("range"), slot) for x in slot["any_of"])
+            )
+        else:
+            _range = self._single_range(slot.get("range"), slot)
+        if slot.get("multivalued"):
+            _range = f"list[{_range}]"
+        if not (slot.get("required") or slot.get("identifier")):
+            _range = f"Optional[{_range}]"
+        return _range
+
+    def attribute_values(self, slot_name: str, slot: dict) -> dict:
+        meta = {k: v for k, v in slot.items() if k not in SLOT_FIELDS}
+        meta.update(alias=slot_name, domain_of=self.domains.get(slot_name, []))
+        return dict(
+            name=slot_name,
+            range=self.python_range(slot),
+            field="..." if slot.get("required") or slot.get("identifier") else "None",
+            title=slot.get("title"),
+            description=slot.get("description"),
+            equals_number=None,
+            minimum_value=None,
+            maximum_value=None,
+            multivalued=slot.get("multivalued"),
+            exact_cardinality=None,
+            minimum_cardinality=slot.get("minimum_cardinality"),
+            maximum_cardinality=None,
+            meta=meta,
+        )
+
+    def class_values(self, class_name: str) -> dict:
+        element = self.classes[class_name]
+        meta = {k: v for k, v in element.items() if k not in CLASS_FIELDS}
+        meta["from_schema"] = self.header["id"]
+        return dict(
+            name=class_name,
+            bases=element.get("is_a", BASE_MODEL),
+            description=element.get("description"),
+            meta=meta,
+            attributes={
+                slot_name: self.attribute_values(slot_name, slot)
+                for slot_name, slot in self.induced_slots(class_name).items()
+            },
+            validators=None,
+        )
+
+    def enum_values(self, enum_name: str) -> dict:
+        element = self.enums[enum_name]
+        values = {}
+        for text, pv in element.get("permissible_values", {}).items():
+            label = enum_label(pv.get("title") or text)
+            values[label] = dict(
+                label=label, value=text.replace('"', '\\"'), description=pv.get("description")
+            )
+        return dict(name=enum_name, description=element.get("description"), values=values)
+
+    def module_values(self, enums: Dict[str, str], classes: Dict[str, str]) -> dict:
+        meta = {k: v for k, v in self.header.items()}
+        meta["prefixes"] = {
+            k: dict(prefix_prefix=k, prefix_reference=v) for k, v in self.header["prefixes"].items()
+        }
+        meta["description"] = self.document.description
+        return dict(
+            python_imports=PYTHON_IMPORTS,
+            metamodel_version=None,
+            version=self.document.version.replace("v", "") if self.document.version else None,
+            injected_classes=[LINKML_META],
+            meta=meta,
+            enums=enums,
+            classes=classes,
+            class_names=list(classes),
+        )
+
+
+def build_pydantic(
+    name: str,
+    document: Document,
+    schema_id: Optional[str] = None,
+    template_dir: Optional[str] = None,
+    max_workers: Optional[int] = None,
+    cache: Optional[FragmentCache] = None,
+    context: Optional[RenderContext] = None,
+) -> str:
+    """
+    Render the Pydantic model for the document
+    :param name: The name of the schema
+    :param document: The loaded document
+    :param schema_id: The schema id (defaults to the document prefix)
+    :param template_dir: The templates overriding the `gen-pydantic` templates
+    :param max_workers: Render the classes in this many worker processes
+    :param cache: The cache of rendered (LinkML) class fragments
+    :param context: The render context (defaults to a new context for the document)
+    :returns: the source of the module
+    """
+    template_dir = str(template_dir) if template_dir else None
+    builder = PydanticModelBuilder(name, document, schema_id, cache, context)
+    jobs = [(template_dir, builder.class_values(x)) for x in builder.classes]
+    if max_workers == 1 or len(jobs) < PARALLEL_CLASSES:
+        rendered = [_render_class(x) for x in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            rendered = list(executor.map(_render_class, jobs, chunksize=16))
+    for absent_type in builder.context.missing_types:
+        logger.warning(f"Missing type: {absent_type}")
+    enums = {
+        x: render_template(template_dir, "enum.py.jinja", builder.enum_values(x))
+        for x in builder.enums
+    }
+    values = builder.module_values(enums, dict(zip(builder.classes, rendered)))
+    values["base_model"] = render_template(
+        template_dir,
+        "base_model.py.jinja",
+        dict(name=BASE_MODEL, extra_fields="forbid", strict=False, fields=None),
+    ) + "\n"
+    return render_template(template_dir, "module.py.jinja", values)
+
+
+def module_name(name: str) -> str:
+    """
+    The Python module name for a schema name, eg `USDM_v4.0.0` -> `usdm_v4_0_0`
+    """
+    return re.sub(r"[^0-9a-zA-Z]+", "_", name).strip("_").lower()
+
+
+def generate(
+    name: str,
+    document: Document,
+    schema_id: Optional[str] = None,
+    output_dir: Optional[str] = "output",
+    template_dir: Optional[str] = None,
+    max_workers: Optional[int] = None,
+    cache: Optional[FragmentCache] = None,
+    context: Optional[RenderContext] = None,
+) -> str:
+    """
+    Generate the Pydantic model for the document as `{output_dir}/{module_name(name)}.py`
+    :returns: the module file
+    """
+    source = build_pydantic(name, document, schema_id, template_dir, max_workers, cache, context)
+    filename = os.path.join(output_dir, f"{module_name(name)}.py")
+    print("Writing Pydantic model to", filename)
+    with open(filename, "w") as fh:
+        fh.write(source)
+    if cache is not None:
+        cache.save()
+    return filename
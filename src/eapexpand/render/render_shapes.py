@@ -1,22 +1,270 @@
-from typing import Optional
-from rdflib import Graph, URIRef, Literal, Namespace, SH, SKOS
-
-
 """
-Generates one or more shapes for the Object
+Generates the SHACL shapes for a model; a node shape for each class, with a property shape for
+each attribute (and association), and a node shape for each codelist constraining the code to
+the codelist items (`sh:in`)
+
+The shapes are streamed to the output (see `rdf_writer`) rather than built as an rdflib graph
 """
 
+from __future__ import annotations
+
+import os
+import re
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+from eapexpand.models.eap import Attribute, Connector, Document, Object
+from eapexpand.models.usdm_ct import CodeList
+from eapexpand.render.context import RenderContext
+from eapexpand.render.rdf_writer import (
+    RDF,
+    RDF_FORMATS,
+    RDFS,
+    SH,
+    SKOS,
+    XSD,
+    IRI,
+    Literal,
+    RDFList,
+    Statements,
+    Term,
+    rdf_writer,
+    write_statements,
+)
+
+NCIT = "http://purl.obolibrary.org/obo/NCIT_"
+_C_CODE = re.compile(r"^C\d+$")
+
+# the datatypes for the (LinkML) ranges of the model datatypes
+XSD_TYPES = {
+    "string": XSD + "string",
+    "integer": XSD + "integer",
+    "boolean": XSD + "boolean",
+    "float": XSD + "decimal",
+    "date": XSD + "date",
+}
+
+
+def shapes_namespace(document: Document, schema_id: Optional[str] = None) -> str:
+    """
+    The namespace for the classes and properties of the model (and their shapes)
+    """
+    return f"{(schema_id or document.prefix).rstrip('/#')}/"
+
+
+class ShapesBuilder:
+    """
+    Produces the statements for the shapes of a document, from the data derived by a render
+    context; a shape is produced (and can be written) once it is complete
+
+    Methods:
+        class_shape(obj) -> Iterator[Tuple[IRI, Statements]]:
+            The node shape for a class, followed by its property shapes (and superclass).
+        codelist_shape(codelist) -> Iterator[Tuple[IRI, Statements]]:
+            The node shape for the codes of a codelist, followed by the property shape of the codes.
+        statements() -> Iterator[Tuple[IRI, Statements]]:
+            The shapes for the document.
+    """
+
+    def __init__(
+        self,
+        document: Document,
+        schema_id: Optional[str] = None,
+        context: Optional[RenderContext] = None,
+    ):
+        self.document = document
+        self.context = context if context is not None else RenderContext(document)
+        self.namespace = shapes_namespace(document, schema_id)
+
+    @property
+    def prefixes(self) -> Dict[str, str]:
+        return dict(
+            sh=SH, rdf=RDF, rdfs=RDFS, xsd=XSD, skos=SKOS, ncit=NCIT, model=self.namespace
+        )
+
+    def iri(self, name: str) -> IRI:
+        return IRI(self.namespace + name)
+
+    def shape_iri(self, name: str) -> IRI:
+        return IRI(f"{self.namespace}{name}Shape")
+
+    def _describe(
+        self,
+        statements: List[Tuple[IRI, Term]],
+        name: Optional[str],
+        description: Optional[str],
+        reference_url: Optional[str] = None,
+    ) -> None:
+        if name:
+            statements.append((IRI(SH + "name"), Literal(name)))
+        if description:
+            statements.append((IRI(SH + "description"), Literal(description)))
+        if reference_url and _C_CODE.match(reference_url):
+            # a NCI C-code
+            statements.append((IRI(SKOS + "exactMatch"), IRI(NCIT + reference_url)))
+
+    def _model_shape(self, name: str) -> List[Tuple[IRI, Term]]:
+        # the shape for a model class, eg Code, if the model has the class
+        if name in self.context.type_mapping:
+            return [(IRI(SH + "node"), self.shape_iri(name))]
+        return []
+
+    def codelist_shape(self, codelist: CodeList) -> Iterator[Tuple[IRI, Statements]]:
+        """
+        The codes of an extensible codelist are only recommended (a warning)
+        """
+        enum_name = self.context.enum_names[id(codelist)]
+        shape = self.shape_iri(enum_name)
+        statements = [(IRI(RDF + "type"), IRI(SH + "NodeShape"))] + self._model_shape("Code")
+        self._describe(
+            statements,
+            codelist.preferred_term or enum_name,
+            codelist.definition,
+            codelist.concept_c_code,
+        )
+        codes = self.iri(f"{enum_name}Shape-code")
+        statements.append((IRI(SH + "property"), codes))
+        yield shape, statements
+        code_statements = [
+            (IRI(RDF + "type"), IRI(SH + "PropertyShape")),
+            (IRI(SH + "path"), self.iri("code")),
+            (IRI(SH + "in"), RDFList(tuple(Literal(x.concept_c_code) for x in codelist.items))),
+        ]
+        if codelist.extensible:
+            code_statements.append((IRI(SH + "severity"), IRI(SH + "Warning")))
+        yield codes, code_statements
+
+    def _range(self, attr: Union[Attribute, Connector]) -> List[Tuple[IRI, Term]]:
+        if attr.codelist:
+            enum_name = self.context.enum_names[id(attr.codelist)]
+            if attr.attribute_type == "AliasCode":
+                return self._model_shape("AliasCode") + [
+                    (IRI(SH + "node"), self.shape_iri(f"{enum_name}AliasCode"))
+                ]
+            return [(IRI(SH + "node"), self.shape_iri(enum_name))]
+        _type, _ = self.context.ranges.get(id(attr)) or (attr.attribute_type, False)
+        if _type is None:
+            return []
+        _range = self.context.range_for(_type)
+        if _range in XSD_TYPES:
+            return [(IRI(SH + "datatype"), IRI(XSD_TYPES[_range]))]
+        if _range in self.context.type_mapping:
+            # a class
+            return [(IRI(SH + "class"), self.iri(_range))] + self._model_shape(_range)
+        if _range not in self.context.missing_types:
+            self.context.missing_types.append(_range)
+        return []
+
+    def property_shape(
+        self, obj: Object, attr: Union[Attribute, Connector]
+    ) -> Tuple[IRI, Statements]:
+        shape = self.iri(f"{obj.name}Shape-{attr.name}")
+        statements = [
+            (IRI(RDF + "type"), IRI(SH + "PropertyShape")),
+            (IRI(SH + "path"), self.iri(attr.name)),
+        ]
+        self._describe(
+            statements, attr.preferred_term or attr.name, attr.description, attr.reference_url
+        )
+        if isinstance(attr, Connector):
+            required, multivalued = not attr.optional, attr.multivalued
+        else:
+            _, _listed = self.context.ranges.get(id(attr)) or (None, False)
+            required = attr.lower_bound == "1"
+            multivalued = _listed or attr.upper_bound != "1"
+        if required:
+            statements.append((IRI(SH + "minCount"), Literal(1)))
+        if not multivalued:
+            statements.append((IRI(SH + "maxCount"), Literal(1)))
+        statements.extend(self._range(attr))
+        return shape, statements
+
+    def class_shape(self, obj: Object) -> Iterator[Tuple[IRI, Statements]]:
+        statements = [
+            (IRI(RDF + "type"), IRI(SH + "NodeShape")),
+            (IRI(SH + "targetClass"), self.iri(obj.name)),
+        ]
+        self._describe(
+            statements, obj.preferred_term or obj.name, obj.description, obj.reference_url
+        )
+        superclass = self.context.superclasses.get(obj.object_id)
+        if superclass is not None:
+            # the constraints of the superclass apply
+            statements.append((IRI(SH + "node"), self.shape_iri(superclass.name)))
+        properties = [self.property_shape(obj, x) for x in self.context.attributes[obj.object_id]]
+        statements.extend((IRI(SH + "property"), x) for x, _ in properties)
+        yield self.shape_iri(obj.name), statements
+        yield from properties
+        if superclass is not None:
+            yield self.iri(obj.name), [(IRI(RDFS + "subClassOf"), self.iri(superclass.name))]
+
+    def alias_code_shape(self, enum_name: str) -> Iterator[Tuple[IRI, Statements]]:
+        standard_code = self.iri(f"{enum_name}AliasCodeShape-standardCode")
+        yield self.shape_iri(f"{enum_name}AliasCode"), [
+            (IRI(RDF + "type"), IRI(SH + "NodeShape")),
+            (IRI(SH + "property"), standard_code),
+        ]
+        yield standard_code, [
+            (IRI(RDF + "type"), IRI(SH + "PropertyShape")),
+            (IRI(SH + "path"), self.iri("standardCode")),
+            (IRI(SH + "minCount"), Literal(1)),
+            (IRI(SH + "maxCount"), Literal(1)),
+            (IRI(SH + "node"), self.shape_iri(enum_name)),
+        ]
+
+    def statements(self) -> Iterator[Tuple[IRI, Statements]]:
+        for obj in self.context.classes:
+            yield from self.class_shape(obj)
+        aliased = set()
+        for key, codelist in self.context.codelists.items():
+            enum_name = self.context.enum_names[key]
+            if self.context.enums.get(enum_name) is not codelist:
+                # the first codelist with a name is used
+                continue
+            yield from self.codelist_shape(codelist)
+        for attributes in self.context.attributes.values():
+            for attr in attributes:
+                if attr.codelist and attr.attribute_type == "AliasCode":
+                    enum_name = self.context.enum_names[id(attr.codelist)]
+                    if enum_name not in aliased:
+                        aliased.add(enum_name)
+                        yield from self.alias_code_shape(enum_name)
+
 
-def generate(name: str,
-             packages: dict, 
-             objects: dict, 
-             attributes: dict, 
-             connectors: dict, 
-             output_dir: Optional[str] = "output"):
+def generate(
+    name: str,
+    document: Document,
+    ct_content: Optional[dict] = None,
+    codelists: Optional[dict] = None,
+    output_dir: Optional[str] = "output",
+    schema_id: Optional[str] = None,
+    format: str = "turtle",
+    context: Optional[RenderContext] = None,
+) -> str:
     """
-    Create SHACL models from the EAP model
+    Create SHACL shapes from the model, as `{output_dir}/{name}_shapes.ttl` (or `.nt`)
+    :param name: The name of the model
+    :param document: The loaded (and CT merged) document
+    :param ct_content: The loaded controlled terms (for USDM)
+    :param codelists: The loaded codelists (for USDM); the codelists of the attributes are used
+    :param output_dir: The output directory
+    :param schema_id: The schema id (defaults to the document prefix)
+    :param format: The RDF format, `turtle` or `nt`
+    :param context: The render context (defaults to a new context for the document)
+    :returns: the shapes file
     """
-    graph = Graph()
-    graph.bind("sh", SH)
-    graph.bind("skos", SKOS)
-    
+    if context is None:
+        context = RenderContext(document, ct_content=ct_content)
+    if format not in RDF_FORMATS:
+        raise ValueError(f"Unknown RDF format: {format}")
+    builder = ShapesBuilder(document, schema_id, context)
+    filename = os.path.join(output_dir, f"{name}_shapes.{RDF_FORMATS[format][1]}")
+    with open(filename, "w") as fh:
+        count = write_statements(rdf_writer(fh, format, builder.prefixes), builder.statements())
+    for absent_type in context.missing_types:
+        logger.warning(f"Missing type: {absent_type}")
+    print(f"Wrote {count} statements to {filename}")
+    return filename
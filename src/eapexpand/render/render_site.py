@@ -0,0 +1,436 @@
+"""
+Generates a static (Markdown) documentation site for a model; a page for each class, enumeration
+and codelist, with the definitions, synonyms, NCI codes, inheritance and links between the pages
+
+The content of each page is collected (in the parent process) and fingerprinted; only the pages
+whose fingerprint differs from the site manifest are rendered (in worker processes) and written,
+and the pages no longer in the model are removed
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+from eapexpand.models.eap import Attribute, Connector, Document, Object
+from eapexpand.models.usdm_ct import CodeList
+from eapexpand.render.context import RenderContext
+
+# bump when the page layout changes, so every page is rewritten
+SITE_VERSION = 1
+MANIFEST = ".manifest.json"
+# render the pages in worker processes once there are this many to render
+PARALLEL_PAGES = 50
+NCIT_URL = "https://evsexplore.semantics.cancer.gov/evsexplore/concept/ncit/{}"
+_C_CODE = re.compile(r"^C\d+$")
+
+CLASSES = "classes"
+ENUMERATIONS = "enumerations"
+CODELISTS = "codelists"
+
+# a page, as its path in the site and its content
+Page = Tuple[str, dict]
+
+
+def page_path(section: str, name: str) -> str:
+    return f"{section}/{re.sub(r'[^A-Za-z0-9_.-]', '_', name)}.md"
+
+
+def page_fingerprint(values: dict) -> str:
+    content = json.dumps([SITE_VERSION, values], sort_keys=True, default=str)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _nci_code(reference_url: Optional[str]) -> Optional[str]:
+    return reference_url if reference_url and _C_CODE.match(reference_url) else None
+
+
+def _cardinality(attr: Union[Attribute, Connector], listed: bool = False) -> str:
+    if isinstance(attr, Connector):
+        return f"{'0' if attr.optional else '1'}..{'*' if attr.multivalued else '1'}"
+    return f"{attr.lower_bound or '0'}..{'*' if listed else attr.upper_bound or '1'}"
+
+
+class SiteBuilder:
+    """
+    Collects the content of the pages of the site from the data derived by a render context
+
+    Methods:
+        class_page(obj) -> Page:
+            The page for a class.
+        enumeration_page(obj) -> Page:
+            The page for an enumeration.
+        codelist_page(enum_name, codelist) -> Page:
+            The page for a codelist.
+        index_page() -> Page:
+            The index of the pages, by package.
+        pages() -> List[Page]:
+            The pages of the site.
+    """
+
+    def __init__(self, name: str, document: Document, context: Optional[RenderContext] = None):
+        self.name = name
+        self.document = document
+        self.context = context if context is not None else RenderContext(document)
+        self.enumerations = {
+            x.name: x for x in document.objects if x.object_type == "Enumeration"
+        }
+        # the (class, attribute) referring to each class, enumeration and codelist
+        self.referrers: Dict[str, List[Tuple[str, str]]] = {}
+        self.subclasses: Dict[str, List[str]] = {}
+        for object_id, superclass in self.context.superclasses.items():
+            self.subclasses.setdefault(superclass.name, []).append(
+                self.context.objects[object_id].name
+            )
+        for obj in self.context.classes:
+            for attr in self.context.attributes[obj.object_id]:
+                for link in (self._type_link(attr), self._codelist_link(attr)):
+                    if link:
+                        self.referrers.setdefault(link, []).append((obj.name, attr.name))
+
+    def _type_name(self, attr: Union[Attribute, Connector]) -> Optional[str]:
+        _type, _ = self.context.ranges.get(id(attr)) or (attr.attribute_type, False)
+        return _type
+
+    def _type_link(self, attr: Union[Attribute, Connector]) -> Optional[str]:
+        # the page for the type, if it is an enumeration or a class of the model
+        _type = self._type_name(attr)
+        if _type in self.enumerations:
+            return page_path(ENUMERATIONS, _type)
+        if _type in self.context.type_mapping and self.context.range_for(_type) == _type:
+            return page_path(CLASSES, _type)
+        return None
+
+    def _codelist_link(self, attr: Union[Attribute, Connector]) -> Optional[str]:
+        if attr.codelist:
+            return page_path(CODELISTS, self.context.enum_names[id(attr.codelist)])
+        return None
+
+    def _referrers(self, path: str) -> List[dict]:
+        return [
+            dict(name=f"{x}.{y}", link=page_path(CLASSES, x))
+            for x, y in sorted(self.referrers.get(path, []))
+        ]
+
+    def _attribute(
+        self, attr: Union[Attribute, Connector], inherited: bool
+    ) -> Dict[str, Optional[str]]:
+        _, listed = self.context.ranges.get(id(attr)) or (None, False)
+        return dict(
+            name=attr.name,
+            title=attr.preferred_term,
+            type=self._type_name(attr),
+            type_link=self._type_link(attr),
+            cardinality=_cardinality(attr, listed),
+            definition=attr.description,
+            synonyms=list(attr.synonyms or []),
+            nci_code=_nci_code(attr.reference_url),
+            codelist=self.context.enum_names[id(attr.codelist)] if attr.codelist else None,
+            codelist_link=self._codelist_link(attr),
+            inherited=inherited,
+        )
+
+    def class_page(self, obj: Object) -> Page:
+        path = page_path(CLASSES, obj.name)
+        superclass = self.context.superclasses.get(obj.object_id)
+        own = self.context.attributes[obj.object_id]
+        attributes = [self._attribute(x, False) for x in own]
+        attributes.extend(
+            self._attribute(x, True)
+            for x in self.context.inherited_attributes[obj.object_id]
+            if not any(x is y for y in own)
+        )
+        package = self.context.packages.get(obj.package_id)
+        return path, dict(
+            kind="Class",
+            name=obj.name,
+            title=obj.preferred_term,
+            package=package.name if package else None,
+            definition=obj.description,
+            synonyms=list(obj.synonyms or []),
+            nci_code=_nci_code(obj.reference_url),
+            superclass=superclass.name if superclass else None,
+            subclasses=sorted(self.subclasses.get(obj.name, [])),
+            attributes=attributes,
+            referrers=self._referrers(path),
+        )
+
+    def enumeration_page(self, obj: Object) -> Page:
+        path = page_path(ENUMERATIONS, obj.name)
+        return path, dict(
+            kind="Enumeration",
+            name=obj.name,
+            title=obj.preferred_term,
+            definition=obj.description,
+            synonyms=list(obj.synonyms or []),
+            nci_code=_nci_code(obj.reference_url),
+            values=[
+                dict(name=x.name, definition=x.description, nci_code=_nci_code(x.reference_url))
+                for x in obj.object_attributes
+            ],
+            referrers=self._referrers(path),
+        )
+
+    def codelist_page(self, enum_name: str, codelist: CodeList) -> Page:
+        path = page_path(CODELISTS, enum_name)
+        return path, dict(
+            kind="Codelist",
+            name=enum_name,
+            title=codelist.preferred_term,
+            definition=codelist.definition,
+            synonyms=list(codelist.synonyms or []),
+            nci_code=_nci_code(codelist.concept_c_code),
+            extensible=bool(codelist.extensible),
+            items=[
+                dict(
+                    code=x.concept_c_code,
+                    term=x.preferred_term,
+                    synonyms=list(x.synonyms or []),
+                    definition=x.definition,
+                )
+                for x in codelist.items
+            ],
+            referrers=self._referrers(path),
+        )
+
+    def index_page(self) -> Page:
+        sections = []
+        for package, objects in self.context.partitions.items():
+            classes = [x.name for x in objects if x.object_type == "Class"]
+            if classes:
+                sections.append(
+                    dict(title=package, links=[(x, page_path(CLASSES, x)) for x in classes])
+                )
+        for title, section, names in (
+            ("Enumerations", ENUMERATIONS, list(self.enumerations)),
+            ("Codelists", CODELISTS, list(self.context.enums)),
+        ):
+            if names:
+                sections.append(
+                    dict(title=title, links=[(x, page_path(section, x)) for x in names])
+                )
+        return "index.md", dict(
+            kind="Index",
+            name=self.name,
+            version=self.document.version,
+            definition=self.document.description,
+            sections=sections,
+        )
+
+    def pages(self) -> List[Page]:
+        pages = [self.index_page()]
+        pages.extend(self.class_page(x) for x in self.context.classes)
+        pages.extend(self.enumeration_page(x) for x in self.enumerations.values())
+        pages.extend(self.codelist_page(x, y) for x, y in self.context.enums.items())
+        return pages
+
+
+def _cell(value: Optional[str]) -> str:
+    # the text for a table cell
+    return (value or "").strip().replace("|", "\\|").replace("\n", "<br>")
+
+
+def _link(text: str, path: Optional[str], base: str) -> str:
+    if not path:
+        return text
+    return f"[{text}]({os.path.relpath(path, os.path.dirname(base) or '.')})"
+
+
+def _nci_link(code: Optional[str]) -> str:
+    return f"[{code}]({NCIT_URL.format(code)})" if code else ""
+
+
+def _header(path: str, values: dict) -> List[str]:
+    title = values["name"]
+    lines = [f"# {values['kind']}: {title}", ""]
+    if values.get("title") and values["title"] != title:
+        lines.extend([f"*{values['title']}*", ""])
+    if values.get("definition"):
+        lines.extend([values["definition"].strip(), ""])
+    details = []
+    if values.get("package"):
+        details.append(f"- Package: {values['package']}")
+    if values.get("nci_code"):
+        details.append(f"- NCI code: {_nci_link(values['nci_code'])}")
+    if values.get("synonyms"):
+        details.append(f"- Synonyms: {', '.join(values['synonyms'])}")
+    if values.get("superclass"):
+        superclass = values["superclass"]
+        superclass = _link(superclass, page_path(CLASSES, superclass), path)
+        details.append(f"- Specialises: {superclass}")
+    if values.get("subclasses"):
+        subclasses = [_link(x, page_path(CLASSES, x), path) for x in values["subclasses"]]
+        details.append(f"- Specialised by: {', '.join(subclasses)}")
+    if "extensible" in values:
+        details.append(f"- Extensible: {'Yes' if values['extensible'] else 'No'}")
+    if details:
+        lines.extend(details + [""])
+    return lines
+
+
+def _table(headers: List[str], rows: List[List[str]]) -> List[str]:
+    lines = ["| " + " | ".join(headers) + " |", "|" + "---|" * len(headers)]
+    lines.extend("| " + " | ".join(row) + " |" for row in rows)
+    return lines + [""]
+
+
+def render_page(path: str, values: dict) -> str:
+    """
+    The Markdown for a page
+    """
+    if values["kind"] == "Index":
+        lines = [f"# {values['name']}", ""]
+        if values.get("version"):
+            lines.extend([f"Version {values['version']}", ""])
+        if values.get("definition"):
+            lines.extend([values["definition"].strip(), ""])
+        for section in values["sections"]:
+            lines.extend([f"## {section['title']}", ""])
+            lines.extend(f"- {_link(x, y, path)}" for x, y in section["links"])
+            lines.append("")
+        return "\n".join(lines)
+    lines = _header(path, values)
+    if values["kind"] == "Class":
+        for title, inherited in (("Attributes", False), ("Inherited attributes", True)):
+            rows = [
+                [
+                    _cell(x["name"]),
+                    _link(_cell(x["type"]), x["type_link"], path),
+                    x["cardinality"],
+                    _cell(x["definition"]),
+                    _link(_cell(x["codelist"]), x["codelist_link"], path),
+                    _nci_link(x["nci_code"]),
+                ]
+                for x in values["attributes"]
+                if x["inherited"] is inherited
+            ]
+            if rows:
+                lines.extend([f"## {title}", ""])
+                lines.extend(
+                    _table(
+                        ["Name", "Type", "Cardinality", "Definition", "Codelist", "NCI code"],
+                        rows,
+                    )
+                )
+    elif values["kind"] == "Enumeration":
+        lines.extend(["## Values", ""])
+        lines.extend(
+            _table(
+                ["Value", "Definition", "NCI code"],
+                [
+                    [_cell(x["name"]), _cell(x["definition"]), _nci_link(x["nci_code"])]
+                    for x in values["values"]
+                ],
+            )
+        )
+    else:
+        lines.extend(["## Items", ""])
+        lines.extend(
+            _table(
+                ["Code", "Preferred term", "Synonyms", "Definition"],
+                [
+                    [
+                        _nci_link(x["code"]),
+                        _cell(x["term"]),
+                        _cell(", ".join(x["synonyms"])),
+                        _cell(x["definition"]),
+                    ]
+                    for x in values["items"]
+                ],
+            )
+        )
+    if values.get("referrers"):
+        lines.extend(["## Used by", ""])
+        lines.extend(f"- {_link(x['name'], x['link'], path)}" for x in values["referrers"])
+        lines.append("")
+    return "\n".join(lines)
+
+
+def _write_page(job: Tuple[str, str, dict]) -> None:
+    directory, path, values = job
+    filename = os.path.join(directory, path)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, "w") as fh:
+        fh.write(render_page(path, values))
+
+
+def load_manifest(directory: str) -> Dict[str, str]:
+    """
+    The fingerprints of the pages written, by path; empty if the pages were written by
+    another version of the renderer
+    """
+    try:
+        with open(os.path.join(directory, MANIFEST), "r") as fh:
+            manifest = json.load(fh)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("version") != SITE_VERSION:
+        return {}
+    return manifest.get("pages", {})
+
+
+def write_site(
+    directory: str, pages: List[Page], max_workers: Optional[int] = None
+) -> Tuple[List[str], List[str]]:
+    """
+    Write the pages whose fingerprint has changed (or that are missing), and remove the pages
+    no longer in the site
+    :returns: the pages written and the pages removed
+    """
+    manifest = load_manifest(directory)
+    fingerprints = {path: page_fingerprint(values) for path, values in pages}
+    jobs = [
+        (directory, path, values)
+        for path, values in pages
+        if manifest.get(path) != fingerprints[path]
+        or not os.path.exists(os.path.join(directory, path))
+    ]
+    if max_workers == 1 or len(jobs) < PARALLEL_PAGES:
+        for job in jobs:
+            _write_page(job)
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(_write_page, jobs, chunksize=16))
+    removed = []
+    for path in sorted(set(manifest) - set(fingerprints)):
+        filename = os.path.join(directory, path)
+        if os.path.exists(filename):
+            os.remove(filename)
+            removed.append(path)
+    with open(os.path.join(directory, MANIFEST), "w") as fh:
+        json.dump(dict(version=SITE_VERSION, pages=fingerprints), fh, indent=1, sort_keys=True)
+    return [path for _, path, _ in jobs], removed
+
+
+def generate(
+    name: str,
+    document: Document,
+    output_dir: Optional[str] = "output",
+    max_workers: Optional[int] = None,
+    context: Optional[RenderContext] = None,
+) -> List[str]:
+    """
+    Generate the documentation site for the document in `{output_dir}/{name}_site`
+    :param name: The name of the model
+    :param document: The loaded (and CT merged) document
+    :param output_dir: The output directory
+    :param max_workers: Render the pages in this many worker processes
+    :param context: The render context (defaults to a new context for the document)
+    :returns: the pages that were written
+    """
+    directory = os.path.join(output_dir, f"{name}_site")
+    os.makedirs(directory, exist_ok=True)
+    pages = SiteBuilder(name, document, context).pages()
+    written, removed = write_site(directory, pages, max_workers)
+    print(f"Wrote {len(written)} of {len(pages)} pages to {directory}")
+    for path in removed:
+        logger.info(f"Removed page {path}")
+    return written
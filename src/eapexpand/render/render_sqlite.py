@@ -0,0 +1,74 @@
+"""
+Generates the SQLite DDL for the relational mapping of a model (see `relational`)
+"""
+
+from __future__ import annotations
+
+import os
+from typing import List, Optional
+
+from eapexpand.models.eap import Document
+from eapexpand.render.context import RenderContext
+from eapexpand.render.relational import (
+    PRIMARY_KEY,
+    REFERENCE,
+    RelationalModel,
+    Table,
+    relational_model,
+)
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def table_ddl(table: Table) -> List[str]:
+    """
+    The statements creating a table and the indexes on its reference columns
+    """
+    pk = quote_identifier(PRIMARY_KEY)
+    lines = [f"    {pk} INTEGER PRIMARY KEY"]
+    for column in table.columns:
+        line = f"    {quote_identifier(column.name)} {column.sql_type}"
+        if column.references:
+            line += f" REFERENCES {quote_identifier(column.references)}({pk})"
+        lines.append(line)
+    statements = [
+        f"CREATE TABLE IF NOT EXISTS {quote_identifier(table.name)} (\n"
+        + ",\n".join(lines)
+        + "\n);"
+    ]
+    for column in table.columns:
+        if column.kind == REFERENCE:
+            statements.append(
+                f"CREATE INDEX IF NOT EXISTS {quote_identifier(f'{table.name}_{column.name}')} "
+                f"ON {quote_identifier(table.name)}({quote_identifier(column.name)});"
+            )
+    return statements
+
+
+def sqlite_ddl(model: RelationalModel) -> str:
+    """
+    The DDL for the tables of the model
+    """
+    statements = []
+    for table in model.tables.values():
+        statements.extend(table_ddl(table))
+    return "\n".join(statements) + "\n"
+
+
+def generate(
+    name: str,
+    document: Document,
+    output_dir: Optional[str] = "output",
+    context: Optional[RenderContext] = None,
+) -> str:
+    """
+    Generate the SQLite DDL for the document as `{output_dir}/{name}.sql`
+    :returns: the DDL file
+    """
+    filename = os.path.join(output_dir, f"{name}.sql")
+    print("Writing SQLite DDL to", filename)
+    with open(filename, "w") as fh:
+        fh.write(sqlite_ddl(relational_model(document, context)))
+    return filename
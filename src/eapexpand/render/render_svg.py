@@ -0,0 +1,282 @@
+"""
+Exports the diagrams of a model as SVG, from the positions of the objects (and the bend points of
+the connectors) loaded from the EA diagrams
+
+The layout of each diagram (the boxes, their text and the lines) is collected in the parent
+process; the layouts are plain data, so the SVG for the diagrams is rendered in worker processes
+"""
+
+from __future__ import annotations
+
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from xml.sax.saxutils import escape
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+from eapexpand.models.eap import Bounds, Diagram, Document, Object
+
+# render the diagrams in worker processes once there are this many
+PARALLEL_DIAGRAMS = 4
+MARGIN = 20
+LINE_HEIGHT = 14
+# the object types drawn, and their fill
+FILLS = {
+    "Class": "#fffce0",
+    "Enumeration": "#eaf4ff",
+    "DataType": "#eaf4ff",
+    "Note": "#fffff0",
+    "Package": "#f2f2f2",
+    "Boundary": "none",
+    "Text": "none",
+}
+STYLE = """
+  <defs>
+    <marker id="arrow" viewBox="0 0 10 10" refX="10" refY="5"
+            markerWidth="8" markerHeight="8" orient="auto-start-reverse">
+      <path d="M 0 0 L 10 5 L 0 10" fill="none" stroke="#333"/>
+    </marker>
+    <marker id="generalization" viewBox="0 0 10 10" refX="10" refY="5"
+            markerWidth="12" markerHeight="12" orient="auto-start-reverse">
+      <path d="M 0 0 L 10 5 L 0 10 z" fill="#fff" stroke="#333"/>
+    </marker>
+  </defs>
+  <style>
+    text { font-family: Helvetica, Arial, sans-serif; font-size: 11px; fill: #222; }
+    .title { font-weight: bold; }
+    .box { stroke: #555; stroke-width: 1; }
+    .line { fill: none; stroke: #333; stroke-width: 1; }
+    .label { font-size: 10px; fill: #444; }
+  </style>
+"""
+
+
+@dataclass
+class Box:
+    """
+    An object on a diagram
+
+    Attributes:
+        kind (str): The object type, eg `Class`.
+        title (str): The name of the object.
+        lines (List[str]): The text below the title, eg the attributes of a class.
+        bounds (Bounds): The position of the object.
+    """
+
+    kind: str
+    title: str
+    lines: List[str]
+    bounds: Bounds
+
+
+@dataclass
+class Line:
+    """
+    A connector on a diagram
+
+    Attributes:
+        kind (str): The connector type, eg `Association`.
+        points (List[Tuple[float, float]]): The points of the line, from the source to the target.
+        label (Optional[str]): The name of the connector.
+        cardinality (Optional[str]): The cardinality at the target.
+    """
+
+    kind: str
+    points: List[Tuple[float, float]]
+    label: Optional[str] = None
+    cardinality: Optional[str] = None
+
+
+@dataclass
+class DiagramLayout:
+    """
+    The boxes and lines of a diagram
+    """
+
+    name: str
+    boxes: List[Box] = field(default_factory=list)
+    lines: List[Line] = field(default_factory=list)
+
+
+def diagram_filename(diagram: Diagram, names: Dict[str, int]) -> str:
+    """
+    The file for a diagram; the diagram id is added where diagrams share a name
+    """
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", diagram.name or "diagram").strip("_")
+    return f"{slug}_{diagram.id}.svg" if names.get(diagram.name, 0) > 1 else f"{slug}.svg"
+
+
+def _box_lines(obj: Object) -> List[str]:
+    if obj.object_type == "Class":
+        return [f"{x.name}: {x.attribute_type}" for x in obj.object_attributes]
+    if obj.object_type == "Enumeration":
+        return [x.name for x in obj.object_attributes]
+    if obj.object_type in ("Note", "Text"):
+        return [x for x in (obj.note or "").splitlines() if x.strip()]
+    return []
+
+
+def _edge_point(bounds: Bounds, toward: Tuple[float, float]) -> Tuple[float, float]:
+    """
+    The point where the line from the center of a box toward a point leaves the box
+    """
+    cx, cy = bounds.center
+    dx, dy = toward[0] - cx, toward[1] - cy
+    if dx == 0 and dy == 0:
+        return cx, cy
+    scales = []
+    if dx:
+        scales.append(abs(bounds.width / 2 / dx))
+    if dy:
+        scales.append(abs(bounds.height / 2 / dy))
+    scale = min(min(scales), 1)
+    return cx + dx * scale, cy + dy * scale
+
+
+def diagram_layout(diagram: Diagram) -> DiagramLayout:
+    """
+    The boxes for the objects (with a position) and the lines for the visible connectors
+    between them
+    """
+    layout = DiagramLayout(diagram.name)
+    for obj in diagram.objects:
+        bounds = diagram.bounds.get(obj.object_id)
+        if bounds is None or obj.object_type not in FILLS:
+            continue
+        layout.boxes.append(Box(obj.object_type, obj.name or "", _box_lines(obj), bounds))
+    for link in diagram.links:
+        conn = link.connector
+        source = diagram.bounds.get(conn.start_object_id)
+        target = diagram.bounds.get(conn.end_object_id)
+        if link.hidden or source is None or target is None:
+            continue
+        path = list(link.path)
+        cardinality = conn.dest_card if conn.connector_type == "Association" else None
+        start = _edge_point(source, path[0] if path else target.center)
+        end = _edge_point(target, path[-1] if path else source.center)
+        layout.lines.append(
+            Line(
+                conn.connector_type,
+                [start] + path + [end],
+                label=conn.name or None,
+                cardinality=cardinality or None,
+            )
+        )
+    return layout
+
+
+def _text(
+    x: float, y: float, text: str, css: Optional[str] = None, anchor: str = "start"
+) -> str:
+    css = f' class="{css}"' if css else ""
+    return f'  <text x="{x:g}" y="{y:g}" text-anchor="{anchor}"{css}>{escape(text)}</text>'
+
+
+def render_svg(layout: DiagramLayout) -> str:
+    """
+    The SVG for a diagram layout
+    """
+    width = max([x.bounds.right for x in layout.boxes] + [0]) + MARGIN
+    height = max([x.bounds.bottom for x in layout.boxes] + [0]) + MARGIN
+    for line in layout.lines:
+        width = max([width] + [x + MARGIN for x, _ in line.points])
+        height = max([height] + [y + MARGIN for _, y in line.points])
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width:g}" height="{height:g}" '
+        f'viewBox="0 0 {width:g} {height:g}">',
+        f"  <title>{escape(layout.name)}</title>",
+        STYLE.rstrip("\n"),
+    ]
+    for box in layout.boxes:
+        bounds = box.bounds
+        parts.append(
+            f'  <rect class="box" x="{bounds.left}" y="{bounds.top}" width="{bounds.width}" '
+            f'height="{bounds.height}" fill="{FILLS[box.kind]}"/>'
+        )
+        y = bounds.top
+        if box.kind not in ("Note", "Text"):
+            y += LINE_HEIGHT
+            parts.append(_text(bounds.center[0], y, box.title, "title", "middle"))
+            if box.lines:
+                y += LINE_HEIGHT / 2
+                parts.append(
+                    f'  <line class="line" x1="{bounds.left}" y1="{y:g}" '
+                    f'x2="{bounds.right}" y2="{y:g}"/>'
+                )
+        for text in box.lines:
+            # the text that fits in the box
+            if y + LINE_HEIGHT > bounds.bottom:
+                break
+            y += LINE_HEIGHT
+            parts.append(_text(bounds.left + 4, y, text))
+    for line in layout.lines:
+        marker = "generalization" if line.kind == "Generalization" else "arrow"
+        points = " ".join(f"{x:g},{y:g}" for x, y in line.points)
+        parts.append(
+            f'  <polyline class="line" points="{points}" marker-end="url(#{marker})"/>'
+        )
+        (x1, y1), (x2, y2) = line.points[-2], line.points[-1]
+        if line.label:
+            parts.append(_text((x1 + x2) / 2, (y1 + y2) / 2 - 3, line.label, "label", "middle"))
+        if line.cardinality:
+            parts.append(_text(x2 + 4, y2 - 4, line.cardinality, "label"))
+    parts.append("</svg>\n")
+    return "\n".join(parts)
+
+
+def _write_diagram(job: Tuple[str, DiagramLayout]) -> None:
+    filename, layout = job
+    with open(filename, "w") as fh:
+        fh.write(render_svg(layout))
+
+
+def export_diagrams(
+    diagrams: List[Diagram], directory: str, max_workers: Optional[int] = None
+) -> List[str]:
+    """
+    Write the diagrams with a layout (objects with a position) as SVG, in worker processes
+    :returns: the files written
+    """
+    names: Dict[str, int] = {}
+    for diagram in diagrams:
+        names[diagram.name] = names.get(diagram.name, 0) + 1
+    jobs = []
+    for diagram in diagrams:
+        layout = diagram_layout(diagram)
+        if not layout.boxes:
+            logger.info(f"Skipping diagram {diagram.name} ({diagram.id}) without a layout")
+            continue
+        jobs.append((os.path.join(directory, diagram_filename(diagram, names)), layout))
+    if max_workers == 1 or len(jobs) < PARALLEL_DIAGRAMS:
+        for job in jobs:
+            _write_diagram(job)
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(_write_diagram, jobs, chunksize=4))
+    return [filename for filename, _ in jobs]
+
+
+def generate(
+    name: str,
+    document: Document,
+    output_dir: Optional[str] = "output",
+    max_workers: Optional[int] = None,
+) -> List[str]:
+    """
+    Export the diagrams of the document as SVG to `{output_dir}/{name}_diagrams`
+    :param name: The name of the model
+    :param document: The loaded document
+    :param output_dir: The output directory
+    :param max_workers: Render the diagrams in this many worker processes
+    :returns: the files written
+    """
+    directory = os.path.join(output_dir, f"{name}_diagrams")
+    os.makedirs(directory, exist_ok=True)
+    written = export_diagrams(document.diagrams, directory, max_workers)
+    print(f"Wrote {len(written)} of {len(document.diagrams)} diagrams to {directory}")
+    return written
@@ -0,0 +1,95 @@
+"""
+Export the normalised class/attribute rows and the codelist items as delimited text
+"""
+
+from __future__ import annotations
+
+import csv
+import os
+from typing import Dict, Iterable, Optional, Sequence
+
+from eapexpand.models.eap import Document
+from eapexpand.models.usdm_ct import CodeList, DDFEntity
+from eapexpand.render import render_usdm_workbook, render_workbook
+from eapexpand.render.context import RenderContext
+
+# buffer the writes, the rows are small
+BUFFER_SIZE = 1 << 20
+
+CODELIST_HEADERS = ["Codelist"] + render_usdm_workbook.CODELIST_HEADERS
+
+
+def _write(
+    filename: str, header: Sequence[str], rows: Iterable[Sequence], delimiter: str
+) -> int:
+    count = 0
+    with open(filename, "w", newline="", encoding="utf-8", buffering=BUFFER_SIZE) as fh:
+        writer = csv.writer(fh, delimiter=delimiter, lineterminator="\n")
+        writer.writerow(header)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def generate(
+    name: str,
+    document: Document,
+    ct_content: Optional[Dict[str, DDFEntity]] = None,
+    codelists: Optional[Dict[str, CodeList]] = None,
+    output_dir: Optional[str] = "output",
+    delimiter: str = ",",
+    context: Optional[RenderContext] = None,
+):
+    """
+    Generates the delimited text representation of the model; the rows are those of the workbook
+    (without the styling and with the codelists as plain C-codes)
+    :param name: The name of the model - guides what the output files are called
+    :param document: The loaded document
+    :param ct_content: The loaded controlled terms (for USDM)
+    :param codelists: The loaded codelists (for USDM)
+    :param output_dir: The output directory
+    :param delimiter: The field delimiter, `,` for CSV or a tab for TSV
+    :param context: The state of the rendering (defaults to a new context for the document)
+    """
+    if context is None:
+        context = RenderContext(document, ct_content=ct_content)
+    extension = "tsv" if delimiter == "\t" else "csv"
+    _partitions = context.partitions
+    if ct_content is None:
+        header = render_workbook.HEADERS
+        rows = (
+            row
+            for _package_name, objects in _partitions.items()
+            if len(objects) > 1
+            for row in render_workbook.class_rows(context, _package_name, objects)
+        )
+    else:
+        header = ["Package"] + render_usdm_workbook.HEADERS
+        # the class records stop at the class columns, pad them to the width of the header
+        width = len(render_usdm_workbook.HEADERS)
+        rows = (
+            (_package_name,) + record + (None,) * (width - len(record))
+            for _package_name, pobjects in _partitions.items()
+            if len(pobjects) > 1
+            for record in render_usdm_workbook.class_records(context, pobjects)
+        )
+    # create the output directory if it doesn't exist
+    os.makedirs(output_dir, exist_ok=True)
+    fname = os.path.join(output_dir, f"{name}_attributes.{extension}")
+    count = _write(fname, header, rows, delimiter)
+    print(f"Generated {count} rows in {fname}")
+    if codelists:
+        fname = os.path.join(output_dir, f"{name}_codelists.{extension}")
+        count = _write(
+            fname,
+            CODELIST_HEADERS,
+            (
+                (c_code,) + row
+                for c_code, _codelist in codelists.items()
+                if _codelist is not None and c_code.strip().upper() != "CNEW"
+                for row in render_usdm_workbook.codelist_rows(_codelist)
+            ),
+            delimiter,
+        )
+        print(f"Generated {count} rows in {fname}")
@@ -0,0 +1,94 @@
+"""
+A streaming (write-only) workbook writer shared by the workbook renderers
+"""
+
+from __future__ import annotations
+
+from copy import copy
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font, NamedStyle
+from openpyxl.utils import get_column_letter
+
+BODY_STYLE = "eapexpand body"
+HEADER_STYLE = "eapexpand header"
+
+
+def column_widths(
+    rows: Iterable[Sequence], min_width: int = 10, max_width: int = 50
+) -> Dict[int, int]:
+    """
+    The width for each (1-based) column, from the longest value in the column
+    """
+    widths = {}
+    for row in rows:
+        for column, value in enumerate(row, start=1):
+            if value is None:
+                continue
+            length = len(value) if isinstance(value, str) else len(str(value))
+            if length > widths.get(column, min_width):
+                widths[column] = length
+            else:
+                widths.setdefault(column, min_width)
+    return {column: min(width, max_width) for column, width in widths.items()}
+
+
+class StreamingWorkbookWriter:
+    """
+    Writes a workbook in the openpyxl write-only mode; each sheet is written in a single pass
+    with shared named styles (wrapped, top aligned, with bold headers)
+
+    Methods:
+        write_sheet(title: str, header: Sequence[str], rows: Iterable[Sequence]):
+            Writes a worksheet, sizing the columns to the content.
+        save(filename: str):
+            Saves the workbook.
+    """
+
+    def __init__(self, min_width: int = 10, max_width: int = 50):
+        self.workbook = Workbook(write_only=True)
+        self.min_width = min_width
+        self.max_width = max_width
+        alignment = Alignment(wrap_text=True, vertical="top")
+        self.workbook.add_named_style(NamedStyle(BODY_STYLE, alignment=alignment))
+        self.workbook.add_named_style(
+            NamedStyle(HEADER_STYLE, alignment=alignment, font=Font(bold=True))
+        )
+        self._styles = {}
+
+    def _cell(self, worksheet, value, style: str) -> Optional[WriteOnlyCell]:
+        if value is None or value == "":
+            return None
+        cell = WriteOnlyCell(worksheet, value)
+        if style not in self._styles:
+            cell.style = style
+            self._styles[style] = cell._style
+        else:
+            # the cells share the registered style, so only the style ids are copied
+            cell._style = copy(self._styles[style])
+        return cell
+
+    def write_sheet(
+        self, title: str, header: Sequence[str], rows: Iterable[Sequence]
+    ) -> None:
+        """
+        Write a worksheet; the rows for the sheet are held (as values) until the widths are known,
+        as the column dimensions precede the rows in the sheet XML
+        """
+        rows: List[Sequence] = list(rows)
+        worksheet = self.workbook.create_sheet(title)
+        widths = column_widths([header], self.min_width, self.max_width)
+        for column, width in column_widths(
+            rows, self.min_width, self.max_width
+        ).items():
+            widths[column] = max(width, widths.get(column, 0))
+        for column, width in widths.items():
+            worksheet.column_dimensions[get_column_letter(column)].width = width
+        worksheet.append([self._cell(worksheet, x, HEADER_STYLE) for x in header])
+        for row in rows:
+            worksheet.append([self._cell(worksheet, x, BODY_STYLE) for x in row])
+
+    def save(self, filename: str) -> None:
+        self.workbook.save(filename)
@@ -0,0 +1,275 @@
+"""
+Assemble a workbook from sheets serialised in parallel worker processes
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.utils import get_column_letter
+
+from eapexpand.render.workbook_writer import column_widths
+
+# the cellXfs in the stylesheet
+BODY_XF = 1
+HEADER_XF = 2
+
+_INVALID_TITLE = re.compile(r"[\\*?:/\[\]]")
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+NS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+NS_PKG_REL = "http://schemas.openxmlformats.org/package/2006/relationships"
+NS_CT = "http://schemas.openxmlformats.org/package/2006/content-types"
+
+CONTENT_TYPE_MAIN = "application/vnd.openxmlformats-officedocument.spreadsheetml"
+
+STYLES = (
+    XML_HEADER + f'<styleSheet xmlns="{NS_MAIN}">'
+    '<fonts count="2">'
+    '<font><sz val="11"/><name val="Calibri"/><family val="2"/></font>'
+    '<font><b val="1"/><sz val="11"/><name val="Calibri"/><family val="2"/></font>'
+    "</fonts>"
+    '<fills count="2"><fill><patternFill/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="3">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0" applyAlignment="1">'
+    '<alignment vertical="top" wrapText="1"/></xf>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1" applyAlignment="1">'
+    '<alignment vertical="top" wrapText="1"/></xf>'
+    "</cellXfs>"
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    "</styleSheet>"
+)
+
+
+def _clean(value: str) -> str:
+    return ILLEGAL_CHARACTERS_RE.sub("", value)
+
+
+def cell_value(value: Any) -> Any:
+    """
+    The value written to a cell; the values other than text, numbers and booleans (eg a Decimal
+    or a datetime) are written as text
+    """
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    return str(value)
+
+
+def sheet_strings(rows: Iterable[Sequence]) -> List[str]:
+    """
+    The distinct (shared) strings of a sheet, in order of first use
+    """
+    strings = {}
+    for row in rows:
+        for value in row:
+            value = cell_value(value)
+            if isinstance(value, str) and value and not value.startswith("="):
+                strings.setdefault(value, None)
+    return list(strings)
+
+
+def render_sheet(
+    header: Sequence[str],
+    rows: List[Sequence],
+    strings: Dict[str, int],
+    min_width: int = 10,
+    max_width: int = 50,
+) -> Tuple[bytes, int]:
+    """
+    Serialise a worksheet
+    :param strings: The index of each string of the sheet in the shared string table
+    :returns: the sheet XML and the number of references to the shared strings
+    """
+    references = 0
+    widths = column_widths([header], min_width, max_width)
+    for column, width in column_widths(rows, min_width, max_width).items():
+        widths[column] = max(width, widths.get(column, 0))
+    letters = [get_column_letter(x) for x in range(1, max(widths, default=0) + 1)]
+    parts = [
+        XML_HEADER,
+        f'<worksheet xmlns="{NS_MAIN}">',
+        f'<dimension ref="A1:{letters[-1] if letters else "A"}{len(rows) + 1}"/>',
+    ]
+    if widths:
+        parts.append("<cols>")
+        for column, width in sorted(widths.items()):
+            parts.append(
+                f'<col min="{column}" max="{column}" width="{width}" customWidth="1"/>'
+            )
+        parts.append("</cols>")
+    parts.append("<sheetData>")
+    for row_num, (row, style) in enumerate(
+        [(header, HEADER_XF)] + [(x, BODY_XF) for x in rows], start=1
+    ):
+        parts.append(f'<row r="{row_num}">')
+        for idx, value in enumerate(row):
+            value = cell_value(value)
+            if value is None or value == "":
+                continue
+            ref = f"{letters[idx]}{row_num}"
+            if isinstance(value, bool):
+                parts.append(f'<c r="{ref}" s="{style}" t="b"><v>{int(value)}</v></c>')
+            elif isinstance(value, (int, float)):
+                parts.append(f'<c r="{ref}" s="{style}"><v>{value}</v></c>')
+            elif value.startswith("="):
+                parts.append(f'<c r="{ref}" s="{style}"><f>{escape(_clean(value[1:]))}</f></c>')
+            else:
+                references += 1
+                parts.append(f'<c r="{ref}" s="{style}" t="s"><v>{strings[value]}</v></c>')
+        parts.append("</row>")
+    parts.append("</sheetData></worksheet>")
+    return "".join(parts).encode("utf-8"), references
+
+
+def _render_sheet(args) -> Tuple[bytes, int]:
+    return render_sheet(*args)
+
+
+def _shared_strings(strings: Iterable[str], references: int) -> bytes:
+    """
+    The shared string table
+    :param strings: The distinct strings, in index order
+    :param references: The number of cells referencing the strings
+    """
+    strings = list(strings)
+    parts = [
+        XML_HEADER,
+        f'<sst xmlns="{NS_MAIN}" count="{references}" uniqueCount="{len(strings)}">',
+    ]
+    for value in strings:
+        value = escape(_clean(value))
+        if value != value.strip():
+            parts.append(f'<si><t xml:space="preserve">{value}</t></si>')
+        else:
+            parts.append(f"<si><t>{value}</t></si>")
+    parts.append("</sst>")
+    return "".join(parts).encode("utf-8")
+
+
+class ParallelWorkbookWriter:
+    """
+    A drop in replacement for the `StreamingWorkbookWriter` that serialises the sheets in worker
+    processes; the shared string table is numbered before the sheets are dispatched, and each
+    sheet is sent the indices of its own strings
+
+    Methods:
+        write_sheet(title: str, header: Sequence[str], rows: Iterable[Sequence]):
+            Queues a worksheet.
+        save(filename: str):
+            Renders the queued worksheets and writes the workbook.
+    """
+
+    def __init__(
+        self, max_workers: Optional[int] = None, min_width: int = 10, max_width: int = 50
+    ):
+        self.max_workers = max_workers or os.cpu_count()
+        self.min_width = min_width
+        self.max_width = max_width
+        self._sheets: List[Tuple[str, Sequence[str], List[Sequence]]] = []
+        self._titles: Dict[str, None] = {}
+        self._strings: Dict[str, int] = {}
+
+    def _title(self, title: str) -> str:
+        """
+        A valid and unique sheet title (following openpyxl)
+        """
+        title = _INVALID_TITLE.sub("", title)[:31] or "Sheet"
+        candidate, idx = title, 0
+        while candidate.lower() in self._titles:
+            idx += 1
+            candidate = f"{title}{idx}"
+        self._titles[candidate.lower()] = None
+        return candidate
+
+    def write_sheet(
+        self, title: str, header: Sequence[str], rows: Iterable[Sequence]
+    ) -> None:
+        self._sheets.append((self._title(title), header, list(rows)))
+
+    def render(self) -> List[Tuple[bytes, int]]:
+        """
+        Render the sheets in the worker processes
+        """
+        jobs = []
+        self._strings = {}
+        for _, header, rows in self._sheets:
+            strings = {
+                x: self._strings.setdefault(x, len(self._strings))
+                for x in sheet_strings([header] + rows)
+            }
+            jobs.append((header, rows, strings, self.min_width, self.max_width))
+        if self.max_workers == 1 or len(jobs) < 2:
+            return [_render_sheet(x) for x in jobs]
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            # larger sheets in each chunk amortise the transfer of the rows
+            return list(
+                executor.map(
+                    _render_sheet, jobs, chunksize=max(1, len(jobs) // (self.max_workers * 4))
+                )
+            )
+
+    def save(self, filename: str) -> None:
+        rendered = self.render()
+        titles = [x[0] for x in self._sheets]
+        sheet_overrides = "".join(
+            f'<Override PartName="/xl/worksheets/sheet{idx}.xml" '
+            f'ContentType="{CONTENT_TYPE_MAIN}.worksheet+xml"/>'
+            for idx in range(1, len(titles) + 1)
+        )
+        content_types = (
+            XML_HEADER + f'<Types xmlns="{NS_CT}">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            f'<Override PartName="/xl/workbook.xml" ContentType="{CONTENT_TYPE_MAIN}.sheet.main+xml"/>'
+            f'<Override PartName="/xl/styles.xml" ContentType="{CONTENT_TYPE_MAIN}.styles+xml"/>'
+            f'<Override PartName="/xl/sharedStrings.xml" ContentType="{CONTENT_TYPE_MAIN}.sharedStrings+xml"/>'
+            f"{sheet_overrides}</Types>"
+        )
+        root_rels = (
+            XML_HEADER + f'<Relationships xmlns="{NS_PKG_REL}">'
+            f'<Relationship Id="rId1" Type="{NS_REL}/officeDocument" Target="xl/workbook.xml"/>'
+            "</Relationships>"
+        )
+        workbook = (
+            XML_HEADER + f'<workbook xmlns="{NS_MAIN}" xmlns:r="{NS_REL}"><sheets>'
+            + "".join(
+                f'<sheet name={quoteattr(title)} sheetId="{idx}" r:id="rId{idx}"/>'
+                for idx, title in enumerate(titles, start=1)
+            )
+            + "</sheets></workbook>"
+        )
+        count = len(titles)
+        workbook_rels = (
+            XML_HEADER + f'<Relationships xmlns="{NS_PKG_REL}">'
+            + "".join(
+                f'<Relationship Id="rId{idx}" Type="{NS_REL}/worksheet" '
+                f'Target="worksheets/sheet{idx}.xml"/>'
+                for idx in range(1, count + 1)
+            )
+            + f'<Relationship Id="rId{count + 1}" Type="{NS_REL}/styles" Target="styles.xml"/>'
+            f'<Relationship Id="rId{count + 2}" Type="{NS_REL}/sharedStrings" '
+            'Target="sharedStrings.xml"/>'
+            "</Relationships>"
+        )
+        with zipfile.ZipFile(filename, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("[Content_Types].xml", content_types)
+            archive.writestr("_rels/.rels", root_rels)
+            archive.writestr("xl/workbook.xml", workbook)
+            archive.writestr("xl/_rels/workbook.xml.rels", workbook_rels)
+            archive.writestr("xl/styles.xml", STYLES)
+            for idx, (sheet_xml, _) in enumerate(rendered, start=1):
+                archive.writestr(f"xl/worksheets/sheet{idx}.xml", sheet_xml)
+            archive.writestr(
+                "xl/sharedStrings.xml",
+                _shared_strings(self._strings, sum(x[1] for x in rendered)),
+            )
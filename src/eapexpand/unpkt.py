@@ -9,11 +9,26 @@ from typing import Dict, Optional, List
 from .models.sqlite_loader import load_from_file
 
 from .loader import load_expanded_dir
-
-
-def main(source_dir_or_file: str, output_dir: str, gen: dict):
+from .models.subset import Selection, subset_document
+from .render.aspects import RenderSnapshot, check_results, render_aspects
+
+
+def main(
+    source_dir_or_file: str,
+    output_dir: str,
+    gen: dict,
+    linkml_partition: Optional[Dict[str, str]] = None,
+    parallel: bool = False,
+    pydantic_templates: Optional[str] = None,
+    shapes_format: str = "turtle",
+    selection: Optional[Selection] = None,
+):
     """
     Main entry point
+    :param parallel: Render each aspect in a worker process
+    :param pydantic_templates: The templates overriding the `gen-pydantic` templates
+    :param shapes_format: The RDF format for the SHACL shapes (`turtle` or `nt`)
+    :param selection: Render the selected diagrams, packages or classes reachable from a root
     """
     if Path(source_dir_or_file).is_file():
         document = load_from_file(source_dir_or_file)
@@ -24,24 +39,14 @@ def main(source_dir_or_file: str, output_dir: str, gen: dict):
             else os.path.basename(source_dir_or_file)
         )
         document = load_expanded_dir(source_dir_or_file)
-    for aspect, genflag in gen.items():
-        if genflag:
-            if aspect == "prisma":
-                from .render.render_prisma import generate as generate_prisma
-
-                generate_prisma(document.name, document, output_dir)
-            elif aspect == "linkml":
-                from .render.render_linkml import generate as generate_linkml
-
-                generate_linkml(document.name, document=document, output_dir=output_dir)
-            elif aspect == "shapes":
-                from .render.render_shapes import generate as generate_shapes
-
-                generate_shapes(document.name, document, output_dir)
-            else:
-                raise ValueError(f"Unknown aspect: {aspect}")
-    else:
-        # always generate the workbook
-        from .render.render_workbook import generate as generate_workbook
-
-        generate_workbook(document.name, document, output_dir=output_dir)
+    if selection is not None:
+        document = subset_document(document, selection)
+    snapshot = RenderSnapshot(
+        document,
+        linkml_partition=linkml_partition,
+        pydantic_templates=pydantic_templates,
+        shapes_format=shapes_format,
+    )
+    # always generate the workbook
+    aspects = [aspect for aspect, genflag in gen.items() if genflag] + ["workbook"]
+    check_results(render_aspects(aspects, snapshot, output_dir, parallel=parallel))
@@ -1,70 +1,139 @@
 from __future__ import annotations
 
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Iterator, Optional, Set
 import logging
 
-from openpyxl import load_workbook
 from dotenv import load_dotenv
 
 from .helpers.cdisc_connector import CDISCCTConnector
-from .helpers.evs_connector import NCIEVSConnector
+from .helpers.ct_bundle import CTBundleConnector, external_codelist_codes
+from .helpers.ct_cache import CTCache
+from .helpers.evs_connector import EVSCache, NCIEVSConnector
+from .helpers.evs_enrichment import enrich_from_evs
+from .helpers.http_transport import DEFAULT_BURST, DEFAULT_RATE, HTTPTransport
+from .helpers.xlsx_stream import XLSXReader
 from .models.eap import EnumeratedValue, Document, Enumeration
+from .render.aspects import RenderSnapshot, check_results, render_aspects
 
 load_dotenv()
 
 from .loader import load_expanded_dir
 from .models.sqlite_loader import load_from_file
-from .models.usdm_ct import CodeList, DDFEntity, PermissibleValue
+from .models.subset import Selection, subset_document
+from .models.usdm_ct import (
+    CodeList,
+    DDFEntity,
+    FuzzyMatch,
+    MergeReport,
+    PermissibleValue,
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def load_usdm_ct(filename: str):
+def load_usdm_ct(
+    filename: str,
+    bulk: bool = True,
+    ct_bundle: Optional[str] = None,
+    cache: bool = False,
+    cache_dir: Optional[str] = None,
+    transport: Optional[HTTPTransport] = None,
+):
     """
     The CT contains extra descriptive metadata for the Entities and Attributes
     * it also contains the value sets
     * plus references to external value sets
+    :param filename: The USDM CT workbook
+    :param bulk: Download each CT package once and resolve the codelists locally
+    :param ct_bundle: Resolve the external codelists from a CT bundle rather than the CDISC Library
+    :param cache: Use (and store) the parsed CT cached for the workbook and CT package versions
+    :param cache_dir: Override the CT cache directory
+    :param transport: The (shared) transport for the CDISC Library requests
     """
-    ct = CDISCCTConnector(os.environ["CDISC_LIBRARY_API_TOKEN"])
+    if ct_bundle:
+        ct = CTBundleConnector(ct_bundle)
+    else:
+        ct = CDISCCTConnector(
+            os.environ["CDISC_LIBRARY_API_TOKEN"], bulk=bulk, transport=transport
+        )
     # If required
     # evs = NCIEVSConnector()
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f"File not found: {filename}")
+    if ct_bundle and not ct.built_from(filename):
+        # the codelists the workbook references may not all be in the bundle
+        logger.warning(
+            f"The CT bundle {ct_bundle} was built from a different revision of {filename}"
+        )
+    if cache:
+        ct_cache = CTCache(cache_dir)
+        cached = ct_cache.load(filename, ct.package_versions)
+        if cached is not None:
+            return cached
+    # resolve the CT package versions while the workbook is parsed
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        versions = executor.submit(lambda: ct.package_versions)
+        entities, codelists = read_usdm_ct(filename)
+        versions.result()
+    # download just the packages needed for the codelists the workbook references
+    ct.prefetch(external_codelist_codes(entities, codelists))
+    unresolved = resolve_codelists(entities, codelists, ct)
+    if cache:
+        if unresolved:
+            # don't cache the misses, they are retried on the next run
+            logger.warning(
+                f"Not caching the CT, unresolved codelists: {', '.join(sorted(unresolved))}"
+            )
+        else:
+            ct_cache.store(filename, ct.package_versions, (entities, codelists))
+    return entities, codelists
+
 
+def read_usdm_ct(filename: str):
+    """
+    Read the entities and the value sets from the CT workbook, without resolving
+    the external codelists
+    """
     print("Loading USDM CT")
     if not os.path.exists(filename):
         raise FileNotFoundError(f"File not found: {filename}")
-    wbk = load_workbook(filename, read_only=True)
-    # load the entities
-    _ent_attr = wbk["DDF Entities&Attributes"]
+    with XLSXReader(filename) as wbk:
+        entities = read_entities(wbk.iter_rows("DDF Entities&Attributes", min_row=1))
+        print("Loading USDM CT Value Sets")
+        codelists = read_value_sets(wbk.iter_rows("DDF valid value sets", min_row=6))
+    return entities, codelists
+
+
+def read_entities(rows: Iterator[tuple]) -> Dict[str, DDFEntity]:
+    """
+    Map the rows of the "DDF Entities&Attributes" sheet onto the entities
+    """
     entities = {}
-    headers = []
-    for idx, row in enumerate(_ent_attr.iter_rows(min_row=1, values_only=True)):
+    decode = None
+    for idx, row in enumerate(rows):
         if idx == 0:
-            for cell in row:
-                headers.append(cell)
+            decode = DDFEntity.row_decoder(row)
             continue
-        # map the row to a dictionary
-        _row = dict(zip(headers, row))
-        _name = _row["Entity Name"]
-        _role = _row["Role"]
-        _entity = DDFEntity.from_dict(_row)
+        _entity = decode(row)
+        _name = _entity.entity_name
+        _role = _entity.role
         if _entity.role in ("Entity"):
             if not _name in entities:
                 # add an id attribute
-                _id = DDFEntity.from_dict(
-                    {
-                        "Entity Name": f"{_name}",
-                        "Role": "Attribute",
-                        "Logical Data Model Name": "id",
-                        "Definition": "One or more characters used to identify, name, or characterize the nature, "
-                        "properties, or contents of a thing.",
-                        "CT Item Preferred Name": "id",
-                        "Has Value List": "N",
-                        "NCI C-code": "C25364",
-                        "Inherited From": "",
-                        "Synonym(s)": "Identifier; Unique Identifier",
-                    }
+                _id = DDFEntity(
+                    entity_name=f"{_name}",
+                    role="Attribute",
+                    logical_data_model_name="id",
+                    definition="One or more characters used to identify, name, or characterize the nature, "
+                    "properties, or contents of a thing.",
+                    preferred_term="id",
+                    value_list="N",
+                    nci_c_code="C25364",
+                    inherited_from="",
+                    raw_synonyms="Identifier; Unique Identifier",
                 )
                 _entity.attributes.append(_id)
                 entities[_name] = _entity
@@ -77,25 +146,41 @@ def load_usdm_ct(filename: str):
             entities[_name].attributes.append(_entity)
         else:
             raise ValueError(f"Unknown entity type: {_role}")
-    print("Loading USDM CT Value Sets")
-    # load the values from the values sheet
-    _value_sets = wbk["DDF valid value sets"]
-    codelists = {}
+    for entity in entities.values():
+        entity.compile()
+    return entities
 
-    has_extensible = False
+
+def read_value_sets(rows: Iterator[tuple]) -> Dict[str, CodeList]:
+    """
+    Map the rows of the "DDF valid value sets" sheet onto the codelists
+    """
+    codelists = {}
+    decode = None
     # iterate over the rows
-    for idx, row in enumerate(_value_sets.iter_rows(min_row=6, values_only=True)):
+    for idx, row in enumerate(rows):
         if idx == 0:
             _headers = [x for x in row if x]
             has_extensible = "Codelist Extensibility (Yes/No)" in _headers
+            decode = PermissibleValue.row_decoder(has_extensible)
         # get the entity
-        codeset = PermissibleValue.from_row(row, has_extensible)
+        codeset = decode(row)
         assert codeset.codelist_c_code.startswith("C"), f"Invalid codelist code: {codeset.codelist_c_code}"
         if codeset.codelist_c_code not in codelists:
             # create a new codelist
             codelists[codeset.codelist_c_code] = CodeList.from_pvalue(codeset)
         codelists[codeset.codelist_c_code].add_item(codeset)
+    return codelists
+
 
+def resolve_codelists(
+    entities: Dict[str, DDFEntity], codelists: Dict[str, CodeList], ct
+) -> Set[str]:
+    """
+    Bind the codelists to the attributes, retrieving the external codelists with the connector
+    :returns: the external codelists that could not be retrieved
+    """
+    unresolved = set()
     for entity in entities.values():  
         entity: DDFEntity
         for attr in entity.all_attributes.values():
@@ -123,6 +208,7 @@ def load_usdm_ct(filename: str):
                             if codelist:
                                 codelists[attr.external_code_list] = codelist
                             else:
+                                unresolved.add(attr.external_code_list)
                                 print(
                                     f"Retrieving codelist {attr.external_code_list} for {entity.entity_name}.{attr.logical_data_model_name} failed"
                                 )
@@ -135,25 +221,71 @@ def load_usdm_ct(filename: str):
                     print(
                         f"Extracting {attr.value_list}  for {attr.logical_data_model_name} failed"
                     )
+    return unresolved
 
-    return entities, codelists
 
+def merge_usdm_ct(document: Document, ct_content: Dict[str, DDFEntity]) -> MergeReport:
+    """
+    Merge the CT content (definitions, codes, terms, synonyms and codelists) into the
+    classes and attributes of the model, joining on the class and attribute names
+    """
+    report = MergeReport()
+    for entity in document.objects:
+        if entity.object_type != "Class":
+            logger.debug(f"Skipping {entity.object_type} {entity.name}")
+            continue
+        _content = ct_content.get(entity.name)  # type: DDFEntity
+        if _content is None:
+            report.unmatched_classes.append(entity.name)
+            continue
+        report.merged_classes.append(entity.name)
+        if _content.definition:
+            # add the definition
+            entity.definition = _content.definition
+        if _content.nci_c_code:
+            # add the nci code
+            entity.reference_url = _content.nci_c_code
+        if _content.preferred_term:
+            entity.preferred_term = _content.preferred_term
+        if _content.synonyms:
+            entity.synonyms = _content.synonyms
+        # combine the attributes
+        for attr in entity.all_attributes:
+            _attr, fuzzy = _content.lookup_attribute(attr.name)
+            if _attr is None:
+                report.unmatched_attributes.append((entity.name, attr.name))
+                continue
+            if fuzzy:
+                report.fuzzy_matches.append(
+                    FuzzyMatch(entity.name, attr.name, _attr.logical_data_model_name)
+                )
+            if _attr.definition:
+                attr.definition = _attr.definition
+            if _attr.nci_c_code:
+                attr.reference_url = _attr.nci_c_code
+            if _attr.codelist:
+                logger.debug(
+                    f"Adding codelist {_attr.codelist.concept_c_code} to {entity.name}.{attr.name}"
+                )
+                attr.codelist = _attr.codelist
+            if _attr.synonyms:
+                attr.synonyms = _attr.synonyms
+            if _attr.preferred_term:
+                attr.preferred_term = _attr.preferred_term
+    return report
 
-def main_usdm(
-    source_dir_or_file: str, 
-    controlled_term: str, 
-    output_dir: str, 
-    api_metadata: dict,
-    gen: Dict[str, bool]
-):
-    NAMESPACE = "https://cdisc.org/usdm"
+
+def load_usdm_document(source_dir_or_file: str, namespace: str, api_metadata: dict) -> Document:
+    """
+    Load the USDM model from a QEA file (or an expanded directory)
+    """
     if Path(source_dir_or_file).is_file():
         assert Path(source_dir_or_file).suffix == ".qea", "Only QEA files are supported"
         logger.info(f"Loading from file {source_dir_or_file}")
         # handle the cases, release_3-5-0 and v3.5.0
         version = Path(source_dir_or_file).stem[:-9]        
         name = "USDM" + "_" + version
-        document = load_from_file(source_dir_or_file, prefix=NAMESPACE, name=name, api_metadata=api_metadata)
+        document = load_from_file(source_dir_or_file, prefix=namespace, name=name, api_metadata=api_metadata)
     else:
         logger.info(f"Loading from directory {source_dir_or_file}")
         version = Path(source_dir_or_file).name.split("_")[0]
@@ -170,83 +302,87 @@ def main_usdm(
         "for digital protocol content, defining reusable protocols expressing scientific questions "
         "via structure and concepts that are reused and referenced downstream, creating a knowledge graph."
     )
-    document.add_prefix("usdm", NAMESPACE)
+    document.add_prefix("usdm", namespace)
     document.add_prefix("ncit", "https://ncicb.nci.nih.gov/xml/owl/EVS/Thesaurus.owl")
-    # loaded content from the USDM CT
-    ct_content, codelists = load_usdm_ct(controlled_term)
+    return document
+
+
+def main_usdm(
+    source_dir_or_file: str, 
+    controlled_term: str, 
+    output_dir: str, 
+    api_metadata: dict,
+    gen: Dict[str, bool],
+    ct_bundle: Optional[str] = None,
+    ct_cache: bool = True,
+    enrich_evs: bool = False,
+    workbook_workers: Optional[int] = None,
+    linkml_partition: Optional[Dict[str, str]] = None,
+    linkml_cache: bool = True,
+    parallel: bool = False,
+    pydantic_templates: Optional[str] = None,
+    shapes_format: str = "turtle",
+    selection: Optional[Selection] = None,
+    transport: Optional[HTTPTransport] = None,
+):
+    NAMESPACE = "https://cdisc.org/usdm"
+    # one rate limited transport (and connection pool) for the CDISC Library and EVS requests
+    if transport is None:
+        transport = HTTPTransport(rate=DEFAULT_RATE, burst=DEFAULT_BURST)
+    # the CT is independent of the model until the merge, so load it while the model loads
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        ct_future = executor.submit(
+            load_usdm_ct,
+            controlled_term,
+            ct_bundle=ct_bundle,
+            cache=ct_cache,
+            transport=transport,
+        )
+        document = load_usdm_document(source_dir_or_file, NAMESPACE, api_metadata)
+        if selection is not None:
+            # only the selected classes are merged with the CT, enriched and rendered
+            document = subset_document(document, selection)
+        # loaded content from the USDM CT
+        ct_content, codelists = ct_future.result()
+    logger.info(f"Loaded the CT, API requests: {transport.stats.as_dict()}")
     # update the document with the CT content
-    for entity in document.objects:
-        if entity.object_type == "Class":
-            # add the codelist to the class
-            if entity.name in ct_content:
-                # print(f"Adding CT content for {object.name}")
-                _content = ct_content[entity.name]  # type: DDFEntity
-                if _content.definition:
-                    # add the definition
-                    entity.definition = _content.definition
-                if _content.nci_c_code:
-                    # add the nci code
-                    entity.reference_url = _content.nci_c_code
-                if _content.preferred_term:
-                    entity.preferred_term = _content.preferred_term
-                if _content.synonyms:
-                    entity.synonyms = _content.synonyms
-                # combine the attributes
-                for attr in entity.all_attributes:
-                    if _content.get_attribute(attr.name):
-                        # match the attribute by name
-                        # print(f"Adding CT content for {object.name}.{attr.name}")
-                        _attr = _content.get_attribute(attr.name)
-                        if _attr.definition:
-                            attr.definition = _attr.definition
-                        if _attr.nci_c_code:
-                            attr.reference_url = _attr.nci_c_code
-                        if _attr.codelist:
-                            print(
-                                f"Adding codelist {_attr.codelist.concept_c_code} to {entity.name}.{attr.name}"
-                            )
-                            attr.codelist = _attr.codelist
-                        if _attr.synonyms:
-                            attr.synonyms = _attr.synonyms
-                        if _attr.preferred_term:
-                            attr.preferred_term = _attr.preferred_term
-        else:
-            print(f"Skipping {entity.object_type} {entity.name}")
+    report = merge_usdm_ct(document, ct_content)
+    logger.info(
+        f"Merged CT content into {len(report.merged_classes)} classes "
+        f"({len(report.fuzzy_matches)} fuzzy matches, "
+        f"{len(report.unmatched_classes)} classes and "
+        f"{len(report.unmatched_attributes)} attributes unmatched)"
+    )
+    for match in report.fuzzy_matches:
+        logger.info(
+            f"Fuzzy match for {match.entity_name}.{match.attribute_name} "
+            f"(CT {match.matched_name})"
+        )
+    if enrich_evs:
+        # fill in missing definitions and synonyms from NCI EVS
+        enrich_from_evs(
+            document, codelists, NCIEVSConnector(transport=transport, cache=EVSCache())
+        )
+        logger.info(f"Enriched from EVS, API requests: {transport.stats.as_dict()}")
     # for concept in ct_content.values():
     #     if concept.definition:
     #         definitions[concept.entity_name] = concept.definition
     #     for attr in concept.attributes:
     #         if attr.definition:
     #             definitions[attr.logical_data_model_name] = attr.definition
+    snapshot = RenderSnapshot(
+        document,
+        ct_content=ct_content,
+        codelists=codelists,
+        schema_id="https://cdisc.org/usdm/" + document.name,
+        linkml_partition=linkml_partition,
+        linkml_cache=linkml_cache,
+        workbook_workers=workbook_workers,
+        pydantic_templates=pydantic_templates,
+        shapes_format=shapes_format,
+    )
     for aspect, genflag in gen.items():
         logger.info(f"Checking generation of {aspect} as {genflag}")
-        if genflag:
-            if aspect == "prisma":
-                from .render.render_prisma import generate as generate_prisma
-
-                generate_prisma(
-                    document.name, document, ct_content, codelists, output_dir
-                )
-            elif aspect == "linkml":
-                from .render.render_linkml import (
-                    generate_schema_builder as generate_linkml,
-                )
-
-                generate_linkml(
-                    name=document.name,
-                    document=document,
-                    schema_id="https://cdisc.org/usdm/" + document.name,
-                    output_dir=output_dir,
-                )
-            elif aspect == "shapes":
-                from .render.render_shapes import generate as generate_shapes
-
-                generate_shapes(
-                    document.name, document, ct_content, codelists, output_dir
-                )
-            else:
-                raise ValueError(f"Unknown aspect: {aspect}")
     # always generate the workbook
-    from .render.render_usdm_workbook import generate as generate_workbook
-
-    _ = generate_workbook(document.name, document, ct_content, codelists, output_dir)
+    aspects = [aspect for aspect, genflag in gen.items() if genflag] + ["workbook"]
+    check_results(render_aspects(aspects, snapshot, output_dir, parallel=parallel))
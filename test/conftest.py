@@ -1,7 +1,260 @@
 import pytest
 from pathlib import Path
+from openpyxl import Workbook
 
 
 @pytest.fixture
 def ct_file():
     return Path(__file__).parent / "fixtures" / "USDM_CT.xlsx"
+
+
+ENTITY_HEADERS = (
+    "Entity Name",
+    "Role",
+    "Inherited From",
+    "Logical Data Model Name",
+    "NCI C-code",
+    "CT Item Preferred Name",
+    "Synonym(s)",
+    "Definition",
+    "Has Value List",
+    "Codelist URL",
+)
+
+ENTITY_ROWS = (
+    ("Study", "Entity", None, "Study", "C15206", "Study", "Clinical Study; Trial", "A clinical study.", "N", None),
+    ("Study", "Attribute", None, "name", "C68631", "Study Name", None, "The name of the study.", "N", None),
+    ("Study", "Attribute", None, "studyType", "C142175", "Study Type", None, "The type of study.", "Y (C99077)", None),
+    ("Study", "Relationship", None, "versions", "C215491", "Study Version", None, "The versions of the study.", "N", None),
+    ("StudyVersion", "Entity", None, "StudyVersion", "C93490", "Study Version", None, "A version of a study.", "N", None),
+    ("StudyVersion", "Attribute", None, "versionIdentifier", "C93490", "Version Identifier", None, "The version.", "N", None),
+    ("StudyVersion", "Complex Datatype Relationship", None, "trialIntentTypes", "C49652", "Trial Intent Type", "Intent", "The intent.", "Y (Point to C66736)", None),
+    ("StudyVersion", "Attribute", None, "status", "C25688", "Status", None, "The status.", "Y (CNEW)", None),
+)
+
+VALUE_SET_HEADERS = (
+    "Project",
+    "Entity",
+    "Attribute",
+    "Codelist C-code",
+    "Codelist Extensibility (Yes/No)",
+    "Concept C-code",
+    "Preferred Term",
+    "Synonyms",
+    "Definition",
+)
+
+VALUE_SET_ROWS = (
+    ("DDF", "Study", "studyType", "C99077", "No", "C98388", "Interventional Study", "Interventional", "An interventional study."),
+    ("DDF", "Study", "studyType", "C99077", "No", "C16084", "Observational Study", None, "An observational study."),
+)
+
+
+def write_ct_workbook(filename, entity_rows=ENTITY_ROWS, value_set_rows=VALUE_SET_ROWS):
+    """
+    Write a (small) USDM CT workbook
+    """
+    wbk = Workbook()
+    entities = wbk.active
+    entities.title = "DDF Entities&Attributes"
+    entities.append(ENTITY_HEADERS)
+    for row in entity_rows:
+        entities.append(row)
+    value_sets = wbk.create_sheet("DDF valid value sets")
+    for idx in range(5):
+        value_sets.append((f"Preamble {idx}",))
+    value_sets.append(VALUE_SET_HEADERS)
+    for row in value_set_rows:
+        value_sets.append(row)
+    wbk.save(filename)
+    return filename
+
+
+@pytest.fixture
+def entity_headers():
+    return ENTITY_HEADERS
+
+
+@pytest.fixture
+def entity_rows():
+    return list(ENTITY_ROWS)
+
+
+@pytest.fixture
+def value_set_rows():
+    return list(VALUE_SET_ROWS)
+
+
+@pytest.fixture
+def make_ct_workbook():
+    return write_ct_workbook
+
+
+@pytest.fixture
+def ct_workbook(tmp_path):
+    return write_ct_workbook(tmp_path / "USDM_CT.xlsx")
+
+
+def build_document():
+    """
+    Build a (small) USDM like model
+    """
+    from eapexpand.models.eap import Attribute, Class, Connector, Document, Package
+
+    core = Package(object_id=1, object_type="Package", name="Core", package_id=1)
+    study_design = Package(
+        object_id=2, object_type="Package", name="Study Design", package_id=2
+    )
+    core.parent_id = 0
+    study_design.parent_id = 1
+    study_design.parent = core
+    code = Class(object_id=10, object_type="Class", name="Code", package_id=1)
+    code.object_attributes = [
+        Attribute(object_id=10, name="id", attribute_type="String", lower_bound="1", upper_bound="1", pos=0),
+        Attribute(object_id=10, name="code", attribute_type="String", lower_bound="1", upper_bound="1", pos=1),
+        Attribute(object_id=10, name="decode", attribute_type="String", lower_bound="1", upper_bound="1", pos=2),
+    ]
+    study = Class(object_id=11, object_type="Class", name="Study", package_id=1, note="A study")
+    study.object_attributes = [
+        Attribute(object_id=11, name="id", attribute_type="String", lower_bound="1", upper_bound="1", pos=0),
+        Attribute(object_id=11, name="name", attribute_type="String", lower_bound="1", upper_bound="1", pos=1),
+        Attribute(object_id=11, name="studyType", attribute_type="Code", lower_bound="0", upper_bound="1", pos=2),
+        Attribute(object_id=11, name="labels", attribute_type="List<String>", lower_bound="0", upper_bound="*", pos=3),
+    ]
+    version = Class(object_id=12, object_type="Class", name="StudyVersion", package_id=2)
+    version.object_attributes = [
+        Attribute(object_id=12, name="id", attribute_type="String", lower_bound="1", upper_bound="1", pos=0),
+        Attribute(object_id=12, name="versionIdentifier", attribute_type="String", lower_bound="1", upper_bound="1", pos=1),
+        Attribute(object_id=12, name="status", attribute_type="Code", lower_bound="1", upper_bound="1", pos=2),
+    ]
+    amendment = Class(object_id=13, object_type="Class", name="StudyAmendment", package_id=2)
+    amendment.object_attributes = [
+        Attribute(object_id=13, name="number", attribute_type="Integer", lower_bound="1", upper_bound="1", pos=0),
+    ]
+    versions = Connector(
+        connector_id=100,
+        connector_type="Association",
+        name="versions",
+        start_object_id=11,
+        end_object_id=12,
+        dest_card="0..*",
+        source_object=study,
+        target_object=version,
+    )
+    intents = Connector(
+        connector_id=101,
+        connector_type="Association",
+        name="trialIntentTypes",
+        start_object_id=12,
+        end_object_id=10,
+        dest_card="1..*",
+        source_object=version,
+        target_object=code,
+    )
+    generalization = Connector(
+        connector_id=102,
+        connector_type="Generalization",
+        start_object_id=13,
+        end_object_id=12,
+        source_object=amendment,
+        target_object=version,
+    )
+    study.outgoing_connections.append(versions)
+    version.incoming_connections.append(versions)
+    version.outgoing_connections.append(intents)
+    code.incoming_connections.append(intents)
+    amendment.generalizations.append(generalization)
+    version.specializations.append(generalization)
+    objects = [core, study_design, code, study, version, amendment]
+    core.objects = [code, study]
+    study_design.objects = [version, amendment]
+    document = Document(
+        name="USDM_test",
+        prefix="https://cdisc.org/usdm",
+        packages=[core, study_design],
+        objects=objects,
+        diagrams=[],
+    )
+    document.version = "v4.0.0"
+    document.root_item = "Study"
+    document.description = "A test model"
+    document.add_prefix("usdm", "https://cdisc.org/usdm")
+    document.add_prefix("ncit", "https://ncicb.nci.nih.gov/xml/owl/EVS/Thesaurus.owl")
+    return document
+
+
+@pytest.fixture
+def document():
+    return build_document()
+
+
+def extend_document(document):
+    """
+    Add the awkward cases to the model; AliasCode attributes, superclass unions, maps, unnamed codelists
+    and text that needs quoting in YAML
+    """
+    from eapexpand.models.eap import Attribute, Class, Connector
+    from eapexpand.models.usdm_ct import CodeList, PermissibleValue
+
+    codelist = CodeList(
+        concept_c_code="C188725",
+        preferred_term="Sex of Participants",
+        synonyms=["Sex"],
+        definition="The sex: of the participants #1",
+    )
+    for code, term in (("C16576", "Female"), ("C20197", "Male"), ("C49636", None)):
+        codelist.add_item(
+            PermissibleValue(
+                project="DDF",
+                entity_name="Population",
+                attribute_name="sex",
+                codelist_c_code="C188725",
+                concept_c_code=code,
+                preferred_term=term,
+                synonyms=["F"] if code == "C16576" else [],
+            )
+        )
+    unnamed = CodeList(
+        concept_c_code="C66 737",
+        entity_name="Population",
+        attribute_name="level",
+        definition="",
+    )
+    population = Class(
+        object_id=20,
+        object_type="Class",
+        name="Population",
+        package_id=2,
+        reference_url="CNEW",
+        note="  Ünïcode * notes: with 'quotes' and a very long description that goes well beyond the eighty character YAML line width  ",
+    )
+    population.object_attributes = [
+        Attribute(object_id=20, name="name", attribute_type="String", lower_bound="1", upper_bound="1", pos=0, synonyms=["Label"]),
+        Attribute(object_id=20, name="plannedSex", attribute_type="AliasCode", lower_bound="0", upper_bound="*", pos=1, codelist=codelist),
+        Attribute(object_id=20, name="sex", attribute_type="Code", lower_bound="1", upper_bound="1", pos=2, codelist=codelist, reference_url="http://example.org/sex"),
+        Attribute(object_id=20, name="level", attribute_type="Code", pos=3, codelist=unnamed),
+        Attribute(object_id=20, name="extensions", attribute_type="List<Map>", pos=4),
+        Attribute(object_id=20, name="timing", attribute_type="ScheduledInstance", pos=5, upper_bound="1"),
+        Attribute(object_id=20, name="uuid", attribute_type="Uuid", lower_bound="1", upper_bound="1", pos=6),
+    ]
+    empty = Class(object_id=21, object_type="Class", name="Empty", package_id=2)
+    study = [x for x in document.objects if x.name == "Study"][0]
+    populations = Connector(
+        connector_id=200,
+        connector_type="Association",
+        name="populations",
+        start_object_id=11,
+        end_object_id=20,
+        dest_card="1",
+        source_object=study,
+        target_object=population,
+        definition="The populations.",
+    )
+    study.outgoing_connections.append(populations)
+    document._objects.extend([population, empty])
+    return document
+
+
+@pytest.fixture
+def extended_document(document):
+    return extend_document(document)
@@ -0,0 +1,105 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+PACKAGES = {
+    "_links": {
+        "packages": [
+            {"href": f"/mdr/ct/packages/{vocab}-2024-03-29"}
+            for vocab in ("ddfct", "sdtmct", "protocolct", "glossaryct")
+        ]
+    }
+}
+
+SDTMCT = {
+    "codelists": [
+        {
+            "conceptId": "C66736",
+            "submissionValue": "TRIALINT",
+            "preferredTerm": "CDISC SDTM Trial Intent Type Terminology",
+            "extensible": "true",
+            "terms": [
+                {"conceptId": "C15714", "preferredTerm": "Basic Research"},
+                {"conceptId": "C49654", "preferredTerm": "Cure Study"},
+            ],
+        }
+    ]
+}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Serves a tiny subset of the CDISC Library API
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.hits.append((self.path, self.headers.get("api-key")))
+        if self.path == "/flaky" and server.failures > 0:
+            server.failures -= 1
+            self.send_response(503)
+            self.end_headers()
+            return
+        if self.path == "/throttled" and server.failures > 0:
+            server.failures -= 1
+            self.send_response(429)
+            self.send_header("Retry-After", "120")
+            self.end_headers()
+            return
+        if self.path == "/missing":
+            self.send_response(404)
+            self.end_headers()
+            return
+        if self.path == "/slow":
+            time.sleep(0.5)
+        if self.path in server.unavailable:
+            self.send_response(500)
+            self.end_headers()
+            return
+        if self.path == "/api/mdr/ct/packages":
+            body = PACKAGES
+        elif self.path == "/api/mdr/ct/packages/sdtmct-2024-03-29/codelists/C66736":
+            body = SDTMCT["codelists"][0]
+        elif "/codelists/" in self.path:
+            self.send_response(404)
+            self.end_headers()
+            return
+        elif self.path == "/api/mdr/ct/packages/sdtmct-2024-03-29":
+            body = SDTMCT
+        elif self.path.startswith("/api/mdr/ct/packages/"):
+            body = {"codelists": []}
+        else:
+            body = {"path": self.path}
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class StandInServer(ThreadingHTTPServer):
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server_address[1]}{path}"
+
+
+@pytest.fixture
+def server():
+    """
+    A stand-in for the CDISC Library API, recording the requests it serves
+    """
+    httpd = StandInServer(("127.0.0.1", 0), StandInHandler)
+    httpd.hits = []
+    httpd.failures = 0
+    httpd.unavailable = set()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
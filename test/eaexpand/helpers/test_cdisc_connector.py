@@ -1,6 +1,7 @@
 import os
 from dotenv import load_dotenv
 from eapexpand.helpers.cdisc_connector import CDISCCTConnector
+from eapexpand.helpers.http_transport import HTTPTransport
 
 load_dotenv()
 
@@ -17,3 +18,69 @@ def test_get_term():
     CL = "C66736"
     codelist = client.retrieve_valueset(CL)
     assert codelist is not None
+
+
+def test_connector_bulk_download(server):
+    transport = HTTPTransport()
+    connector = CDISCCTConnector("secret", bulk=True, transport=transport)
+    connector._base_url = server.url("/api")
+    codelist = connector.retrieve_valueset("C66736")
+    assert codelist.submission_value == "TRIALINT"
+    assert codelist.extensible is True
+    assert [x.concept_c_code for x in codelist.items] == ["C15714", "C49654"]
+    assert codelist.source_package == "/mdr/ct/packages/sdtmct-2024-03-29"
+    assert connector.retrieve_valueset("C00000") is None
+    # the listing once, then each package once
+    assert len(server.hits) == 5
+    assert all(key == "secret" for _, key in server.hits)
+    connector.retrieve_valueset("C00000")
+    assert len(server.hits) == 5
+
+
+def test_connector_prefetch(server):
+    connector = CDISCCTConnector("secret", bulk=True, transport=HTTPTransport())
+    connector._base_url = server.url("/api")
+    connector.prefetch()
+    assert len(server.hits) == 5
+    assert connector.retrieve_valueset("C66736").submission_value == "TRIALINT"
+    assert len(server.hits) == 5
+
+
+def test_connector_prefetch_stops_when_found(server):
+    connector = CDISCCTConnector("secret", bulk=True, transport=HTTPTransport())
+    connector._base_url = server.url("/api")
+    connector.prefetch(["C66736"])
+    # the listing, then the packages in search order until the codelist is found
+    assert [path for path, _ in server.hits] == [
+        "/api/mdr/ct/packages",
+        "/api/mdr/ct/packages/ddfct-2024-03-29",
+        "/api/mdr/ct/packages/sdtmct-2024-03-29",
+    ]
+    assert connector.retrieve_valueset("C66736").submission_value == "TRIALINT"
+    assert len(server.hits) == 3
+
+
+def test_connector_package_failure_falls_through(server):
+    # the sdtmct package can't be downloaded, but its codelists can be
+    server.unavailable.add("/api/mdr/ct/packages/sdtmct-2024-03-29")
+    transport = HTTPTransport(retries=0)
+    connector = CDISCCTConnector("secret", bulk=True, transport=transport)
+    connector._base_url = server.url("/api")
+    connector.prefetch(["C66736"])
+    codelist = connector.retrieve_valueset("C66736")
+    assert codelist.submission_value == "TRIALINT"
+    assert codelist.source_package == "/mdr/ct/packages/sdtmct-2024-03-29"
+    # the failed package is not requested again
+    packages = [path for path, _ in server.hits if path.endswith("sdtmct-2024-03-29")]
+    assert len(packages) == 1
+    # a codelist in none of the packages
+    assert connector.retrieve_valueset("C00000") is None
+    assert transport.stats.misses == 1
+
+
+def test_connector_unavailable_package_without_codelists(server):
+    server.unavailable.add("/api/mdr/ct/packages/ddfct-2024-03-29")
+    connector = CDISCCTConnector("secret", bulk=True, transport=HTTPTransport(retries=0))
+    connector._base_url = server.url("/api")
+    # the next vocabulary is searched
+    assert connector.retrieve_valueset("C66736").submission_value == "TRIALINT"
@@ -0,0 +1,82 @@
+import pytest
+
+from eapexpand.helpers.ct_bundle import (
+    CTBundleConnector,
+    build_bundle,
+    read_bundle,
+    write_bundle,
+)
+from eapexpand.models.usdm_ct import CodeList, PermissibleValue
+from eapexpand.usdm_unpkt import load_usdm_ct
+
+
+class StubConnector:
+    package_versions = {"sdtmct": "/mdr/ct/packages/sdtmct-2024-03-29"}
+
+    def __init__(self):
+        self.requested = []
+
+    def retrieve_valueset(self, codelist_code):
+        self.requested.append(codelist_code)
+        codelist = CodeList(
+            concept_c_code=codelist_code,
+            submission_value="TRIALINT",
+            preferred_term="Trial Intent Type",
+            extensible=True,
+            source_package=self.package_versions["sdtmct"],
+        )
+        codelist.add_item(
+            PermissibleValue(
+                project="DDF",
+                entity_name="",
+                attribute_name="",
+                codelist_c_code=codelist_code,
+                concept_c_code="C15714",
+                preferred_term="Basic Research",
+            )
+        )
+        return codelist
+
+
+def test_bundle_round_trip(ct_workbook, tmp_path):
+    connector = StubConnector()
+    bundle = build_bundle(ct_workbook, connector)
+    # local and CNEW codelists are not bundled
+    assert connector.requested == ["C66736"]
+    assert bundle["packages"] == StubConnector.package_versions
+    filename = tmp_path / "ct.ctbundle.json.gz"
+    write_bundle(bundle, filename)
+    assert read_bundle(filename)["codelists"].keys() == {"C66736"}
+    codelist = CTBundleConnector(filename).retrieve_valueset("C66736")
+    assert codelist.source_package == "/mdr/ct/packages/sdtmct-2024-03-29"
+    assert codelist.items[0].preferred_term == "Basic Research"
+    assert CTBundleConnector(filename).retrieve_valueset("C00000") is None
+
+
+def test_load_from_bundle(ct_workbook, tmp_path, monkeypatch):
+    monkeypatch.delenv("CDISC_LIBRARY_API_TOKEN", raising=False)
+    filename = tmp_path / "ct.ctbundle.json.gz"
+    write_bundle(build_bundle(ct_workbook, StubConnector()), filename)
+    entities, codelists = load_usdm_ct(ct_workbook, ct_bundle=filename, cache=False)
+    intent = entities["StudyVersion"].get_attribute("trialIntentTypes")
+    assert intent.codelist.submission_value == "TRIALINT"
+    assert "C66736" in codelists
+
+
+def test_bundle_for_another_workbook(ct_workbook, tmp_path, monkeypatch, caplog):
+    monkeypatch.delenv("CDISC_LIBRARY_API_TOKEN", raising=False)
+    filename = tmp_path / "ct.ctbundle.json.gz"
+    bundle = build_bundle(ct_workbook, StubConnector())
+    write_bundle(bundle, filename)
+    assert CTBundleConnector(filename).built_from(ct_workbook)
+    write_bundle(dict(bundle, workbook_sha256="0" * 64), filename)
+    assert not CTBundleConnector(filename).built_from(ct_workbook)
+    load_usdm_ct(ct_workbook, ct_bundle=filename, cache=False)
+    assert "different revision" in caplog.text
+
+
+def test_not_a_bundle(tmp_path):
+    filename = tmp_path / "other.json.gz"
+    write_bundle({"format": "other"}, filename)
+    with pytest.raises(ValueError):
+        read_bundle(filename)
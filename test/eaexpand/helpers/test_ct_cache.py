@@ -0,0 +1,76 @@
+import pytest
+
+from eapexpand import usdm_unpkt
+from eapexpand.helpers.ct_bundle import build_bundle, write_bundle
+from eapexpand.helpers.ct_cache import CACHE_VERSION, CTCache
+from eapexpand.usdm_unpkt import load_usdm_ct
+
+from test.eaexpand.helpers.test_ct_bundle import StubConnector
+
+
+@pytest.fixture
+def bundle(ct_workbook, tmp_path):
+    filename = tmp_path / "ct.ctbundle.json.gz"
+    write_bundle(build_bundle(ct_workbook, StubConnector()), filename)
+    return filename
+
+
+def test_warm_load_skips_parsing(ct_workbook, bundle, tmp_path, monkeypatch):
+    cache_dir = tmp_path / "cache"
+    entities, codelists = load_usdm_ct(
+        ct_workbook, ct_bundle=bundle, cache=True, cache_dir=cache_dir
+    )
+
+    def fail(filename):
+        raise AssertionError("The workbook should not be parsed")
+
+    monkeypatch.setattr(usdm_unpkt, "read_usdm_ct", fail)
+    cached_entities, cached_codelists = load_usdm_ct(
+        ct_workbook, ct_bundle=bundle, cache=True, cache_dir=cache_dir
+    )
+    assert cached_entities.keys() == entities.keys()
+    assert cached_codelists.keys() == codelists.keys()
+    intent = cached_entities["StudyVersion"].get_attribute("trialIntentTypes")
+    # the codelist bindings are preserved
+    assert intent.codelist is cached_codelists["C66736"]
+
+
+def test_invalidation(ct_workbook, tmp_path):
+    cache = CTCache(tmp_path / "cache")
+    versions = {"sdtmct": "/mdr/ct/packages/sdtmct-2024-03-29"}
+    cache.store(ct_workbook, versions, ({"Study": 1}, {}))
+    assert cache.load(ct_workbook, versions) == ({"Study": 1}, {})
+    # new package versions
+    newer = {"sdtmct": "/mdr/ct/packages/sdtmct-2024-06-28"}
+    assert cache.load(ct_workbook, newer) is None
+    cache.store(ct_workbook, newer, ({"Study": 2}, {}))
+    assert len(list(cache.cache_dir.iterdir())) == 1
+    assert cache.find(ct_workbook) == ({"Study": 2}, {})
+    # an entry of another cache version
+    current = cache.path(ct_workbook, newer)
+    stale = current.with_name(current.name.replace(f"-v{CACHE_VERSION}-", f"-v{CACHE_VERSION - 1}-"))
+    current.rename(stale)
+    assert cache.find(ct_workbook) is None
+    cache.store(ct_workbook, newer, ({"Study": 2}, {}))
+    assert not stale.exists()
+    # a changed workbook
+    with open(ct_workbook, "ab") as fh:
+        fh.write(b"\0")
+    assert cache.load(ct_workbook, newer) is None
+    assert cache.find(ct_workbook) is None
+
+
+def test_unresolved_not_cached(ct_workbook, tmp_path):
+    class MissingConnector(StubConnector):
+        def retrieve_valueset(self, codelist_code):
+            return None
+
+    filename = tmp_path / "missing.ctbundle.json.gz"
+    write_bundle(build_bundle(ct_workbook, MissingConnector()), filename)
+    cache_dir = tmp_path / "cache"
+    entities, codelists = load_usdm_ct(
+        ct_workbook, ct_bundle=filename, cache=True, cache_dir=cache_dir
+    )
+    assert "C66736" not in codelists
+    # the miss is retried on the next run
+    assert not cache_dir.exists() or not list(cache_dir.iterdir())
@@ -0,0 +1,52 @@
+import pytest
+
+from eapexpand.helpers.ct_cache import CTCache
+from eapexpand.helpers.ct_delta import Change, compare_ct, load_ct_parse, load_ct_parses
+
+
+@pytest.fixture
+def releases(tmp_path, make_ct_workbook, entity_rows, value_set_rows):
+    old = make_ct_workbook(tmp_path / "old.xlsx")
+    entity_rows = [row for row in entity_rows if row[3] != "versionIdentifier"]
+    entity_rows[1] = entity_rows[1][:7] + ("The study name.",) + entity_rows[1][8:]
+    entity_rows.append(
+        ("Study", "Attribute", None, "label", "C207419", "Study Label", None, "A label.", "N", None)
+    )
+    value_set_rows = [
+        value_set_rows[0][:6] + ("Interventional",) + value_set_rows[0][7:],
+        ("DDF", "Study", "studyType", "C99077", "No", "C48660", "Not Applicable", None, "Not applicable."),
+    ]
+    new = make_ct_workbook(tmp_path / "new.xlsx", entity_rows, value_set_rows)
+    return old, new
+
+
+def test_compare_releases(releases, tmp_path):
+    old, new = releases
+    delta = compare_ct(*load_ct_parses(old, new, cache_dir=tmp_path))
+    assert delta.changes == [
+        Change("attribute", "changed", "Study.name", "definition", "The name of the study.", "The study name."),
+        Change("attribute", "added", "Study.label"),
+        Change("attribute", "removed", "StudyVersion.versionIdentifier"),
+        Change("value", "changed", "C99077.C98388", "preferred_term", "Interventional Study", "Interventional"),
+        Change("value", "removed", "C99077.C16084"),
+        Change("value", "added", "C99077.C48660"),
+    ]
+    assert delta.summary()[("attribute", "added")] == 1
+    parse = load_ct_parse(old, cache_dir=tmp_path)
+    assert compare_ct(parse, load_ct_parse(old, cache_dir=tmp_path)).changes == []
+
+
+def test_mixed_sources(releases, tmp_path):
+    old, new = releases
+    cache = CTCache(tmp_path / "cache")
+    # a resolved (cached) parse of the old release, with an external codelist
+    entities, codelists = load_ct_parse(old, cached=False)
+    resolved = dict(codelists, C66736=codelists["C99077"])
+    path = cache.store(old, {}, (entities, resolved))
+    parsed_old, _ = load_ct_parses(old, new, cache_dir=cache.cache_dir)
+    # the old workbook is parsed again, rather than the cached parse being used
+    assert "C66736" not in parsed_old[1]
+    delta = compare_ct(*load_ct_parses(old, old, cache_dir=cache.cache_dir))
+    assert delta.changes == []
+    with pytest.raises(ValueError):
+        load_ct_parses(str(path), new, cache_dir=cache.cache_dir)
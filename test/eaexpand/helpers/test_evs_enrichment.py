@@ -0,0 +1,140 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from eapexpand.helpers.evs_connector import EVSCache, NCIEVSConnector
+from eapexpand.helpers.evs_enrichment import collect_concept_codes, enrich_from_evs
+from eapexpand.models.usdm_ct import CodeList, PermissibleValue
+
+
+class EVSHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        codes = query["list"][0].split(",")
+        self.server.batches.append(codes)
+        if "CFAIL" in codes:
+            self.send_response(400)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = [
+            {
+                "code": code,
+                "name": f"Concept {code}",
+                "definitions": [
+                    {"definition": f"Other {code}", "source": "CDISC"},
+                    {"definition": f"Definition of {code}", "source": "NCI"},
+                ],
+                "synonyms": [
+                    {"name": f"Concept {code}"},
+                    {"name": f"Synonym {code}"},
+                    {"name": f"Synonym {code}"},
+                ],
+            }
+            # C0 is not known to EVS
+            for code in codes
+            if code != "C0"
+        ]
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+@pytest.fixture
+def evs_server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), EVSHandler)
+    httpd.batches = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def connector(server, cache):
+    _connector = NCIEVSConnector(cache=cache)
+    _connector._base_url = f"http://127.0.0.1:{server.server_address[1]}/api/v1"
+    return _connector
+
+
+def test_batched_and_cached(evs_server, tmp_path):
+    codes = [f"C{idx}" for idx in range(250)]
+    concepts = connector(evs_server, EVSCache(tmp_path / "evs.sqlite")).get_concepts(
+        codes, batch_size=100
+    )
+    assert len(evs_server.batches) == 3
+    assert len(concepts) == 249
+    assert "C0" not in concepts
+    # a new connector is served from the persistent cache, misses included
+    again = connector(evs_server, EVSCache(tmp_path / "evs.sqlite")).get_concepts(codes)
+    assert again == concepts
+    assert len(evs_server.batches) == 3
+
+
+def test_failed_batch_skipped(evs_server, tmp_path):
+    codes = [f"C{idx}" for idx in range(1, 5)] + ["CFAIL"]
+    concepts = connector(evs_server, EVSCache(tmp_path / "evs.sqlite")).get_concepts(
+        codes, batch_size=2
+    )
+    # the concepts of the other batches are kept (and cached)
+    assert sorted(concepts) == ["C1", "C2", "C3", "C4"]
+    cached = EVSCache(tmp_path / "evs.sqlite").get_many("ncit", codes)
+    assert sorted(cached) == ["C1", "C2", "C3", "C4"]
+
+
+def test_misses_expire(evs_server, tmp_path):
+    connector(evs_server, EVSCache(tmp_path / "evs.sqlite")).get_concepts(["C0", "C1"])
+    assert EVSCache(tmp_path / "evs.sqlite").get_many("ncit", ["C0", "C1"]).keys() == {
+        "C0",
+        "C1",
+    }
+    # the miss has expired, the concept is retrieved again
+    cache = EVSCache(tmp_path / "evs.sqlite", miss_ttl=-1)
+    assert cache.get_many("ncit", ["C0", "C1"]).keys() == {"C1"}
+    connector(evs_server, cache).get_concepts(["C0", "C1"])
+    assert evs_server.batches[-1] == ["C0"]
+
+
+def test_enrichment(evs_server, tmp_path, document):
+    study = document.get_class_by_name("Study")
+    study.reference_url = "C15206"
+    study.definition = "A clinical study."
+    study.get_attribute("name").reference_url = "C68631"
+    codelist = CodeList(concept_c_code="C99077")
+    codelist.add_item(
+        PermissibleValue(
+            project="DDF",
+            entity_name="Study",
+            attribute_name="studyType",
+            codelist_c_code="C99077",
+            concept_c_code="C98388",
+            preferred_term="Interventional Study",
+        )
+    )
+    codelists = {"C99077": codelist}
+    assert collect_concept_codes(document, codelists) == [
+        "C15206",
+        "C68631",
+        "C99077",
+        "C98388",
+    ]
+    report = enrich_from_evs(
+        document, codelists, connector(evs_server, EVSCache(tmp_path / "evs.sqlite"))
+    )
+    assert len(evs_server.batches) == 1
+    assert report.resolved == 4
+    # existing definitions are kept
+    assert study.definition == "A clinical study."
+    assert study.synonyms == ["Synonym C15206"]
+    assert study.get_attribute("name").definition == "Definition of C68631"
+    assert codelist.definition == "Definition of C99077"
+    assert codelist.items[0].synonyms == ["Synonym C98388"]
@@ -0,0 +1,80 @@
+import time
+
+import pytest
+import requests
+
+from eapexpand.helpers.http_transport import HTTPTransport, TokenBucket
+
+
+def test_retries_with_backoff(server):
+    server.failures = 2
+    transport = HTTPTransport(retries=3, backoff_factor=0.01)
+    response = transport.get(server.url("/flaky"))
+    assert response.status_code == 200
+    assert transport.stats.requests == 3
+    assert transport.stats.retries == 2
+    assert transport.stats.failures == 0
+
+
+def test_gives_up_after_retries(server):
+    server.failures = 5
+    transport = HTTPTransport(retries=1, backoff_factor=0.01)
+    response = transport.get(server.url("/flaky"))
+    assert response.status_code == 503
+    assert transport.stats.requests == 2
+    assert transport.stats.failures == 1
+
+
+def test_timeout(server):
+    transport = HTTPTransport(timeout=0.1, retries=1, backoff_factor=0.01)
+    with pytest.raises(requests.Timeout):
+        transport.get(server.url("/slow"))
+    assert transport.stats.retries == 1
+    assert transport.stats.failures == 1
+
+
+def test_rate_limit(server):
+    transport = HTTPTransport(rate=20, burst=1)
+    started = time.monotonic()
+    for _ in range(5):
+        transport.get(server.url("/"))
+    # the first request uses the burst, the remaining four wait 50ms each
+    assert time.monotonic() - started >= 0.18
+    assert transport.stats.throttled > 0
+
+
+def test_token_bucket_burst():
+    bucket = TokenBucket(rate=1, capacity=3)
+    assert [bucket.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    # more than the bucket can ever hold
+    with pytest.raises(ValueError):
+        bucket.acquire(4)
+
+
+def test_retry_after_capped(server):
+    server.failures = 1
+    transport = HTTPTransport(retries=1, backoff_max=0.05)
+    started = time.monotonic()
+    assert transport.get(server.url("/throttled")).status_code == 200
+    assert time.monotonic() - started < 5
+    assert transport.stats.retries == 1
+
+
+def test_expected_statuses(server):
+    transport = HTTPTransport()
+    assert transport.get(server.url("/missing"), expected_statuses=(404,)).status_code == 404
+    assert (transport.stats.misses, transport.stats.failures) == (1, 0)
+    transport.get(server.url("/missing"))
+    assert (transport.stats.misses, transport.stats.failures) == (1, 1)
+
+
+def test_transport_options():
+    import argparse
+
+    from eapexpand.cli import add_transport_arguments, build_transport
+
+    parser = argparse.ArgumentParser()
+    add_transport_arguments(parser)
+    transport = build_transport(parser.parse_args(["--api-rate", "2", "--api-burst", "4"]))
+    assert (transport.limiter.rate, transport.limiter.capacity) == (2, 4)
+    assert build_transport(parser.parse_args([])).limiter is not None
@@ -0,0 +1,91 @@
+import json
+import sqlite3
+
+from eapexpand.helpers.instance_loader import InstanceLoader
+from eapexpand.render.relational import relational_model
+
+
+def study_instance(name: str) -> dict:
+    return {
+        "study": {
+            "instanceType": "Study",
+            "id": "Study_1",
+            "name": name,
+            "studyType": {"instanceType": "Code", "id": "Code_1", "code": "C98388"},
+            "labels": ["A", "B"],
+            "versions": [
+                {"instanceType": "StudyVersion", "id": "SV_1", "versionIdentifier": "1"},
+                {
+                    "instanceType": "StudyAmendment",
+                    "id": "SA_1",
+                    "versionIdentifier": "2",
+                    "number": 1,
+                    "trialIntentTypes": [{"instanceType": "Code", "code": "C15714"}],
+                },
+            ],
+            "notInModel": True,
+        },
+        "usdmVersion": "3.0.0",
+    }
+
+
+def test_load_files(document, tmp_path):
+    paths = []
+    for idx in range(3):
+        paths.append(tmp_path / f"study_{idx}.json")
+        paths[-1].write_text(json.dumps(study_instance(f"Study {idx}")))
+    connection = sqlite3.connect(":memory:")
+    loader = InstanceLoader(connection, relational_model(document), "Study", batch_size=10)
+    assert loader.load_files(paths) == 3
+    assert loader.unmapped == {("Study", "notInModel"): 3}
+    assert connection.execute("SELECT COUNT(*) FROM Study").fetchone()[0] == 3
+    name, labels, code, metadata = connection.execute(
+        "SELECT s.name, s.labels, c.code, d.metadata FROM Study s "
+        "JOIN Code c ON c.pk = s.studyType_pk "
+        "JOIN InstanceDocument d ON d.root_pk = s.pk AND d.root_table = 'Study' "
+        "WHERE s.name = 'Study 1'"
+    ).fetchone()
+    assert json.loads(labels) == ["A", "B"]
+    assert code == "C98388"
+    assert json.loads(metadata) == {"usdmVersion": "3.0.0"}
+    # the versions are in their own tables, in order
+    rows = connection.execute(
+        "SELECT v.position, sv.versionIdentifier, sa.number FROM Study_versions v "
+        "LEFT JOIN StudyVersion sv ON sv.pk = v.item_pk "
+        "LEFT JOIN StudyAmendment sa ON sa.pk = v.item_pk "
+        "JOIN Study s ON s.pk = v.owner_pk WHERE s.name = 'Study 0' ORDER BY v.position"
+    ).fetchall()
+    assert rows == [(0, "1", None), (1, None, 1)]
+    assert connection.execute(
+        "SELECT c.code FROM StudyAmendment_trialIntentTypes t JOIN Code c ON c.pk = t.item_pk"
+    ).fetchall() == [("C15714",)] * 3
+    # the keys continue from the loaded rows
+    again = InstanceLoader(connection, relational_model(document), "Study")
+    again.load_files(paths[:1])
+    pks = [x for (x,) in connection.execute("SELECT pk FROM Code")]
+    assert len(pks) == len(set(pks)) == 8
+
+
+def test_references_by_id(document):
+    instance = study_instance("Study 0")
+    study = instance["study"]
+    # the study type and the intents of the amendment refer (by id) to a code of the first version
+    del study["studyType"]
+    study["studyTypeId"] = "Code_2"
+    study["versions"][0]["trialIntentTypes"] = [
+        {"instanceType": "Code", "id": "Code_2", "code": "C98388"}
+    ]
+    study["versions"][1]["trialIntentTypes"] = ["Code_2", "Code_X"]
+    connection = sqlite3.connect(":memory:")
+    loader = InstanceLoader(connection, relational_model(document), "Study")
+    loader.load(instance)
+    loader.flush()
+    assert loader.unmapped == {("Study", "notInModel"): 1}
+    assert loader.unresolved == {("StudyAmendment", "trialIntentTypes"): 1}
+    assert connection.execute(
+        "SELECT c.code FROM Study s JOIN Code c ON c.pk = s.studyType_pk"
+    ).fetchall() == [("C98388",)]
+    assert connection.execute(
+        "SELECT t.position, c.code FROM StudyAmendment_trialIntentTypes t "
+        "LEFT JOIN Code c ON c.pk = t.item_pk ORDER BY t.position"
+    ).fetchall() == [(0, "C98388"), (1, None)]
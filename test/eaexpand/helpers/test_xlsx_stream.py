@@ -0,0 +1,56 @@
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell.rich_text import CellRichText, TextBlock
+from openpyxl.cell.text import InlineFont
+
+from eapexpand.helpers.xlsx_stream import XLSXReader, column_index
+from eapexpand.models.usdm_ct import DDFEntity
+
+
+def openpyxl_rows(filename, sheet_name, min_row=1):
+    wbk = load_workbook(filename, read_only=True)
+    return list(wbk[sheet_name].iter_rows(min_row=min_row, values_only=True))
+
+
+def test_column_index():
+    assert column_index("A") == 1
+    assert column_index("Z") == 26
+    assert column_index("AB") == 28
+
+
+def test_matches_openpyxl(ct_workbook):
+    with XLSXReader(ct_workbook) as reader:
+        assert reader.sheet_names == ["DDF Entities&Attributes", "DDF valid value sets"]
+        for sheet_name, min_row in (
+            ("DDF Entities&Attributes", 1),
+            ("DDF valid value sets", 6),
+        ):
+            assert list(reader.iter_rows(sheet_name, min_row)) == openpyxl_rows(
+                ct_workbook, sheet_name, min_row
+            )
+
+
+def test_sparse_and_typed_cells(tmp_path):
+    filename = tmp_path / "sparse.xlsx"
+    wbk = Workbook()
+    sheet = wbk.active
+    sheet.title = "Sheet"
+    sheet["A1"] = "text"
+    sheet["C1"] = 3
+    sheet["D1"] = 2.5
+    sheet["B3"] = True
+    sheet["A4"] = CellRichText(
+        "plain ", TextBlock(InlineFont(b=True), "bold")
+    )
+    wbk.save(filename)
+    with XLSXReader(filename) as reader:
+        rows = list(reader.iter_rows("Sheet"))
+    assert rows == openpyxl_rows(filename, "Sheet")
+    assert rows[0] == ("text", None, 3, 2.5)
+    assert rows[1] == (None, None, None, None)
+    assert rows[3][0] == "plain bold"
+
+
+def test_row_decoder(entity_headers, entity_rows):
+    decode = DDFEntity.row_decoder(entity_headers)
+    for row in entity_rows:
+        assert decode(row) == DDFEntity.from_dict(dict(zip(entity_headers, row)))
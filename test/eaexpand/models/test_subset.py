@@ -0,0 +1,71 @@
+import pytest
+
+from eapexpand.models.eap import Diagram
+from eapexpand.models.subset import Selection, subset_document
+from eapexpand.render.context import RenderContext
+from eapexpand.render.relational import relational_model
+
+
+def names(document):
+    return [x.name for x in document.objects if x.object_type == "Class"]
+
+
+def test_reachable(document):
+    subset = subset_document(document, Selection(root="StudyVersion"))
+    assert names(subset) == ["Code", "StudyVersion", "StudyAmendment"]
+    assert [x.name for x in subset.packages] == ["Core", "Study Design"]
+    # the root item is not in the subset
+    assert subset.root_item == "StudyVersion"
+    assert subset_document(document, Selection()) is document
+    with pytest.raises(ValueError):
+        subset_document(document, Selection(root="Unknown"))
+
+
+def test_package_stubs(document):
+    subset = subset_document(document, Selection(packages=["Study Design"]))
+    assert names(subset) == ["Code", "StudyVersion", "StudyAmendment"]
+    code = subset.get_class_by_name("Code")
+    assert code.object_attributes == [] and code.incoming_connections == []
+    # the original is untouched
+    assert len(document.get_class_by_name("Code").object_attributes) == 3
+    assert set(relational_model(subset).tables) == {
+        "InstanceDocument",
+        "Code",
+        "StudyVersion",
+        "StudyVersion_trialIntentTypes",
+        "StudyAmendment",
+        "StudyAmendment_trialIntentTypes",
+    }
+    # a package subtree includes the subpackages
+    assert len(names(subset_document(document, Selection(packages=["Core"])))) == 4
+
+
+def test_diagram(document):
+    diagram = Diagram(1, "Study", "Logical", "1.0")
+    diagram.add_object(1, document.get_class_by_name("Study"))
+    document.diagrams.append(diagram)
+    subset = subset_document(document, Selection(diagrams=["Study"]))
+    assert names(subset) == ["Code", "Study", "StudyVersion"]
+    assert subset.get_class_by_name("StudyVersion").object_attributes == []
+    assert subset.diagrams == [diagram]
+    assert subset.root_item == "Study"
+
+
+def test_stubbed_superclass(document):
+    diagram = Diagram(1, "Amendments", "Logical", "1.0")
+    diagram.add_object(1, document.get_class_by_name("StudyAmendment"))
+    document.diagrams.append(diagram)
+    subset = subset_document(document, Selection(diagrams=["Amendments"]))
+    assert names(subset) == ["StudyVersion", "StudyAmendment"]
+    amendment = subset.get_class_by_name("StudyAmendment")
+    version = subset.get_class_by_name("StudyVersion")
+    # the generalization leads to the stub, so nothing is inherited from the original
+    assert amendment.generalizations[0].target_object is version
+    assert [x.name for x in amendment.attributes] == ["number"]
+    context = RenderContext(subset)
+    assert context.superclasses[amendment.object_id] is version
+    assert context.inherited_attributes[amendment.object_id] == amendment.attributes
+    # the original is untouched
+    original = document.get_class_by_name("StudyAmendment")
+    assert original.generalizations[0].target_object is document.get_class_by_name("StudyVersion")
+    assert len(original.attributes) > 1
@@ -1,3 +1,4 @@
+from eapexpand.models.usdm_ct import DDFEntity
 from eapexpand.usdm_unpkt import load_usdm_ct
 
 
@@ -18,3 +19,46 @@ def test_load_document(ct_file):
     assert len(spdv.all_attributes) == 6
     protocol_status = spdv.get_attribute("protocolStatus")
     assert protocol_status.has_value_list is True
+
+
+def ddf_entity(entity_name, name, role="Attribute"):
+    return DDFEntity(
+        entity_name=entity_name,
+        logical_data_model_name=name,
+        role=role,
+        nci_c_code=None,
+        preferred_term=None,
+        raw_synonyms=None,
+    )
+
+
+def test_lookup_attribute():
+    entity = ddf_entity("Study", "Study", "Entity")
+    entity.attributes.append(ddf_entity("Study", "name"))
+    entity.relationships.append(ddf_entity("Study", "studyName"))
+    entity.complex_datatype_relationships.append(ddf_entity("Study", "type"))
+    entity.compile()
+    attr, fuzzy = entity.lookup_attribute("name")
+    assert (attr.logical_data_model_name, fuzzy) == ("name", False)
+    # the qualified name of an attribute beats a later relationship
+    attr, fuzzy = entity.lookup_attribute("studyName")
+    assert (attr.logical_data_model_name, fuzzy) == ("name", True)
+    attr, fuzzy = entity.lookup_attribute("studyType")
+    assert (attr.logical_data_model_name, fuzzy) == ("type", True)
+    assert entity.get_attribute("missing") is None
+    assert list(entity.all_attributes) == ["name", "studyName", "type"]
+
+
+def test_merge_report(ct_workbook, document):
+    from eapexpand.usdm_unpkt import merge_usdm_ct, read_usdm_ct
+
+    ct_content, _ = read_usdm_ct(ct_workbook)
+    report = merge_usdm_ct(document, ct_content)
+    assert report.merged_classes == ["Study", "StudyVersion"]
+    assert report.unmatched_classes == ["Code", "StudyAmendment"]
+    assert ("Study", "labels") in report.unmatched_attributes
+    assert report.fuzzy_matches == []
+    study = document.get_class_by_name("Study")
+    assert study.reference_url == "C15206"
+    assert study.synonyms == ["Clinical Study", "Trial"]
+    assert study.get_attribute("studyType").reference_url == "C142175"
@@ -0,0 +1,35 @@
+import pytest
+
+from eapexpand.render import aspects
+from eapexpand.render.aspects import RenderSnapshot, check_results, render_aspects
+
+
+def broken(snapshot, output_dir):
+    raise KeyError(snapshot.name)
+
+
+def test_parallel_matches_sequential(document, tmp_path):
+    snapshot = RenderSnapshot(document)
+    selected = ["linkml", "csv", "workbook"]
+    sequential = render_aspects(selected, snapshot, str(tmp_path / "sequential"))
+    parallel = render_aspects(selected, snapshot, str(tmp_path / "parallel"), parallel=True)
+    assert [x.aspect for x in parallel] == selected
+    assert not any(x.error for x in sequential + parallel)
+    for filename in ("USDM_test.yaml", "USDM_test_attributes.csv"):
+        assert (tmp_path / "parallel" / filename).read_text() == (
+            tmp_path / "sequential" / filename
+        ).read_text()
+    assert (tmp_path / "parallel" / "USDM_test.xlsx").is_file()
+
+
+def test_parallel_collects_errors(document, tmp_path, monkeypatch):
+    monkeypatch.setitem(aspects.ASPECTS, "broken", broken)
+    results = render_aspects(
+        ["broken", "csv"], RenderSnapshot(document), str(tmp_path), parallel=True
+    )
+    assert "KeyError: 'USDM_test'" in results[0].error
+    assert results[1].error is None
+    with pytest.raises(RuntimeError, match="broken"):
+        check_results(results)
+    with pytest.raises(ValueError):
+        render_aspects(["unknown"], RenderSnapshot(document), str(tmp_path))
@@ -0,0 +1,39 @@
+import pickle
+
+from eapexpand.render.context import RenderContext
+from eapexpand.usdm_unpkt import merge_usdm_ct, read_usdm_ct
+
+
+def test_derived_data(document, ct_workbook):
+    entities, _ = read_usdm_ct(ct_workbook)
+    merge_usdm_ct(document, entities)
+    context = RenderContext(document, ct_content=entities).prepare()
+    assert [x.name for x in context.partitions["Study Design"]] == [
+        "Study Design",
+        "StudyVersion",
+        "StudyAmendment",
+    ]
+    assert context.superclasses[13].name == "StudyVersion"
+    amendment = context.objects[13]
+    inherited = context.inherited_attributes[13]
+    assert [x.name for x in inherited][:1] == ["number"]
+    assert context.is_inherited(amendment, context.objects[12].object_attributes[0])
+    assert context.ct_entities[11].entity_name == "Study"
+    # the classes missing from the CT are not joined
+    assert 13 not in context.ct_entities
+    study = context.objects[11]
+    study_type = study.get_attribute("studyType")
+    assert context.ct_attributes[(11, id(study_type))].nci_c_code == "C142175"
+    assert context.ct_attributes[(11, id(study.get_attribute("labels")))] is None
+    versions = study.get_attribute("versions")
+    assert context.ct_attributes[(11, id(versions))].logical_data_model_name == "versions"
+    assert context.type_mapping["StudyVersion"] == "StudyVersion"
+    # the renderings share the derived data, but not the collected state
+    run = context.run()
+    run.missing_types.append("Map")
+    assert run.partitions is context.partitions
+    assert context.missing_types == []
+    # the derived data is keyed by identity, so it is not pickled
+    restored = pickle.loads(pickle.dumps(context))
+    assert "ranges" not in restored.__dict__
+    assert len(restored.ranges) == len(context.ranges)
@@ -0,0 +1,136 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+
+from eapexpand.render import linkml_emitter, linkml_modules
+from eapexpand.render.context import TYPE_MAPPING, RenderContext
+from eapexpand.render.fragment_cache import FragmentCache
+from eapexpand.render.render_linkml import generate_schema_builder
+
+
+def test_emitter_matches_schema_builder(extended_document, tmp_path):
+    document = extended_document
+    (tmp_path / "builder").mkdir()
+    (tmp_path / "direct").mkdir()
+    generate_schema_builder(
+        name=document.name,
+        document=document,
+        schema_id="https://cdisc.org/usdm/USDM_test",
+        output_dir=str(tmp_path / "builder"),
+    )
+    context = RenderContext(document)
+    linkml_emitter.generate(
+        name=document.name,
+        document=document,
+        schema_id="https://cdisc.org/usdm/USDM_test",
+        output_dir=str(tmp_path / "direct"),
+        context=context,
+    )
+    # the missing types are collected in the context
+    assert "Map" in context.missing_types
+    expected = (tmp_path / "builder" / "USDM_test.yaml").read_text()
+    assert (tmp_path / "direct" / "USDM_test.yaml").read_text() == expected
+    schema = yaml.safe_load(expected)
+    assert "SexofParticipantsAliasCode" in schema["classes"]
+    assert "Map" in schema["classes"]
+
+
+def test_modules_split_the_schema(extended_document, tmp_path):
+    document = extended_document
+    schema = linkml_emitter.build_schema(document.name, document)
+    arguments = dict(
+        name=document.name,
+        document=document,
+        output_dir=str(tmp_path),
+        partition={"Study Design": "Design"},
+        max_workers=2,
+    )
+    assert len(linkml_modules.generate(**arguments)) == 4
+    modules = {
+        x.stem: yaml.safe_load(x.read_text()) for x in (tmp_path / "USDM_test").iterdir()
+    }
+    root = modules.pop("USDM_test")
+    assert root["imports"] == ["linkml:types"] + list(modules)
+    assert list(root["classes"]) == ["Message"]
+    common = modules["USDM_test_common"]
+    assert common["enums"] == schema["enums"]
+    assert "SexofParticipantsAliasCode" in common["classes"]
+    design = modules["USDM_test_design"]
+    assert "Population" in design["classes"]
+    assert design["imports"] == ["linkml:types", "USDM_test_common", "USDM_test_core"]
+    # each class is defined once, as it is in the schema
+    classes = dict(root["classes"])
+    for module in modules.values():
+        classes.update(module.get("classes", {}))
+    assert classes == schema["classes"]
+    # only the changed modules are rewritten
+    assert linkml_modules.generate(**arguments) == []
+    population = [x for x in document.objects if x.name == "Population"][0]
+    population.note = "A population"
+    assert linkml_modules.generate(**arguments) == [
+        str(tmp_path / "USDM_test" / "USDM_test_design.yaml")
+    ]
+
+
+def test_cached_fragments(extended_document, tmp_path):
+    document = extended_document
+    expected = linkml_emitter.build_schema(document.name, document)
+    for run in range(2):
+        (tmp_path / str(run)).mkdir()
+        cache = FragmentCache(document.name, cache_dir=str(tmp_path / "cache"))
+        linkml_emitter.generate(
+            document.name, document, output_dir=str(tmp_path / str(run)), cache=cache
+        )
+        assert (cache.hits, cache.misses) == ((0, 6) if run == 0 else (6, 0))
+        schema = yaml.safe_load((tmp_path / str(run) / "USDM_test.yaml").read_text())
+        assert schema == yaml.safe_load(yaml.dump(expected))
+    # a change to the CT content of a class renders that class only
+    study = [x for x in document.objects if x.name == "Study"][0]
+    study.object_attributes[1].preferred_term = "Study Name"
+    cache = FragmentCache(document.name, cache_dir=str(tmp_path / "cache"))
+    linkml_emitter.generate(document.name, document, output_dir=str(tmp_path), cache=cache)
+    assert (cache.hits, cache.misses) == (5, 1)
+    schema = yaml.safe_load((tmp_path / "USDM_test.yaml").read_text())
+    assert schema["classes"]["Study"]["attributes"]["studyName"]["title"] == "Study Name"
+
+
+def test_schema_builder_is_reentrant(extended_document, tmp_path):
+    document = extended_document
+    base_types = dict(TYPE_MAPPING)
+
+    def render(run):
+        (tmp_path / str(run)).mkdir()
+        context = RenderContext(document)
+        generate_schema_builder(
+            name=document.name,
+            document=document,
+            output_dir=str(tmp_path / str(run)),
+            context=context,
+        )
+        return context
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        contexts = list(executor.map(render, range(4)))
+    # the classes are added to the context, not the module mapping
+    assert dict(TYPE_MAPPING) == base_types
+    assert contexts[0].type_mapping["Population"] == "Population"
+    outputs = {(tmp_path / str(run) / "USDM_test.yaml").read_text() for run in range(4)}
+    assert len(outputs) == 1
+
+
+def test_fragment_cache_per_output(tmp_path):
+    caches = {
+        output: FragmentCache("USDM_test", cache_dir=str(tmp_path), output=output)
+        for output in ("linkml", "pydantic")
+    }
+    caches["linkml"].put("a", {"class": "A"})
+    caches["pydantic"].put("b", "class B: ...")
+    for cache in caches.values():
+        cache.save()
+    # saving one output doesn't drop the entries of the other
+    assert FragmentCache("USDM_test", str(tmp_path), "linkml").get("a") == {"class": "A"}
+    assert FragmentCache("USDM_test", str(tmp_path), "pydantic").get("b") == "class B: ..."
+    assert sorted(x.name for x in tmp_path.iterdir()) == [
+        "USDM_test.linkml.pickle",
+        "USDM_test.pydantic.pickle",
+    ]
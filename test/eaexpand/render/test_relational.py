@@ -0,0 +1,44 @@
+import sqlite3
+
+from eapexpand.render.relational import relational_model
+from eapexpand.render.render_prisma import prisma_schema
+from eapexpand.render.render_sqlite import sqlite_ddl
+
+
+def test_relational_model(extended_document):
+    document = extended_document
+    model = relational_model(document)
+    study = model.tables["Study"]
+    assert study.column_names == [
+        "pk",
+        "document_pk",
+        "id",
+        "name",
+        "studyType_pk",
+        "labels",
+        "populations_pk",
+    ]
+    assert study.junctions == {"versions": "Study_versions"}
+    # the versions can be study versions or amendments
+    assert model.tables["Study_versions"].target is None
+    assert model.tables["StudyVersion_trialIntentTypes"].target == "Code"
+    # the amendment has the inherited attributes
+    assert {"versionIdentifier", "status_pk"} <= set(model.tables["StudyAmendment"].column_names)
+    assert model.table_for("StudyVersion", "StudyAmendment").name == "StudyAmendment"
+
+
+def test_schemas(extended_document):
+    document = extended_document
+    model = relational_model(document)
+    connection = sqlite3.connect(":memory:")
+    connection.executescript(sqlite_ddl(model))
+    tables = {
+        x for (x,) in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    }
+    assert tables == set(model.tables)
+    schema = prisma_schema(model)
+    assert (
+        'studyType Code? @relation("Study_studyType_pk", fields: [studyType_pk], references: [pk])'
+        in schema
+    )
+    assert 'Study_studyType Study[] @relation("Study_studyType_pk")' in schema
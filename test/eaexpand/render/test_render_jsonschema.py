@@ -0,0 +1,42 @@
+import jsonschema
+
+from eapexpand.render.render_jsonschema import build_jsonschema
+
+
+def test_build_jsonschema(extended_document):
+    document = extended_document
+    schema = build_jsonschema("USDM_test", document)
+    jsonschema.Draft201909Validator.check_schema(schema)
+    definitions = schema["$defs"]
+    assert schema["$ref"] == "#/$defs/Study"
+    assert definitions["SexofParticipants"]["enum"] == ["Female", "Male", "C49636"]
+    population = definitions["Population"]
+    assert population["required"] == ["name", "sex", "uuid"]
+    assert population["properties"]["plannedSex"]["items"] == {
+        "$ref": "#/$defs/SexofParticipantsAliasCode"
+    }
+    assert population["properties"]["extensions"]["items"] == {"$ref": "#/$defs/Map"}
+    # the attributes of the superclass are inherited, and a (abstract) superclass is a subclass
+    assert list(definitions["StudyAmendment"]["properties"])[:2] == ["number", "id"]
+    assert definitions["Study"]["properties"]["versions"]["items"] == {
+        "$ref": "#/$defs/StudyAmendment"
+    }
+    validator = jsonschema.Draft201909Validator(schema)
+    study = {
+        "id": "S1",
+        "name": "A study",
+        "labels": ["one"],
+        "versions": [
+            {
+                "id": "V1",
+                "versionIdentifier": "1",
+                "status": {"id": "C1", "code": "x", "decode": "y"},
+                "trialIntentTypes": [],
+                "number": 1,
+            }
+        ],
+        "populations": {"name": "All", "sex": "Female", "uuid": "u1"},
+    }
+    assert list(validator.iter_errors(study)) == []
+    study["populations"]["sex"] = "Unknown"
+    assert not validator.is_valid(study)
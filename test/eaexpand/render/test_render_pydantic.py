@@ -0,0 +1,29 @@
+import re
+from pathlib import Path
+
+from linkml.generators.pydanticgen import PydanticGenerator
+
+from eapexpand.render.linkml_emitter import generate
+from eapexpand.render.render_pydantic import build_pydantic
+
+TEMPLATES = Path(__file__).parents[3] / "docs" / "pydantic_templates"
+
+
+def _lines(source):
+    # there is no schema file
+    source = re.sub(r",\n\s*'source_file': '[^']*'", "", source)
+    return [x.rstrip() for x in source.splitlines()]
+
+
+def test_matches_gen_pydantic(document, tmp_path):
+    generate("USDM_test", document, output_dir=str(tmp_path))
+    expected = PydanticGenerator(
+        str(tmp_path / "USDM_test.yaml"), template_dir=str(TEMPLATES), metadata_mode="auto"
+    ).serialize()
+    source = build_pydantic("USDM_test", document, template_dir=str(TEMPLATES))
+    assert _lines(source) == _lines(expected)
+    # the default templates give a working module
+    namespace = {}
+    exec(compile(build_pydantic("USDM_test", document, max_workers=1), "model", "exec"), namespace)
+    study = namespace["Study"](id="S1", studyName="A study", versions=[])
+    assert study.studyName == "A study"
@@ -0,0 +1,29 @@
+import pytest
+
+from eapexpand.render.render_shapes import generate
+
+rdflib = pytest.importorskip("rdflib")
+from rdflib.collection import Collection
+from rdflib.compare import isomorphic
+
+
+def test_streamed_shapes(extended_document, tmp_path):
+    document = extended_document
+    turtle = rdflib.Graph().parse(generate("USDM_test", document, output_dir=str(tmp_path)))
+    ntriples = rdflib.Graph().parse(
+        generate("USDM_test", document, output_dir=str(tmp_path), format="nt")
+    )
+    assert isomorphic(turtle, ntriples)
+    SH = rdflib.Namespace("http://www.w3.org/ns/shacl#")
+    model = rdflib.Namespace("https://cdisc.org/usdm/")
+    assert (model.PopulationShape, SH.targetClass, model.Population) in turtle
+    sex = model["PopulationShape-sex"]
+    assert (sex, SH.minCount, rdflib.Literal(1)) in turtle
+    assert (sex, SH.node, model.SexofParticipantsShape) in turtle
+    codes = turtle.value(model["SexofParticipantsShape-code"], SH["in"])
+    assert [str(x) for x in Collection(turtle, codes)] == [
+        "C16576",
+        "C20197",
+        "C49636",
+    ]
+    assert (model.StudyAmendmentShape, SH.node, model.StudyVersionShape) in turtle
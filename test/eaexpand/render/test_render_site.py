@@ -0,0 +1,31 @@
+import json
+
+from eapexpand.render.render_site import MANIFEST, generate
+
+
+def test_incremental_site(extended_document, tmp_path):
+    document = extended_document
+    written = generate("USDM_test", document, output_dir=str(tmp_path))
+    site = tmp_path / "USDM_test_site"
+    assert "classes/Population.md" in written
+    assert "codelists/SexofParticipants.md" in written
+    assert set(json.loads((site / MANIFEST).read_text())["pages"]) == set(written)
+    population = (site / "classes" / "Population.md").read_text()
+    assert "[SexofParticipants](../codelists/SexofParticipants.md)" in population
+    assert "- [Study.populations](Study.md)" in population
+    amendment = (site / "classes" / "StudyAmendment.md").read_text()
+    assert "- Specialises: [StudyVersion](StudyVersion.md)" in amendment
+    assert "## Inherited attributes" in amendment
+    codelist = (site / "codelists" / "SexofParticipants.md").read_text()
+    assert "ncit/C16576) | Female | F |" in codelist
+    # nothing changed
+    assert generate("USDM_test", document, output_dir=str(tmp_path)) == []
+    # only the changed class is rewritten, and the removed class is dropped
+    document.get_class_by_name("Study").note = "A changed study"
+    document._objects.remove(document.get_class_by_name("Empty"))
+    assert generate("USDM_test", document, output_dir=str(tmp_path)) == [
+        "index.md",
+        "classes/Study.md",
+    ]
+    assert "A changed study" in (site / "classes" / "Study.md").read_text()
+    assert not (site / "classes" / "Empty.md").exists()
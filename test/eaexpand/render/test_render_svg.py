@@ -0,0 +1,45 @@
+import xml.etree.ElementTree as ET
+
+import eapexpand.render.render_svg as render_svg
+from eapexpand.models.eap import Bounds, Diagram, DiagramLink
+
+SVG = "{http://www.w3.org/2000/svg}"
+
+
+def study_diagram(document, idee=1):
+    diagram = Diagram(idee, "Study Design", "Logical", "1.0")
+    study = document.get_class_by_name("Study")
+    version = document.get_class_by_name("StudyVersion")
+    amendment = document.get_class_by_name("StudyAmendment")
+    diagram.add_object(1, study, Bounds.from_rect(20, -20, 180, -120))
+    diagram.add_object(2, version, Bounds.from_rect(300, -20, 460, -120))
+    diagram.add_object(3, amendment, Bounds.from_rect(300, -200, 460, -260))
+    diagram.add_link(DiagramLink(study.outgoing_connections[0]))
+    diagram.add_link(
+        DiagramLink(amendment.generalizations[0], path=DiagramLink.parse_path("380:-160;"))
+    )
+    return diagram
+
+
+def test_export_diagrams(document, tmp_path, monkeypatch):
+    assert DiagramLink.parse_path("120:-80;240:-80;") == [(120, 80), (240, 80)]
+    diagrams = [study_diagram(document, x) for x in range(1, 5)]
+    diagrams.append(Diagram(9, "Empty", "Logical", "1.0"))
+    # rendered in worker processes
+    monkeypatch.setattr(render_svg, "PARALLEL_DIAGRAMS", 2)
+    written = render_svg.export_diagrams(diagrams, str(tmp_path), max_workers=2)
+    assert [x.rsplit("/", 1)[-1] for x in written] == [
+        "Study_Design_1.svg",
+        "Study_Design_2.svg",
+        "Study_Design_3.svg",
+        "Study_Design_4.svg",
+    ]
+    root = ET.parse(written[0]).getroot()
+    assert root.get("width") == "480" and root.get("height") == "280"
+    texts = [x.text for x in root.iter(f"{SVG}text")]
+    assert "Study" in texts and "studyType: Code" in texts and "versions" in texts
+    lines = list(root.iter(f"{SVG}polyline"))
+    assert lines[0].get("points") == "180,70 300,70"
+    assert lines[0].get("marker-end") == "url(#arrow)"
+    assert lines[1].get("points") == "380,200 380,160 380,120"
+    assert lines[1].get("marker-end") == "url(#generalization)"
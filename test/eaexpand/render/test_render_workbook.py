@@ -0,0 +1,112 @@
+import csv
+import zipfile
+from datetime import datetime
+from decimal import Decimal
+
+from openpyxl import load_workbook
+
+from eapexpand.render.render_tabular import generate as generate_tabular
+from eapexpand.render.render_usdm_workbook import generate as generate_usdm_workbook
+from eapexpand.render.render_workbook import generate as generate_workbook
+from eapexpand.render.workbook_writer import column_widths
+from eapexpand.render.xlsx_parallel import ParallelWorkbookWriter
+from eapexpand.usdm_unpkt import merge_usdm_ct, read_usdm_ct
+
+
+def test_column_widths():
+    widths = column_widths([("a", None, "x" * 20), ("b" * 80, 12345)])
+    assert widths == {1: 50, 2: 10, 3: 20}
+
+
+def test_generate_workbook(document, tmp_path):
+    generate_workbook(document.name, document, output_dir=str(tmp_path))
+    wbk = load_workbook(tmp_path / "USDM_test.xlsx")
+    assert wbk.sheetnames == ["Packages", "Core", "Study Design"]
+    packages = [tuple(x) for x in wbk["Packages"].iter_rows(values_only=True)]
+    assert packages[2] == ("Study Design", "Core", None)
+    rows = [tuple(x) for x in wbk["Core"].iter_rows(values_only=True)]
+    assert rows[0] == ("Package", "Class", "Attribute", "Type", "Cardinality", "Class Note")
+    assert ("Core", "Study", None, None, None, "A study") in rows
+    assert ("Core", "Study", "versions", "StudyVersion", "0..*", None) in rows
+    header = wbk["Core"]["A1"]
+    assert header.font.bold and header.alignment.wrap_text
+    assert wbk["Core"]["B2"].alignment.vertical == "top"
+
+
+def test_generate_usdm_workbook(document, ct_workbook, tmp_path):
+    entities, codelists = read_usdm_ct(ct_workbook)
+    merge_usdm_ct(document, entities)
+    generate_usdm_workbook(
+        document.name, document, entities, codelists, output_dir=str(tmp_path)
+    )
+    wbk = load_workbook(tmp_path / "USDM_test.xlsx")
+    assert "C99077" in wbk.sheetnames
+    rows = {x[1]: x for x in wbk["Core"].iter_rows(min_row=2, values_only=True)}
+    assert rows["studyType"][5:] == (
+        "C142175",
+        "Study Type",
+        "The type of study.",
+        None,
+        "C99077",
+    )
+    assert rows["versions"][2:4] == ("StudyVersion", "0..*")
+    codes = [x[0] for x in wbk["C99077"].iter_rows(min_row=2, values_only=True)]
+    assert codes == ["C98388", "C16084"]
+    assert wbk["C99077"].column_dimensions["A"].width == 10
+
+
+def test_parallel_workbook_matches(document, ct_workbook, tmp_path):
+    entities, codelists = read_usdm_ct(ct_workbook)
+    merge_usdm_ct(document, entities)
+    for workers, output in ((None, "streamed"), (2, "parallel")):
+        generate_usdm_workbook(
+            document.name,
+            document,
+            entities,
+            codelists,
+            output_dir=str(tmp_path / output),
+            workers=workers,
+        )
+    streamed = load_workbook(tmp_path / "streamed" / "USDM_test.xlsx")
+    parallel = load_workbook(tmp_path / "parallel" / "USDM_test.xlsx")
+    assert parallel.sheetnames == streamed.sheetnames
+    for title in streamed.sheetnames:
+        expected, actual = streamed[title], parallel[title]
+        assert list(actual.values) == list(expected.values)
+        assert actual["A1"].font.bold and actual["A2"].alignment.wrap_text
+        for letter, dimension in expected.column_dimensions.items():
+            assert actual.column_dimensions[letter].width == dimension.width
+
+
+def test_generate_tabular(document, ct_workbook, tmp_path):
+    entities, codelists = read_usdm_ct(ct_workbook)
+    merge_usdm_ct(document, entities)
+    generate_tabular(
+        document.name, document, entities, codelists, str(tmp_path), delimiter="\t"
+    )
+    with open(tmp_path / "USDM_test_attributes.tsv", newline="") as fh:
+        rows = list(csv.reader(fh, delimiter="\t"))
+    assert rows[0][:3] == ["Package", "Class", "Attribute"]
+    assert {len(x) for x in rows} == {len(rows[0])}
+    assert ["Core", "Study"] in [x[:2] for x in rows if not x[2]]
+    study_type = [x for x in rows if x[2] == "studyType"][0]
+    assert study_type[:5] == ["Core", "Study", "studyType", "Code", "0..1"]
+    assert study_type[-1] == "C99077"
+    with open(tmp_path / "USDM_test_codelists.tsv", newline="") as fh:
+        items = list(csv.reader(fh, delimiter="\t"))
+    assert ["C99077", "C98388"] in [x[:2] for x in items]
+
+
+def test_parallel_writer_values(tmp_path):
+    writer = ParallelWorkbookWriter(max_workers=2)
+    writer.write_sheet("One", ["Name", "Value"], [["pi", Decimal("3.14")], ["pi", True]])
+    writer.write_sheet("Two", ["Name", "Value"], [["pi", datetime(2024, 3, 29)]])
+    filename = tmp_path / "values.xlsx"
+    writer.save(str(filename))
+    wbk = load_workbook(filename)
+    assert list(wbk["One"].values)[1:] == [("pi", "3.14"), ("pi", True)]
+    assert list(wbk["Two"].values)[1] == ("pi", "2024-03-29 00:00:00")
+    with zipfile.ZipFile(filename) as archive:
+        sst = archive.read("xl/sharedStrings.xml").decode("utf-8")
+    # the strings are shared between the sheets
+    assert 'count="9" uniqueCount="5"' in sst